@@ -0,0 +1,149 @@
+"""
+In-process publish/subscribe broker for community alerts
+create_alert() publishes each new alert once; Server-Sent Events connections
+subscribe to their user's district and receive it immediately. Streams served
+by the async app await an AsyncSubscription instead of blocking a thread.
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+from metrics import metrics_registry
+
+# Events buffered per connection before it is considered stalled and dropped
+ALERT_STREAM_QUEUE_SIZE = int(os.getenv('ALERT_STREAM_QUEUE_SIZE', 100))
+
+
+class Subscription:
+    """A single stream connection's queue of pending alert events"""
+
+    def __init__(self, district, email=None, max_size=ALERT_STREAM_QUEUE_SIZE):
+        self.district = district
+        self.email = email
+        self.queue = queue.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def offer(self, alert):
+        """Queue an alert without blocking; flags the subscription as overflowed if it is full"""
+        try:
+            self.queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+    def get(self, timeout):
+        """Wait for the next alert event; returns None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Subscription read from an event loop; publishers wake it with call_soon_threadsafe"""
+
+    def __init__(self, district, email=None, max_size=ALERT_STREAM_QUEUE_SIZE):
+        super().__init__(district, email, max_size)
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def offer(self, alert):
+        delivered = super().offer(alert)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed; the subscription is being torn down
+        return delivered
+
+    async def get_async(self, timeout):
+        """Await the next alert event (or an overflow); returns None on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._ready.clear()
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if self.overflowed or remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+
+class AlertBroker:
+    """
+    Fan out alerts to subscribers keyed by district key
+    Subscribers with no district (None) receive every alert, matching the
+    recent-alerts fallback of the location feed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # district_key -> set of Subscription
+
+    def subscribe(self, district, email=None):
+        """Register a new subscription for a district"""
+        return self._add(Subscription(district, email))
+
+    def subscribe_async(self, district, email=None):
+        """Register a subscription awaited from the running event loop"""
+        return self._add(AsyncSubscription(district, email))
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.district, set()).add(subscription)
+        metrics_registry.gauge('alerts.stream.connections').inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription (safe to call more than once)"""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.district)
+            if not subscribers or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.district]
+        metrics_registry.gauge('alerts.stream.connections').dec()
+
+    def publish(self, district, alert, recipient_filter=None):
+        """
+        Deliver an alert to subscribers of its district and to district-less subscribers
+        recipient_filter(emails) returns the subscriber emails that should receive it,
+        looked up once per publish for all targets.
+        Never blocks: a subscriber whose queue is full is flagged and disconnected,
+        and catches up from the database when it reconnects.
+        Returns: number of subscribers the alert was delivered to
+        """
+        with self._lock:
+            targets = list(self._subscribers.get(district, ()))
+            if district is not None:
+                targets += list(self._subscribers.get(None, ()))
+
+        if recipient_filter is not None and targets:
+            emails = [subscription.email for subscription in targets if subscription.email]
+            allowed = recipient_filter(emails) if emails else set()
+            kept = [subscription for subscription in targets
+                    if not subscription.email or subscription.email in allowed]
+            if len(kept) < len(targets):
+                metrics_registry.counter('alerts.stream.muted').inc(len(targets) - len(kept))
+            targets = kept
+
+        delivered = sum(1 for subscription in targets if subscription.offer(alert))
+        metrics_registry.counter('alerts.stream.published').inc()
+        metrics_registry.counter('alerts.stream.delivered').inc(delivered)
+        return delivered
+
+    def connection_count(self):
+        """Number of open subscriptions"""
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+# Global broker instance
+alert_broker = AlertBroker()
@@ -0,0 +1,258 @@
+"""
+District alert digests for AgriDetect AI
+Once per DIGEST_PERIOD one worker claims the period, groups the alerts posted since
+the previous digest by district_key and queues one digest email per subscribed user
+(notifications_enabled) in each district on the email outbox. Subscribers are read
+in keyset pages of one covering-index range scan per district, and each page is
+queued in the same transaction that records its progress, so a run that dies part
+way is resumed by another worker without anyone getting the digest twice.
+"""
+import os
+import time
+import uuid
+import threading
+from dotenv import load_dotenv
+from database import get_db_connection
+from email_templates import get_template
+from mail_outbox import enqueue_emails, MAIL_PRIORITY_BULK
+from metrics import metrics_registry
+from logging_config import get_logger
+
+load_dotenv()
+
+ALERT_DIGEST_ENABLED = os.getenv('ALERT_DIGEST_ENABLED', 'true').lower() == 'true'
+DIGEST_PERIOD = int(os.getenv('DIGEST_PERIOD', 3600))  # seconds covered by one digest
+DIGEST_CHECK_INTERVAL = float(os.getenv('DIGEST_CHECK_INTERVAL', 60))  # seconds between checks for a due period
+DIGEST_BATCH_SIZE = int(os.getenv('DIGEST_BATCH_SIZE', 1000))  # subscribers rendered and queued per transaction
+DIGEST_MAX_ALERTS = int(os.getenv('DIGEST_MAX_ALERTS', 10))  # newest alerts listed; older ones are only counted
+DIGEST_CLAIM_TIMEOUT = float(os.getenv('DIGEST_CLAIM_TIMEOUT', 600))  # seconds before a stalled run can be taken over
+
+logger = get_logger('alert_digest')
+
+
+class DigestClaimLost(Exception):
+    """Another worker took over the period (this run stalled past its claim)"""
+
+
+def _format_alert(alert):
+    return {
+        'disease': (alert['disease_reported'] or '').replace('_', ' '),
+        'location': alert['location'] or '',
+        'farmer_name': alert['farmer_name'] or 'a farmer',
+        'created_at': alert['created_at'] or '',
+        'description': alert['description'] or '',
+    }
+
+
+class DigestEngine:
+    """Builds and queues the district digests for one period at a time"""
+
+    def __init__(self, period=DIGEST_PERIOD, batch_size=DIGEST_BATCH_SIZE, max_alerts=DIGEST_MAX_ALERTS):
+        self.period = period
+        self.batch_size = batch_size
+        self.max_alerts = max_alerts
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.app_name = "AgriDetect AI"
+        feed_url = f"{os.getenv('FRONTEND_URL', 'http://localhost:8081')}/community"
+        self.template = get_template('alert_digest').bind(app_name=self.app_name, feed_url=feed_url)
+        self.row_template = get_template('alert_digest_row')
+
+    def _claim(self, period_end):
+        """
+        Claim a period (or take over a stalled run of it)
+        The alert range ends at the last alert created before period_end, so a run that starts late
+        leaves the alerts of the current period to the next digest.
+        Returns: (first_alert_id, last_alert_id) exclusive/inclusive, or None if done or running elsewhere
+        """
+        now = time.time()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            run = cursor.execute('''
+                SELECT first_alert_id, last_alert_id, status FROM alert_digest_runs WHERE period_end = ?
+            ''', (period_end,)).fetchone()
+            if run is None:
+                previous = cursor.execute('''
+                    SELECT last_alert_id FROM alert_digest_runs WHERE period_end < ?
+                    ORDER BY period_end DESC LIMIT 1
+                ''', (period_end,)).fetchone()
+                if previous is not None:
+                    first_id = previous['last_alert_id']
+                else:
+                    # First digest ever: cover one period back rather than the whole alert history
+                    first_id = cursor.execute('''
+                        SELECT COALESCE(MAX(id), 0) FROM alerts WHERE created_at < datetime(?, 'unixepoch')
+                    ''', (period_end - self.period,)).fetchone()[0]
+                last_id = cursor.execute('''
+                    SELECT COALESCE(MAX(id), 0) FROM alerts WHERE created_at < datetime(?, 'unixepoch')
+                ''', (period_end,)).fetchone()[0]
+                last_id = max(last_id, first_id)
+                cursor.execute('''
+                    INSERT INTO alert_digest_runs (period_end, first_alert_id, last_alert_id, claimed_by, claimed_until, started_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(period_end) DO NOTHING
+                ''', (period_end, first_id, last_id, self.worker_id, now + DIGEST_CLAIM_TIMEOUT, now))
+                return (first_id, last_id) if cursor.rowcount else None
+            if run['status'] == 'done':
+                return None
+            cursor.execute('''
+                UPDATE alert_digest_runs SET claimed_by = ?, claimed_until = ?
+                WHERE period_end = ? AND status = 'running' AND (claimed_by = ? OR claimed_until < ?)
+            ''', (self.worker_id, now + DIGEST_CLAIM_TIMEOUT, period_end, self.worker_id, now))
+            return (run['first_alert_id'], run['last_alert_id']) if cursor.rowcount else None
+
+    def _alerts_by_district(self, first_id, last_id):
+        """Alerts in (first_id, last_id] grouped by district_key, oldest first"""
+        with get_db_connection() as conn:
+            rows = conn.execute('''
+                SELECT id, farmer_name, location, disease_reported, description, user_email, created_at, district_key
+                FROM alerts WHERE id > ? AND id <= ? AND district_key IS NOT NULL
+                ORDER BY id
+            ''', (first_id, last_id)).fetchall()
+        districts = {}
+        for row in rows:
+            districts.setdefault(row['district_key'], []).append(dict(row))
+        return districts
+
+    def _render_alerts(self, alerts):
+        """Alert list fragment (newest first, capped at max_alerts)"""
+        shown = alerts[::-1][:self.max_alerts]
+        html = ''.join(self.row_template.render(**_format_alert(alert)) for alert in shown)
+        if len(alerts) > len(shown):
+            html += f'<p style="color: #666; font-size: 13px;">and {len(alerts) - len(shown)} more</p>'
+        return html
+
+    def _send_district(self, period_end, district, alerts):
+        """
+        Queue this period's digest for every subscriber in a district, resuming after recorded progress
+        Returns: number of digests queued by this call
+        """
+        with get_db_connection() as conn:
+            progress = conn.execute('''
+                SELECT last_email, done FROM alert_digest_progress WHERE period_end = ? AND district_key = ?
+            ''', (period_end, district)).fetchone()
+        if progress is not None and progress['done']:
+            return 0
+        last_email = progress['last_email'] if progress is not None else ''
+
+        subject = f"{len(alerts)} new crop disease alert(s) near {district.title()}"
+        digest = self.template.bind(district=district.title(), alert_count=len(alerts),
+                                    alerts=self._render_alerts(alerts))
+        authors = {alert['user_email'] for alert in alerts if alert['user_email']}
+        queued = 0
+        while True:
+            start = time.perf_counter()
+            with get_db_connection() as conn:
+                users = conn.execute('''
+                    SELECT email, full_name FROM users INDEXED BY idx_users_district_notify
+                    WHERE district_key = ? AND email > ?
+                      AND (notifications_enabled IS NULL OR notifications_enabled != 0)
+                    ORDER BY email LIMIT ?
+                ''', (district, last_email, self.batch_size)).fetchall()
+
+                # Everyone gets the same alert list except people who posted some of them
+                shared = [user for user in users if user['email'] not in authors]
+                bodies = digest.render_many({'user_name': user['full_name']} for user in shared)
+                messages = [(user['email'], subject, body) for user, body in zip(shared, bodies)]
+                for user in users:
+                    if user['email'] in authors:
+                        others = [alert for alert in alerts if alert['user_email'] != user['email']]
+                        if others:
+                            messages.append((user['email'], subject, self.template.render(
+                                district=district.title(), alert_count=len(others),
+                                alerts=self._render_alerts(others), user_name=user['full_name'])))
+                enqueue_emails(messages, priority=MAIL_PRIORITY_BULK)
+
+                done = len(users) < self.batch_size
+                if users:
+                    last_email = users[-1]['email']
+                conn.execute('''
+                    INSERT INTO alert_digest_progress (period_end, district_key, last_email, emails, done)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(period_end, district_key) DO UPDATE SET
+                        last_email = excluded.last_email, emails = emails + excluded.emails, done = excluded.done
+                ''', (period_end, district, last_email, len(messages), int(done)))
+                cursor = conn.execute('''
+                    UPDATE alert_digest_runs SET claimed_until = ? WHERE period_end = ? AND claimed_by = ?
+                ''', (time.time() + DIGEST_CLAIM_TIMEOUT, period_end, self.worker_id))
+                if cursor.rowcount == 0:
+                    raise DigestClaimLost(f"Digest for period {period_end} was taken over")
+
+            queued += len(messages)
+            metrics_registry.histogram('digest.batch').observe((time.perf_counter() - start) * 1000)
+            metrics_registry.counter('digest.emails').inc(len(messages))
+            if done:
+                return queued
+
+    def run(self, now=None):
+        """
+        Send the digest for the most recently completed period if no worker has yet
+        Returns: summary dict, or None if the period is already done or being sent elsewhere
+        """
+        period_end = int((now if now is not None else time.time()) // self.period * self.period)
+        claim = self._claim(period_end)
+        if claim is None:
+            return None
+
+        start = time.perf_counter()
+        districts = self._alerts_by_district(*claim)
+        queued = 0
+        for district, alerts in districts.items():
+            district_start = time.perf_counter()
+            queued += self._send_district(period_end, district, alerts)
+            metrics_registry.histogram('digest.district').observe((time.perf_counter() - district_start) * 1000)
+
+        with get_db_connection() as conn:
+            emails = conn.execute('''
+                SELECT COALESCE(SUM(emails), 0) FROM alert_digest_progress WHERE period_end = ?
+            ''', (period_end,)).fetchone()[0]
+            conn.execute('''
+                UPDATE alert_digest_runs SET status = 'done', finished_at = ?, districts = ?, emails = ?,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE period_end = ? AND claimed_by = ?
+            ''', (time.time(), len(districts), emails, period_end, self.worker_id))
+
+        elapsed = time.perf_counter() - start
+        metrics_registry.histogram('digest.run').observe(elapsed * 1000)
+        metrics_registry.counter('digest.runs').inc()
+        metrics_registry.gauge('digest.emails_per_second').set(int(queued / elapsed) if elapsed > 0 else 0)
+        summary = {
+            'periodEnd': period_end,
+            'alerts': sum(len(alerts) for alerts in districts.values()),
+            'districts': len(districts),
+            'emails': emails,
+            'seconds': round(elapsed, 3)
+        }
+        logger.info("Alert digest queued", extra={'fields': summary})
+        return summary
+
+
+# Global engine instance
+digest_engine = DigestEngine()
+
+_digest_thread = None
+_digest_stop = threading.Event()
+
+
+def _digest_loop(interval):
+    while not _digest_stop.wait(interval):
+        try:
+            digest_engine.run()
+        except Exception:
+            logger.exception("Alert digest failed")
+
+
+def start_digest_scheduler(interval=DIGEST_CHECK_INTERVAL):
+    """Start the background digest thread for this process (idempotent)"""
+    global _digest_thread
+    if not ALERT_DIGEST_ENABLED or interval <= 0:
+        return
+    if _digest_thread is not None and _digest_thread.is_alive():
+        return
+    _digest_stop.clear()
+    _digest_thread = threading.Thread(target=_digest_loop, args=(interval,), name='alert-digest', daemon=True)
+    _digest_thread.start()
+
+
+def stop_digest_scheduler():
+    """Stop the background digest thread"""
+    _digest_stop.set()
@@ -3,13 +3,17 @@ Flask backend server for plant disease detection using ML model (.h5)
 """
 # Suppress TensorFlow warnings and verbose output
 import os
+import math
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TensorFlow logging
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Disable oneDNN optimization messages
 
 import logging
+import json
+import hmac
+import hashlib
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 import numpy as np
 from PIL import Image
@@ -18,51 +22,130 @@ import tensorflow as tf
 from tensorflow import keras
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.middleware.proxy_fix import ProxyFix
 from database import (
-    init_db, create_user, get_user, verify_password,
+    init_db, create_user, get_user, verify_password, rehash_password_if_needed,
     save_scan, get_user_scans, delete_scan, get_scan_by_id,
     update_user_profile, update_profile_picture,
     create_alert, get_recent_alerts, get_alerts_by_location,
     delete_alert, update_alert, get_user_notification_preference,
     update_user_notification_preference, get_new_alerts_count,
     get_user_stats, get_user_accuracy, get_total_users_count,
-    get_analytics_summary, get_analytics_charts, get_analytics_reports
+    get_analytics_summary, get_analytics_charts, get_analytics_reports,
+    get_pool_stats, start_checkpoint_scheduler,
+    get_user_district_key, get_latest_alert_id, get_alerts_since,
+    get_dashboard, get_dashboard_version, DASHBOARD_FIELDS, get_scan_id_by_queue_seq,
+    user_cache, settings_cache,
+    get_pending_verification, save_pending_verification, pop_pending_verification, mark_email_verified
 )
 from model_manager import get_model_manager
+from password_hashing import PasswordHasherBusy, PASSWORD_HASH_QUEUE_WAIT
+from login_limiter import login_limiter
+from session_tokens import session_manager, principal_email
 from verification_tokens import token_manager
+from token_store import start_token_sweeper
+from mail_outbox import start_mail_sender
+from alert_digest import start_digest_scheduler
 from email_service import EmailService
-from chat_service import get_chat_service
+from chat_service import get_chat_service, response_cache as chat_response_cache
+from semantic_cache import semantic_cache
+from metrics import StageTimer, metrics_registry
+from alert_broker import alert_broker
+from scan_writer import SCAN_WRITE_BEHIND, get_scan_writer, start_scan_writer
+from logging_config import setup_logging, get_logger, sample_debug
+from upload_stream import UploadRequest, MAX_FILE_SIZE, MAX_CONTENT_LENGTH, ALLOWED_EXTENSIONS, ALLOWED_TYPES_TEXT
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Refuse to start with a missing or published SECRET_KEY: anyone could sign a session for any email
+session_manager.require_key()
+
+# Structured logging (queue handler + background writer)
+setup_logging()
+predict_logger = get_logger('predict')
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
+# Reverse proxies (e.g. nginx) in front of the app: trust that many X-Forwarded-* hops so that
+# request.remote_addr is the client's address (login limits are per client IP). 0 = no proxy;
+# never set it above the real number of proxies, or clients can spoof their address.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS,
+                            x_host=TRUSTED_PROXY_HOPS)
+
+# Stream uploads through size-limited, magic-byte-checked spool files
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
 # Multi-model manager (loads all 4 models)
 multi_model_manager = None
 
 # Email service instance
 email_service = EmailService()
 
-# In-memory storage for pending email verifications
-pending_verifications = {}
-
-# In-memory users database (should be replaced with proper database)
-users_db = {}
-
 # Upload configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads', 'profile_pictures')
 ALERT_IMAGES_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads', 'alert_images')
 SCAN_IMAGES_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads', 'scan_images')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+
+# Return per-stage durations from /predict in a Server-Timing header
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+# Admin token for /api/metrics (X-Metrics-Token header); unset = only direct requests from this host
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 # Ensure upload directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(ALERT_IMAGES_FOLDER, exist_ok=True)
 os.makedirs(SCAN_IMAGES_FOLDER, exist_ok=True)
 
+@app.before_request
+def parse_uploads():
+    """Parse multipart bodies before the view so upload limit errors become 413/415 responses"""
+    if request.mimetype == 'multipart/form-data':
+        request.files
+
+@app.before_request
+def load_session():
+    """Verify the session token once per request; handlers read the principal from flask.g"""
+    g.principal = None
+    if request.method == 'OPTIONS' or request.path.startswith('/api/auth/'):
+        return None
+
+    claimed = [request.args.get('email')]
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        claimed += [request.form.get('email'), request.form.get('userEmail')]
+    elif request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            claimed.append(body.get('email'))
+
+    principal, error, status = session_manager.authenticate(
+        request.headers.get('Authorization'), request.args.get('access_token'), claimed
+    )
+    if error:
+        return jsonify({"error": error}), status
+    g.principal = principal
+
+def request_email(params, key='email'):
+    """Email the request acts for: the session user, else the legacy email parameter"""
+    return principal_email(g.principal, params, key)
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_upload_too_large(e):
+    """Upload exceeded the file or request size limit"""
+    if e.description == RequestEntityTooLarge.description:
+        return jsonify({"error": f"Request too large. Maximum size is {MAX_CONTENT_LENGTH // (1024 * 1024)}MB"}), 413
+    return jsonify({"error": e.description}), 413
+
+@app.errorhandler(UnsupportedMediaType)
+def handle_unsupported_upload(e):
+    """Uploaded file is not a supported image"""
+    return jsonify({"error": e.description}), 415
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -134,68 +217,52 @@ def health_check():
         "num_models": len(multi_model_manager.models) if multi_model_manager else 0
     })
 
-@app.route('/predict', methods=['POST'])
-def predict():
+def run_prediction(image_bytes, timer):
     """
-    Multi-model disease prediction endpoint
-    Runs all 4 models and returns best prediction
+    Decode an uploaded image and run all models on it
+    Shared by the Flask and async (async_app.py) /predict endpoints
+    Returns: (response_dict, status_code)
     """
-    try:
-        # Check if multi-model manager is ready
-        if multi_model_manager is None:
-            return jsonify({"error": "Models not loaded"}), 500
-        
-        # Get image from request
-        if 'image' not in request.files:
-            return jsonify({"error": "No image provided"}), 400
-        
-        image_file = request.files['image']
-        
-        # Read and process image
-        image = Image.open(io.BytesIO(image_file.read()))
-        
-        # Ensure RGB format
+    with timer.stage('decode'):
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    
+    # Ensure RGB format
+    with timer.stage('rgb_convert'):
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        
-        print(f"\n{'='*60}")
-        print(f"MULTI-MODEL PREDICTION - NEW REQUEST")
-        print(f"{'='*60}")
-        print(f"Image size: {image.size}")
-        print(f"Image mode: {image.mode}")
-        print(f"Image hash: {hash(image.tobytes())}")  # To verify different images
-        
-        # Run all models and get best prediction
-        result = multi_model_manager.predict_all(image)
-        
-        print(f"\n[DEBUG] Prediction result: {result}")
-        
-        # Check if prediction was successful
-        if not result.get('success'):
-            # Low confidence or invalid image
-            print(f"\n[WARNING] Low confidence detection")
-            print(f"All predictions: {result.get('all_predictions', [])}")
-            return jsonify({
-                "success": False,
-                "error": "Please upload a clear crop image or valid image",
-                "confidence": result.get('confidence', 0)
-            }), 400
-        
+    
+    # Detailed per-model output is only logged for a sample of requests
+    debug_sampled = sample_debug(predict_logger)
+    
+    # Run all models and get best prediction
+    result = multi_model_manager.predict_all(image, timer=timer, fingerprint=debug_sampled)
+    
+    if debug_sampled:
+        predict_logger.debug("Prediction detail", extra={'fields': {
+            'image_size': image.size,
+            'fingerprint': result.get('fingerprint'),
+            'all_predictions': result.get('all_predictions', [])
+        }})
+    
+    # Check if prediction was successful
+    if not result.get('success'):
+        # Low confidence or invalid image
+        predict_logger.warning("Low confidence detection", extra={'fields': {
+            'confidence': result.get('confidence', 0)
+        }})
+        return {
+            "success": False,
+            "error": "Please upload a clear crop image or valid image",
+            "confidence": result.get('confidence', 0)
+        }, 400
+    
+    with timer.stage('post_process'):
         # Successful prediction
         disease_name = result['disease']
         confidence = result['confidence'] * 100  # Convert to percentage
         model_used = result['model_used']
         
-        print(f"\n[OK] Best Prediction:")
-        print(f"  Disease: {disease_name}")
-        print(f"  Confidence: {confidence:.2f}%")
-        print(f"  Model: {model_used}")
-        
-        # Show all model predictions for debugging
-        print(f"\nAll Model Predictions:")
-        for pred in result['all_predictions']:
-            print(f"  - {pred['model']}: {pred['disease']} ({pred['confidence']*100:.2f}%)")
-        
         # Determine severity based on confidence
         if confidence >= 80:
             severity = "High"
@@ -206,24 +273,93 @@ def predict():
         
         # Extract crop name from predicted class
         crop_name = disease_name.split('_')[0] if '_' in disease_name else "Unknown"
+    
+    predict_logger.info("Prediction", extra={'fields': {
+        'disease': disease_name,
+        'confidence': round(confidence, 2),
+        'model': model_used
+    }})
+    
+    return {
+        "success": True,
+        "diseaseName": disease_name,
+        "confidence": round(confidence, 2),
+        "cropName": crop_name,
+        "severity": severity,
+        "description": f"{disease_name} detected with {confidence:.2f}% confidence."
+    }, 200
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    Multi-model disease prediction endpoint
+    Runs all 4 models and returns best prediction
+    """
+    timer = StageTimer('predict')
+    status = 500
+    try:
+        response, status = _predict(timer)
+        return _with_timing(response, timer, status), status
+    finally:
+        # Failed and rejected requests are timed too (no-op if _with_timing already finished)
+        timer.finish(status)
+
+def _predict(timer):
+    """Body of /predict; returns (response, status)"""
+    try:
+        # Check if multi-model manager is ready
+        if multi_model_manager is None:
+            return jsonify({"error": "Models not loaded"}), 500
         
-        return jsonify({
-            "success": True,
-            "diseaseName": disease_name,
-            "confidence": round(confidence, 2),
-            "cropName": crop_name,
-            "severity": severity,
-            "description": f"{disease_name} detected with {confidence:.2f}% confidence."
-        })
+        # Get image from request
+        if 'image' not in request.files:
+            return jsonify({"error": "No image provided"}), 400
+        
+        image_file = request.files['image']
+        
+        # Read and process image
+        with timer.stage('upload_read'):
+            image_bytes = image_file.read()
+        
+        payload, status = run_prediction(image_bytes, timer)
+        
+        with timer.stage('serialization'):
+            response = jsonify(payload)
+        return response, status
         
     except Exception as e:
-        print(f"[ERROR] Prediction failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        predict_logger.exception("Prediction failed")
         return jsonify({
             "error": f"Prediction failed: {str(e)}"
         }), 500
 
+def _with_timing(response, timer, status=None):
+    """Record stage timings and attach a Server-Timing header when enabled"""
+    timer.finish(status)
+    if SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = timer.server_timing_header()
+    return response
+
+def _metrics_authorized():
+    """Metrics reveal internals: require METRICS_TOKEN, or a direct (unproxied) local request if none is set"""
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), METRICS_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get in-process metrics (per-stage latency histograms, DB pool and cache stats)"""
+    if not _metrics_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    metrics = metrics_registry.snapshot()
+    metrics['db_pool'] = get_pool_stats()
+    metrics['caches'] = {'users': user_cache.stats(), 'user_settings': settings_cache.stats(),
+                         'chat_responses': chat_response_cache.stats(), 'chat_semantic': semantic_cache.stats()}
+    return jsonify({
+        "success": True,
+        "metrics": metrics
+    }), 200
+
 # ============== VALIDATION FUNCTIONS ==============
 
 def validate_password(password):
@@ -290,6 +426,12 @@ def validate_phone(phone):
 
 # ============== AUTHENTICATION ENDPOINTS ==============
 
+def _busy_response(message):
+    """503 for a full password hashing queue"""
+    response = jsonify({"error": message})
+    response.headers['Retry-After'] = str(max(1, int(PASSWORD_HASH_QUEUE_WAIT)))
+    return response, 503
+
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
     """Handle user signup - create account in database"""
@@ -321,7 +463,11 @@ def signup():
         success, result = create_user(email, full_name, cleaned_phone, password)
         
         if not success:
-            return jsonify({"error": result}), 409 if "already registered" in result else 500
+            if "already registered" in result:
+                return jsonify({"error": result}), 409
+            if "retry" in result:
+                return _busy_response(result)
+            return jsonify({"error": result}), 500
         
         return jsonify({
             "success": True,
@@ -348,23 +494,15 @@ def verify_email(token):
         
         email = result
         
-        # Check if user data exists in pending
-        if email not in pending_verifications:
+        # Take the pending verification (shared by all workers, so only one request gets it)
+        user_data = pop_pending_verification(email)
+        if user_data is None:
             return jsonify({
                 "success": False,
                 "error": "Verification data not found"
             }), 404
         
-        # Move user from pending to active users
-        user_data = pending_verifications.pop(email)
-        users_db[email] = {
-            'email': user_data['email'],
-            'fullName': user_data['fullName'],
-            'phone': user_data['phone'],
-            'password': user_data['password'],
-            'verified': True,
-            'created_at': str(np.datetime64('now'))
-        }
+        mark_email_verified(email)
         
         # Send welcome email
         email_service.send_welcome_email(email, user_data['fullName'])
@@ -396,18 +534,19 @@ def resend_verification():
             return jsonify({"error": "Email is required"}), 400
         
         # Check if user is in pending verifications
-        if email not in pending_verifications:
+        pending = get_pending_verification(email)
+        if pending is None:
             return jsonify({"error": "No pending verification for this email"}), 404
         
-        # Generate new token
+        # Generate new token and restart the pending verification's expiry
         token = token_manager.generate_token(email)
-        pending_verifications[email]['token'] = token
+        save_pending_verification(email, pending['fullName'], pending['phone'])
         
         # Resend email
         success, message = email_service.send_verification_email(
             to_email=email,
             verification_token=token,
-            user_name=pending_verifications[email]['fullName']
+            user_name=pending['fullName']
         )
         
         if not success:
@@ -433,18 +572,32 @@ def login():
         if not all([email, password]):
             return jsonify({"error": "Missing email or password"}), 400
         
+        # Refuse before any bcrypt work once the account (from this IP) or the IP has too many recent failures
+        ip = request.remote_addr
+        allowed, retry_after = login_limiter.check(email, ip)
+        if not allowed:
+            response = jsonify({"error": "Too many failed login attempts, please try again later"})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        
         # Get user from database
         user = get_user(email)
         if not user:
+            login_limiter.record_failure(email, ip)
             return jsonify({"error": "Invalid credentials"}), 401
         
         # Verify password using bcrypt
         if not verify_password(user['password_hash'], password):
+            login_limiter.record_failure(email, ip)
             return jsonify({"error": "Invalid credentials"}), 401
         
+        login_limiter.record_success(email, ip)
+        rehash_password_if_needed(email, user['password_hash'], password)
+        
         return jsonify({
             "success": True,
             "message": "Login successful",
+            "token": session_manager.issue(user['email'], user['fullName']),
             "user": {
                 "email": user['email'],
                 "fullName": user['fullName'],
@@ -454,6 +607,8 @@ def login():
             }
         }), 200
         
+    except PasswordHasherBusy as e:
+        return _busy_response(str(e))
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({"error": f"Login failed: {str(e)}"}), 500
@@ -464,7 +619,7 @@ def login():
 def get_profile():
     """Get user profile by email"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -490,7 +645,7 @@ def update_profile():
     """Update user profile information"""
     try:
         data = request.json
-        email = data.get('email')
+        email = request_email(data)
         full_name = data.get('fullName')
         phone = data.get('phone')
         address = data.get('address')
@@ -530,7 +685,7 @@ def update_profile():
 def upload_profile_picture():
     """Upload user profile picture"""
     try:
-        email = request.form.get('email')
+        email = request_email(request.form)
         
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -544,15 +699,7 @@ def upload_profile_picture():
             return jsonify({"error": "No file selected"}), 400
         
         if not allowed_file(file.filename):
-            return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif"}), 400
-        
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({"error": "File too large. Maximum size is 5MB"}), 400
+            return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
         
         # Generate secure filename
         filename = secure_filename(file.filename)
@@ -593,7 +740,7 @@ def serve_profile_picture(filename):
 def get_stats():
     """Get scan statistics for a user"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         if not email:
             return jsonify({"error": "Email is required"}), 400
             
@@ -610,7 +757,7 @@ def get_stats():
 def get_accuracy():
     """Get user's average accuracy (average confidence across all scans)"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         if not email:
             return jsonify({"error": "Email is required"}), 400
 
@@ -655,7 +802,7 @@ def submit_alert():
         disease_reported = request.form.get('diseaseReported')
         description = request.form.get('description', '')
         prevention_methods = request.form.get('preventionMethods', '')
-        user_email = request.form.get('userEmail')
+        user_email = request_email(request.form, 'userEmail')
         
         # Validate required fields
         if not all([farmer_name, location, disease_reported]):
@@ -669,15 +816,7 @@ def submit_alert():
             
             if file.filename != '':
                 if not allowed_file(file.filename):
-                    return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif"}), 400
-                
-                # Check file size
-                file.seek(0, os.SEEK_END)
-                file_size = file.tell()
-                file.seek(0)
-                
-                if file_size > MAX_FILE_SIZE:
-                    return jsonify({"error": "File too large. Maximum size is 5MB"}), 400
+                    return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
                 
                 # Generate secure filename
                 filename = secure_filename(file.filename)
@@ -729,7 +868,7 @@ def serve_alert_image(filename):
 def get_alerts_location():
     """Get alerts filtered by user's location"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         limit = request.args.get('limit', 20, type=int)
         
         if not email:
@@ -750,7 +889,7 @@ def get_alerts_location():
 def delete_community_alert(alert_id):
     """Delete a community alert"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -788,7 +927,7 @@ def update_community_alert(alert_id):
         disease_reported = request.form.get('diseaseReported')
         description = request.form.get('description')
         prevention_methods = request.form.get('preventionMethods')
-        user_email = request.form.get('userEmail')
+        user_email = request_email(request.form, 'userEmail')
         
         if not user_email:
             return jsonify({"error": "User email is required"}), 400
@@ -833,7 +972,7 @@ def update_community_alert(alert_id):
 def get_alerts_count():
     """Get count of new alerts since last seen"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         last_seen_id = request.args.get('lastSeenId', 0, type=int)
         
         if not email:
@@ -850,11 +989,93 @@ def get_alerts_count():
         print(f"Get new alerts count error: {str(e)}")
         return jsonify({"error": f"Failed to fetch count: {str(e)}"}), 500
 
+# Alert stream: seconds between keep-alive comments (also how often alerts created
+# by other worker processes are picked up from the database)
+ALERT_STREAM_HEARTBEAT = float(os.getenv('ALERT_STREAM_HEARTBEAT', 15))
+ALERT_STREAM_RETRY_MS = int(os.getenv('ALERT_STREAM_RETRY_MS', 5000))
+# Serve the stream from this (threaded) app too; off by default because each open stream holds a
+# request thread, and a few tabs would starve every other route. async_app serves it regardless.
+ALERT_STREAM_FLASK_ENABLED = os.getenv('ALERT_STREAM_FLASK_ENABLED', 'false').lower() == 'true'
+
+
+def _sse_alert_event(alert):
+    """Format an alert as a Server-Sent Event"""
+    return f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+
+
+def stream_catch_up(email, district, last_sent):
+    """
+    Alerts a stream missed after last_sent, or none if the user has notifications turned off
+    (live alerts are muted the same way by the broker's recipient filter)
+    Returns: (alerts, id of the newest alert covered)
+    """
+    _, enabled = get_user_notification_preference(email)
+    if not enabled:
+        return [], max(last_sent, get_latest_alert_id(district))
+    alerts = get_alerts_since(district, last_sent)
+    return alerts, (alerts[-1]['id'] if alerts else last_sent)
+
+
+@app.route('/api/alerts/stream', methods=['GET'])
+def stream_alerts():
+    """
+    Server-Sent Events stream of new alerts in the user's district
+    Reconnecting clients send Last-Event-ID (or ?lastEventId=) and receive the alerts they missed.
+    Each open stream holds a server thread here, so unless ALERT_STREAM_FLASK_ENABLED it answers 503
+    and clients poll instead; async_app serves the same stream without one.
+    """
+    if not ALERT_STREAM_FLASK_ENABLED:
+        return jsonify({"error": "Alert stream is not served here; poll /api/alerts/new-count"}), 503
+
+    email = request_email(request.args)
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+
+    district = get_user_district_key(email)
+
+    def generate():
+        # Subscribe before reading the catch-up position so no alert falls in between
+        subscription = alert_broker.subscribe(district, email)
+        try:
+            last_sent = last_event_id if last_event_id is not None else get_latest_alert_id(district)
+            catch_up = last_event_id is not None
+            yield f"retry: {ALERT_STREAM_RETRY_MS}\n\n"
+            while True:
+                if catch_up:
+                    alerts, last_sent = stream_catch_up(email, district, last_sent)
+                    for alert in alerts:
+                        yield _sse_alert_event(alert)
+                    catch_up = False
+
+                alert = subscription.get(timeout=ALERT_STREAM_HEARTBEAT)
+                if subscription.overflowed:
+                    # Too slow to keep up; the client reconnects and catches up from the database
+                    return
+                if alert is None:
+                    yield ": heartbeat\n\n"
+                    catch_up = get_latest_alert_id(district) > last_sent
+                elif alert['id'] > last_sent:
+                    yield _sse_alert_event(alert)
+                    last_sent = alert['id']
+        finally:
+            alert_broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/profile/notification-preference', methods=['GET'])
 def get_notification_pref():
     """Get user notification preference"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         if not email:
             return jsonify({"error": "Email is required"}), 400
             
@@ -871,7 +1092,7 @@ def update_notification_pref():
     """Update user notification preference"""
     try:
         data = request.json
-        email = data.get('email')
+        email = request_email(data)
         enabled = data.get('enabled')
         
         if not email or enabled is None:
@@ -887,19 +1108,53 @@ def update_notification_pref():
 
 # ============== HISTORY API ENDPOINTS ==============
 
+def validate_scan_fields(user_email, disease_name, confidence):
+    """
+    Check a scan's required fields before it is stored or queued
+    Returns: (valid, confidence as float or error message)
+    """
+    if not all([user_email, disease_name, confidence]):
+        return False, "Missing required fields"
+    try:
+        value = float(confidence)
+    except (TypeError, ValueError):
+        return False, "Confidence must be a number"
+    if not math.isfinite(value) or not 0 <= value <= 100:
+        return False, "Confidence must be between 0 and 100"
+    return True, value
+
+
+def persist_scan(**scan):
+    """
+    Store a scan through the write-behind queue, or synchronously if it is disabled
+    Returns: (success, response fields or error message, error status)
+    """
+    if not SCAN_WRITE_BEHIND:
+        success, result = save_scan(**scan)
+        return success, ({"scanId": result} if success else result), 500
+
+    success, result = get_scan_writer().enqueue(**scan)
+    if not success:
+        # Queue is full (backpressure): ask the client to retry
+        return False, result, 503
+    # The real id is assigned when the batch is written; resolve it via /api/history/resolve/<provisionalId>
+    return True, {"scanId": None, "provisionalId": result, "queued": True}, 200
+
+
 @app.route('/api/history/save', methods=['POST'])
 def save_history():
     """Save a scan to user's history with image"""
     try:
-        user_email = request.form.get('email')
+        user_email = request_email(request.form)
         disease_name = request.form.get('diseaseName')
         confidence = request.form.get('confidence')
         crop_name = request.form.get('cropName')
         severity = request.form.get('severity')
         
         # Validate required fields
-        if not all([user_email, disease_name, confidence]):
-            return jsonify({"error": "Missing required fields"}), 400
+        valid, confidence = validate_scan_fields(user_email, disease_name, confidence)
+        if not valid:
+            return jsonify({"error": confidence}), 400
         
         image_url = None
         
@@ -909,7 +1164,7 @@ def save_history():
             
             if file.filename != '':
                 if not allowed_file(file.filename):
-                    return jsonify({"error": "Invalid file type"}), 400
+                    return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
                 
                 # Generate unique filename
                 import time
@@ -922,11 +1177,11 @@ def save_history():
                 
                 image_url = f"/uploads/scan_images/{unique_filename}"
         
-        # Save to database
-        success, result = save_scan(
+        # Save to database (queued for a batched background write when write-behind is enabled)
+        success, result, status = persist_scan(
             user_email=user_email,
             disease_name=disease_name,
-            confidence=float(confidence),
+            confidence=confidence,
             crop_name=crop_name,
             severity=severity,
             image_url=image_url,
@@ -940,12 +1195,12 @@ def save_history():
                 filepath = os.path.join(SCAN_IMAGES_FOLDER, unique_filename)
                 if os.path.exists(filepath):
                     os.remove(filepath)
-            return jsonify({"error": result}), 500
+            return jsonify({"error": result}), status
         
         return jsonify({
             "success": True,
             "message": "Scan saved to history",
-            "scanId": result,
+            **result,
             "imageUrl": image_url
         }), 200
         
@@ -953,22 +1208,47 @@ def save_history():
         print(f"Save history error: {str(e)}")
         return jsonify({"error": f"Failed to save history: {str(e)}"}), 500
 
+@app.route('/api/history/resolve/<provisional_id>', methods=['GET'])
+def resolve_history_id(provisional_id):
+    """Resolve a queued scan's provisional id to its history id (null while still queued)"""
+    try:
+        email = request_email(request.args)
+        if not email:
+            return jsonify({"error": "Email is required"}), 400
+        scan_id = get_scan_id_by_queue_seq(provisional_id, email)
+        return jsonify({
+            "success": True,
+            "scanId": scan_id,
+            "pending": scan_id is None
+        }), 200
+    except Exception as e:
+        print(f"Resolve history id error: {str(e)}")
+        return jsonify({"error": f"Failed to resolve scan id: {str(e)}"}), 500
+
 @app.route('/api/history/get', methods=['GET'])
 def get_history():
-    """Get user's scan history"""
+    """Get user's scan history (paginate with beforeId/beforeDate from nextCursor)"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         limit = request.args.get('limit', 50, type=int)
+        before_id = request.args.get('beforeId', type=int)
+        before_date = request.args.get('beforeDate')
         
         if not email:
             return jsonify({"error": "Email is required"}), 400
         
-        scans = get_user_scans(email, limit)
+        scans = get_user_scans(email, limit, before_date=before_date, before_id=before_id)
+        
+        # Cursor for the next page (null when this page is the last)
+        next_cursor = None
+        if len(scans) == limit:
+            next_cursor = {"beforeId": scans[-1]['id'], "beforeDate": scans[-1]['scanDate']}
         
         return jsonify({
             "success": True,
             "history": scans,
-            "count": len(scans)
+            "count": len(scans),
+            "nextCursor": next_cursor
         }), 200
         
     except Exception as e:
@@ -979,7 +1259,7 @@ def get_history():
 def delete_history(scan_id):
     """Delete a scan from user's history"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -1020,7 +1300,7 @@ def serve_scan_image(filename):
 def get_analytics_summary_endpoint():
     """Get descriptive analytics summary for a user"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         if not email:
             return jsonify({"error": "Email is required"}), 400
         
@@ -1040,7 +1320,7 @@ def get_analytics_summary_endpoint():
 def get_analytics_charts_endpoint():
     """Get predictive analytics data (charts)"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         if not email:
             return jsonify({"error": "Email is required"}), 400
         
@@ -1060,7 +1340,7 @@ def get_analytics_charts_endpoint():
 def get_analytics_reports_endpoint():
     """Get prescriptive analytics (recent reports)"""
     try:
-        email = request.args.get('email')
+        email = request_email(request.args)
         limit = request.args.get('limit', 10, type=int)
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -1075,17 +1355,63 @@ def get_analytics_reports_endpoint():
         print(f"Analytics reports error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard_endpoint():
+    """
+    Get analytics summary, charts, reports, profile stats and accuracy in one request
+    ?fields=summary,charts selects parts (default: all). Responses carry an ETag derived
+    from the user's analytics version, so unchanged dashboards are answered with 304.
+    """
+    try:
+        email = request_email(request.args)
+        limit = request.args.get('limit', 10, type=int)
+        if not email:
+            return jsonify({"error": "Email is required"}), 400
+
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(DASHBOARD_FIELDS)
+        unknown = [f for f in fields if f not in DASHBOARD_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(DASHBOARD_FIELDS)}"}), 400
+
+        def make_etag(version):
+            key = f"{email}:{version}:{','.join(sorted(set(fields)))}:{limit}"
+            return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+        # Cheap check first: one indexed row read, no aggregation
+        if request.if_none_match:
+            current_etag = make_etag(get_dashboard_version(email))
+            if request.if_none_match.contains(current_etag):
+                response = app.response_class(status=304)
+                response.set_etag(current_etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+        result = get_dashboard(email, fields, limit)
+        if result is None:
+            return jsonify({"error": "Failed to fetch dashboard"}), 500
+
+        version, dashboard = result
+        response = jsonify({
+            "success": True,
+            **dashboard
+        })
+        response.set_etag(make_etag(version))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+    except Exception as e:
+        print(f"Dashboard error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 # ============== CHAT API ENDPOINTS ==============
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+def handle_chat(data):
     """
-    AI chatbot endpoint for agricultural assistance
-    Provides context-aware advice based on disease detection
+    Validate a chat request and get the AI response
+    Shared by the Flask and async (async_app.py) chat endpoints
+    Returns: (response_dict, status_code)
     """
     try:
-        from datetime import datetime
-        data = request.json
         user_message = data.get('message')
         language = data.get('language', 'en')
         context = data.get('context', {})
@@ -1097,7 +1423,7 @@ def chat():
         
         # Validate input
         if not user_message:
-            return jsonify({"error": "Message is required"}), 400
+            return {"error": "Message is required"}, 400
         
         # Validate language
         valid_languages = ['en', 'hi', 'kn', 'te', 'ta', 'bn']
@@ -1110,10 +1436,10 @@ def chat():
             print(f"[OK] Chat service initialized")
         except Exception as e:
             print(f"[ERROR] Failed to initialize chat service: {str(e)}")
-            return jsonify({
+            return {
                 "error": "Chat service not available",
                 "message": "The AI service is not properly configured. Please check the GEMINI_API_KEY environment variable."
-            }), 503
+            }, 503
         
         # Get AI response
         result = chat_service.get_chat_response(
@@ -1124,31 +1450,32 @@ def chat():
         
         if not result.get('success'):
             print(f"[WARNING] Chat service returned error: {result.get('response')}")
-            return jsonify({
+            return {
                 "error": "Failed to get response",
                 "message": result.get('response')
-            }), 500
+            }, 500
         
         print(f"[OK] Chat response generated successfully")
-        return jsonify({
+        return {
             "success": True,
             "response": result['response'],
             "language": result['language']
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"[ERROR] Chat error: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             "error": f"Chat failed: {str(e)}"
-        }), 500
+        }, 500
 
-@app.route('/api/chat/greeting', methods=['POST'])
-def chat_greeting():
-    """Get initial greeting message based on disease detection"""
+def handle_chat_greeting(data):
+    """
+    Build the initial greeting for a chat session
+    Returns: (response_dict, status_code)
+    """
     try:
-        data = request.json
         context = data.get('context', {})
         language = data.get('language', 'en')
         
@@ -1169,32 +1496,50 @@ def chat_greeting():
                 'ta': "வணக்கம்! நான் உங்கள் AI விவசாய ஆலோசகர். நான் உங்களுக்கு எவ்வாறு உதவ முடியும்?",
                 'bn': "নমস্কার! আমি আপনার AI কৃষি পরামর্শদাতা। আমি আপনাকে কীভাবে সাহায্য করতে পারি?"
             }
-            return jsonify({
+            return {
                 "success": True,
                 "greeting": fallback_greetings.get(language, fallback_greetings['en']),
                 "language": language
-            }), 200
+            }, 200
         
         greeting = chat_service.get_initial_greeting(context, language)
         print(f"[OK] Greeting generated: {greeting[:50]}...")
         
-        return jsonify({
+        return {
             "success": True,
             "greeting": greeting,
             "language": language
-        }), 200
+        }, 200
         
     except Exception as e:
         print(f"[ERROR] Greeting error: {str(e)}")
-        return jsonify({
+        return {
             "error": f"Failed to generate greeting: {str(e)}"
-        }), 500
+        }, 500
 
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """
+    AI chatbot endpoint for agricultural assistance
+    Provides context-aware advice based on disease detection
+    """
+    payload, status = handle_chat(request.json)
+    return jsonify(payload), status
 
-if __name__ == '__main__':
+@app.route('/api/chat/greeting', methods=['POST'])
+def chat_greeting():
+    """Get initial greeting message based on disease detection"""
+    payload, status = handle_chat_greeting(request.json)
+    return jsonify(payload), status
+
+
+def init_app():
+    """Initialize database and load models (used by the dev server and wsgi.py)"""
     # Initialize database on startup
     try:
         init_db()
+        start_checkpoint_scheduler()
+        start_token_sweeper()
         print("[OK] Database initialized")
     except Exception as e:
         print(f"[WARNING] Could not initialize database: {str(e)}")
@@ -1206,10 +1551,19 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"[WARNING] Could not load models: {str(e)}")
         print("[INFO] Server will start but predictions will fail until models are available.")
+
+
+if __name__ == '__main__':
+    init_app()
+    start_scan_writer()
+    start_mail_sender()
+    start_digest_scheduler()
     
-    print(f"\n[OK] Flask server starting on http://0.0.0.0:5000")
+    print(f"\n[OK] Flask development server starting on http://127.0.0.1:5000")
+    print(f"[INFO] For production use: gunicorn -c gunicorn.conf.py wsgi:app")
     print(f"[INFO] Chat endpoint: POST /api/chat")
     print(f"[INFO] Chat greeting: POST /api/chat/greeting\n")
     
-    # Run Flask server
-    app.run(host='127.0.0.1', port=5000, debug=True, use_reloader=False)
+    # Run Flask development server
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    app.run(host='127.0.0.1', port=5000, debug=debug, use_reloader=False)
@@ -0,0 +1,448 @@
+"""
+Async (ASGI) variant of the AgriDetect AI API
+Upload, chat and prediction endpoints and the alert stream run on Quart with non-blocking I/O;
+blocking work (SQLite, AI provider calls, model inference) is offloaded to executors.
+All other routes are served by the Flask app in app.py through a WSGI adapter
+that runs each request on a thread pool (ASYNC_WSGI_WORKERS).
+
+Usage: uvicorn async_app:asgi_app --host 0.0.0.0 --port 5000
+   or: hypercorn async_app:asgi_app --bind 0.0.0.0:5000
+"""
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, Request, g, request, jsonify, make_response
+from quart_cors import cors
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+import app as flask_backend
+from app import (
+    allowed_file, run_prediction, handle_chat, handle_chat_greeting, _with_timing, persist_scan, validate_scan_fields,
+    stream_catch_up, _sse_alert_event, ALERT_STREAM_HEARTBEAT, ALERT_STREAM_RETRY_MS,
+    UPLOAD_FOLDER, ALERT_IMAGES_FOLDER, SCAN_IMAGES_FOLDER
+)
+from upload_stream import make_stream_factory, upload_limit_for, MAX_CONTENT_LENGTH, ALLOWED_TYPES_TEXT
+from database import update_profile_picture, create_alert, get_user_district_key, get_latest_alert_id
+from alert_broker import alert_broker
+from scan_writer import start_scan_writer
+from mail_outbox import start_mail_sender
+from alert_digest import start_digest_scheduler
+from metrics import StageTimer
+from session_tokens import session_manager, principal_email
+from logging_config import get_logger
+
+# Inference is CPU-bound: keep this small so concurrent requests queue instead of thrashing
+ASYNC_INFERENCE_WORKERS = int(os.getenv('ASYNC_INFERENCE_WORKERS', 2))
+# Blocking I/O (SQLite, AI provider HTTP calls) mostly waits, so allow many threads
+ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', 64))
+# Concurrent requests served by the Flask routes that have no async version
+ASYNC_WSGI_WORKERS = int(os.getenv('ASYNC_WSGI_WORKERS', 32))
+
+inference_executor = ThreadPoolExecutor(max_workers=ASYNC_INFERENCE_WORKERS, thread_name_prefix='inference')
+io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix='blocking-io')
+wsgi_executor = ThreadPoolExecutor(max_workers=ASYNC_WSGI_WORKERS, thread_name_prefix='wsgi')
+
+logger = get_logger('async_app')
+
+
+class AsyncUploadRequest(Request):
+    """Quart request class that streams file parts through upload_stream.LimitedSpooledFile"""
+
+    def make_form_data_parser(self):
+        return self.form_data_parser_class(
+            max_content_length=self.max_content_length,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.parameter_storage_class,
+            stream_factory=make_stream_factory(upload_limit_for(self.endpoint))
+        )
+
+
+quart_app = Quart(__name__)
+quart_app.request_class = AsyncUploadRequest
+quart_app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app = cors(quart_app, allow_origin='*')
+
+
+@app.before_request
+async def parse_uploads():
+    """Parse multipart bodies before the view so upload limit errors become 413/415 responses"""
+    if request.mimetype == 'multipart/form-data':
+        await request.files
+
+
+@app.before_request
+async def load_session():
+    """Verify the session token once per request (see app.load_session)"""
+    g.principal = None
+    if request.method == 'OPTIONS' or request.path.startswith('/api/auth/'):
+        return None
+
+    claimed = [request.args.get('email')]
+    if request.mimetype == 'multipart/form-data':
+        form = await request.form
+        claimed += [form.get('email'), form.get('userEmail')]
+
+    principal, error, status = session_manager.authenticate(
+        request.headers.get('Authorization'), request.args.get('access_token'), claimed
+    )
+    if error:
+        return jsonify({"error": error}), status
+    g.principal = principal
+
+
+@app.errorhandler(RequestEntityTooLarge)
+async def handle_upload_too_large(e):
+    """Upload exceeded the file or request size limit"""
+    if e.description == RequestEntityTooLarge.description:
+        return jsonify({"error": f"Request too large. Maximum size is {MAX_CONTENT_LENGTH // (1024 * 1024)}MB"}), 413
+    return jsonify({"error": e.description}), 413
+
+
+@app.errorhandler(UnsupportedMediaType)
+async def handle_unsupported_upload(e):
+    """Uploaded file is not a supported image"""
+    return jsonify({"error": e.description}), 415
+
+
+async def run_blocking(executor, func, *args, **kwargs):
+    """Run a blocking function on an executor without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def _remove_file(filepath):
+    """Remove a file if it exists (used to clean up after failed DB writes)"""
+    if os.path.exists(filepath):
+        await run_blocking(io_executor, os.remove, filepath)
+
+
+@app.before_serving
+async def startup():
+    """Initialize database, load models and start the scan writer, mail sender and digest scheduler off the event loop"""
+    await run_blocking(io_executor, flask_backend.init_app)
+    await run_blocking(io_executor, start_scan_writer)
+    await run_blocking(io_executor, start_mail_sender)
+    await run_blocking(io_executor, start_digest_scheduler)
+
+
+@app.after_serving
+async def shutdown():
+    """Stop executor threads"""
+    inference_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+    wsgi_executor.shutdown(wait=False)
+
+
+@app.route('/predict', methods=['POST'])
+async def predict():
+    """Multi-model disease prediction with inference offloaded to an executor"""
+    timer = StageTimer('predict')
+    status = 500
+    try:
+        response, status = await _predict(timer)
+        return _with_timing(response, timer, status), status
+    finally:
+        timer.finish(status)
+
+
+async def _predict(timer):
+    """Body of /predict; returns (response, status)"""
+    try:
+        if flask_backend.multi_model_manager is None:
+            return jsonify({"error": "Models not loaded"}), 500
+
+        files = await request.files
+        if 'image' not in files:
+            return jsonify({"error": "No image provided"}), 400
+
+        with timer.stage('upload_read'):
+            # Large uploads are spooled to disk: read them off the event loop
+            image_bytes = await run_blocking(io_executor, files['image'].read)
+
+        payload, status = await run_blocking(inference_executor, run_prediction, image_bytes, timer)
+
+        with timer.stage('serialization'):
+            response = jsonify(payload)
+        return response, status
+
+    except Exception as e:
+        logger.exception("Prediction failed")
+        return jsonify({"error": f"Prediction failed: {str(e)}"}), 500
+
+
+@app.route('/api/profile/upload-picture', methods=['POST'])
+async def upload_profile_picture():
+    """Upload user profile picture"""
+    try:
+        form = await request.form
+        files = await request.files
+        email = principal_email(g.principal, form)
+
+        if not email:
+            return jsonify({"error": "Email is required"}), 400
+
+        if 'file' not in files:
+            return jsonify({"error": "No file provided"}), 400
+
+        file = files['file']
+
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
+
+        filename = secure_filename(file.filename)
+        safe_email = email.replace('@', '_').replace('.', '_')
+        unique_filename = f"{safe_email}_{filename}"
+
+        filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
+        await file.save(filepath)
+
+        profile_picture_url = f"/uploads/profile_pictures/{unique_filename}"
+
+        success, message = await run_blocking(io_executor, update_profile_picture, email, profile_picture_url)
+
+        if not success:
+            await _remove_file(filepath)
+            return jsonify({"error": message}), 500
+
+        return jsonify({
+            "success": True,
+            "message": "Profile picture uploaded successfully",
+            "profilePictureUrl": profile_picture_url
+        }), 200
+
+    except Exception as e:
+        logger.exception("Upload picture failed")
+        return jsonify({"error": f"Failed to upload picture: {str(e)}"}), 500
+
+
+@app.route('/api/alerts/submit', methods=['POST'])
+async def submit_alert():
+    """Submit a new community alert with optional photo"""
+    try:
+        form = await request.form
+        files = await request.files
+        farmer_name = form.get('farmerName')
+        location = form.get('location')
+        disease_reported = form.get('diseaseReported')
+
+        if not all([farmer_name, location, disease_reported]):
+            return jsonify({"error": "Missing required fields: farmerName, location, diseaseReported"}), 400
+
+        image_url = None
+        filepath = None
+
+        if 'image' in files:
+            file = files['image']
+
+            if file.filename != '':
+                if not allowed_file(file.filename):
+                    return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
+
+                filename = secure_filename(file.filename)
+                unique_filename = f"{int(time.time())}_{filename}"
+
+                filepath = os.path.join(ALERT_IMAGES_FOLDER, unique_filename)
+                await file.save(filepath)
+
+                image_url = f"/uploads/alert_images/{unique_filename}"
+
+        success, result = await run_blocking(
+            io_executor, create_alert,
+            farmer_name=farmer_name,
+            location=location,
+            disease_reported=disease_reported,
+            description=form.get('description', ''),
+            prevention_methods=form.get('preventionMethods', ''),
+            image_url=image_url,
+            user_email=principal_email(g.principal, form, 'userEmail')
+        )
+
+        if not success:
+            if filepath:
+                await _remove_file(filepath)
+            return jsonify({"error": result}), 500
+
+        return jsonify({
+            "success": True,
+            "message": "Alert submitted successfully",
+            "alert": result
+        }), 200
+
+    except Exception as e:
+        logger.exception("Submit alert failed")
+        return jsonify({"error": f"Failed to submit alert: {str(e)}"}), 500
+
+
+@app.route('/api/history/save', methods=['POST'])
+async def save_history():
+    """Save a scan to user's history with image"""
+    try:
+        form = await request.form
+        files = await request.files
+        user_email = principal_email(g.principal, form)
+        disease_name = form.get('diseaseName')
+        confidence = form.get('confidence')
+
+        valid, confidence = validate_scan_fields(user_email, disease_name, confidence)
+        if not valid:
+            return jsonify({"error": confidence}), 400
+
+        image_url = None
+        filepath = None
+
+        if 'image' in files:
+            file = files['image']
+
+            if file.filename != '':
+                if not allowed_file(file.filename):
+                    return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_TYPES_TEXT}"}), 400
+
+                filename = secure_filename(file.filename)
+                safe_email = user_email.replace('@', '_').replace('.', '_')
+                unique_filename = f"{safe_email}_{int(time.time())}_{filename}"
+
+                filepath = os.path.join(SCAN_IMAGES_FOLDER, unique_filename)
+                await file.save(filepath)
+
+                image_url = f"/uploads/scan_images/{unique_filename}"
+
+        success, result, status = await run_blocking(
+            io_executor, persist_scan,
+            user_email=user_email,
+            disease_name=disease_name,
+            confidence=confidence,
+            crop_name=form.get('cropName'),
+            severity=form.get('severity'),
+            image_url=image_url,
+            risk_level=form.get('riskLevel'),
+            health_status=form.get('healthStatus')
+        )
+
+        if not success:
+            if filepath:
+                await _remove_file(filepath)
+            return jsonify({"error": result}), status
+
+        return jsonify({
+            "success": True,
+            "message": "Scan saved to history",
+            **result,
+            "imageUrl": image_url
+        }), 200
+
+    except Exception as e:
+        logger.exception("Save history failed")
+        return jsonify({"error": f"Failed to save history: {str(e)}"}), 500
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """AI chatbot endpoint; the provider call runs on the I/O executor"""
+    data = await request.get_json()
+    payload, status = await run_blocking(io_executor, handle_chat, data)
+    return jsonify(payload), status
+
+
+@app.route('/api/chat/greeting', methods=['POST'])
+async def chat_greeting():
+    """Get initial greeting message based on disease detection"""
+    data = await request.get_json()
+    payload, status = await run_blocking(io_executor, handle_chat_greeting, data)
+    return jsonify(payload), status
+
+
+@app.route('/api/alerts/stream', methods=['GET'])
+async def stream_alerts():
+    """
+    Server-Sent Events stream of new alerts in the user's district (see app.stream_alerts)
+    The connection waits on the event loop, so open streams don't hold threads.
+    """
+    email = principal_email(g.principal, request.args)
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+
+    district = await run_blocking(io_executor, get_user_district_key, email)
+
+    async def generate():
+        # Subscribe before reading the catch-up position so no alert falls in between
+        subscription = alert_broker.subscribe_async(district, email)
+        try:
+            if last_event_id is not None:
+                last_sent = last_event_id
+            else:
+                last_sent = await run_blocking(io_executor, get_latest_alert_id, district)
+            catch_up = last_event_id is not None
+            yield f"retry: {ALERT_STREAM_RETRY_MS}\n\n".encode()
+            while True:
+                if catch_up:
+                    alerts, last_sent = await run_blocking(io_executor, stream_catch_up, email, district, last_sent)
+                    for alert in alerts:
+                        yield _sse_alert_event(alert).encode()
+                    catch_up = False
+
+                alert = await subscription.get_async(ALERT_STREAM_HEARTBEAT)
+                if subscription.overflowed:
+                    # Too slow to keep up; the client reconnects and catches up from the database
+                    return
+                if alert is None:
+                    yield b": heartbeat\n\n"
+                    catch_up = await run_blocking(io_executor, get_latest_alert_id, district) > last_sent
+                elif alert['id'] > last_sent:
+                    yield _sse_alert_event(alert).encode()
+                    last_sent = alert['id']
+        finally:
+            alert_broker.unsubscribe(subscription)
+
+    response = await make_response(generate(), 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.timeout = None  # Streams stay open; Quart would otherwise cut them at RESPONSE_TIMEOUT
+    return response
+
+
+# Paths handled natively by the async app; everything else goes to Flask
+ASYNC_PATHS = {rule.rule for rule in app.url_map.iter_rules() if '<' not in rule.rule}
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    """One WSGI request, run on wsgi_executor instead of asgiref's single shared sync thread"""
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.__wrapped__, thread_sensitive=False,
+                            executor=wsgi_executor)
+        await run(self, body)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that serves concurrent requests in parallel (Flask views are thread-safe)"""
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+flask_asgi = PooledWsgiToAsgi(flask_backend.app)
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI entry point dispatching between the async app and the Flask app"""
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        await app(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
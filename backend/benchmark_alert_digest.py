@@ -0,0 +1,70 @@
+"""
+Alert digest fan-out benchmark: digests queued per second for a large subscriber base
+Usage: python benchmark_alert_digest.py [users] [alerts]
+
+Seeds a throwaway database with users spread over many districts (a tenth of them
+with notifications off) and one period's worth of alerts, then times one digest run:
+subscriber selection, rendering and queueing on the email outbox.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import database
+from alert_digest import DigestEngine
+from metrics import metrics_registry
+from location_helpers import district_key
+
+DISTRICTS = ['Bangalore', 'Mysore', 'Belgaum', 'Hubli', 'Tumkur', 'Shimoga', 'Bijapur', 'Gulbarga'] + \
+    [f'District{i}' for i in range(192)]
+
+
+def seed(user_count, alert_count):
+    """Create users and alerts in a fresh database"""
+    db_dir = tempfile.mkdtemp(prefix='agridetect_bench_')
+    database.DATABASE_NAME = os.path.join(db_dir, 'bench_alert_digest.db')
+    database.init_db()
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    with database.get_db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (email, full_name, phone, password_hash, address, district_key, notifications_enabled) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(f'user{i}@example.com', f'User {i}', '0000000000', 'x', f'{DISTRICTS[i % len(DISTRICTS)]}, Karnataka',
+              district_key(f'{DISTRICTS[i % len(DISTRICTS)]}, Karnataka'), int(i % 10 != 0)) for i in range(user_count)]
+        )
+        alerts = []
+        for _ in range(alert_count):
+            location = f'{rng.choice(DISTRICTS)}, Karnataka'
+            alerts.append(('Farmer', location, 'Corn_Common_Rust', 'Orange pustules on leaves',
+                           f'user{rng.randrange(user_count)}@example.com', district_key(location)))
+        conn.executemany('''
+            INSERT INTO alerts (farmer_name, location, disease_reported, description, user_email, district_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', alerts)
+    print(f"Seeded {user_count} users and {alert_count} alerts in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    alert_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print(f"Alert digest benchmark: {user_count} users, {alert_count} alerts")
+    print("=" * 60)
+    seed(user_count, alert_count)
+    engine = DigestEngine()
+    summary = engine.run(time.time() + engine.period)  # As if the period the alerts were posted in had ended
+    print(f"Queued {summary['emails']} digests for {summary['districts']} districts in {summary['seconds']:.2f}s "
+          f"({summary['emails'] / summary['seconds']:.0f} digests/s)")
+
+    snapshot = metrics_registry.snapshot()
+    for name in ('digest.batch', 'digest.district', 'email.render_batch'):
+        stats = snapshot['histograms'][name]
+        print(f"  {name}: avg {stats['avg_ms']:.2f}ms  p50 <= {stats['p50_ms']}ms  p99 <= {stats['p99_ms']}ms  "
+              f"max {stats['max_ms']:.2f}ms")
+    with database.get_db_connection() as conn:
+        size = conn.execute('SELECT COUNT(*), SUM(LENGTH(html)) FROM email_outbox').fetchone()
+    print(f"  outbox: {size[0]} messages, {size[1] / 1e6:.1f} MB of HTML")
+    database.get_pool().close_all()
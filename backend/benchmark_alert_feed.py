@@ -0,0 +1,111 @@
+"""
+Location alert feed benchmark: Python district filtering vs indexed district_key query
+Usage: python benchmark_alert_feed.py [alerts] [iterations]
+
+Seeds a throwaway database with synthetic alerts spread over many districts,
+then times the previous implementation (latest 100 rows filtered in Python with
+a separate user lookup) against get_alerts_by_location.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import database
+from metrics import Histogram
+from location_helpers import extract_district, normalize_district_name, district_key
+
+DISTRICTS = ['Bangalore', 'Mysore', 'Belgaum', 'Hubli', 'Tumkur', 'Shimoga', 'Bijapur', 'Gulbarga'] + \
+    [f'District{i}' for i in range(192)]
+USERS = 1000
+
+
+def seed(alert_count):
+    """Create users and alert_count alerts in a fresh database"""
+    db_dir = tempfile.mkdtemp(prefix='agridetect_bench_')
+    database.DATABASE_NAME = os.path.join(db_dir, 'bench_alert_feed.db')
+    database.init_db()
+
+    rng = random.Random(42)
+    with database.get_db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (email, full_name, phone, password_hash, address, district_key) VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'user{i}@example.com', f'User {i}', '0000000000', 'x', f'{DISTRICTS[i % len(DISTRICTS)]}, Karnataka',
+              district_key(f'{DISTRICTS[i % len(DISTRICTS)]}, Karnataka')) for i in range(USERS)]
+        )
+
+    start = time.perf_counter()
+    batch = []
+    base = time.time() - 365 * 86400
+    for i in range(alert_count):
+        location = f'{rng.choice(DISTRICTS)}, Karnataka'
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + i * (365 * 86400 / alert_count)))
+        batch.append(('Farmer', location, 'Corn_Common_Rust', None, None, None,
+                      f'user{rng.randrange(USERS)}@example.com', created_at, district_key(location)))
+        if len(batch) == 50000 or i == alert_count - 1:
+            with database.get_db_connection() as conn:
+                conn.executemany('''
+                    INSERT INTO alerts (farmer_name, location, disease_reported, description, prevention_methods,
+                                        image_url, user_email, created_at, district_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', batch)
+            batch = []
+    print(f"Seeded {alert_count} alerts in {time.perf_counter() - start:.1f}s")
+
+
+def legacy_alerts_by_location(user_email, limit=20):
+    """Previous implementation: latest 100 alerts filtered in Python"""
+    user = database.get_user(user_email)
+    user_address = user.get('address', '') if user else ''
+    user_district = extract_district(user_address)
+    normalized_user_district = normalize_district_name(user_district) if user_district else None
+
+    with database.get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT id, farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email, created_at
+            FROM alerts ORDER BY created_at DESC LIMIT 100
+        ''').fetchall()
+
+    filtered = []
+    for row in rows:
+        if row['user_email'] == user_email:
+            filtered.append(dict(row))
+            continue
+        if normalized_user_district:
+            alert_district = extract_district(row['location'])
+            if normalize_district_name(alert_district) == normalized_user_district or \
+                    user_district in row['location'].lower():
+                filtered.append(dict(row))
+        if len(filtered) >= limit:
+            break
+    return filtered
+
+
+def run(label, feed, iterations):
+    """Time feed() for random users and print latency percentiles"""
+    histogram = Histogram()
+    rng = random.Random(7)
+    returned = 0
+    for _ in range(iterations):
+        email = f'user{rng.randrange(USERS)}@example.com'
+        start = time.perf_counter()
+        returned += len(feed(email, 20))
+        histogram.observe((time.perf_counter() - start) * 1000)
+
+    stats = histogram.snapshot()
+    print(label)
+    print(f"  avg {stats['avg_ms']:.2f}ms  p50 <= {stats['p50_ms']}ms  p99 <= {stats['p99_ms']}ms  max {stats['max_ms']:.2f}ms")
+    print(f"  {returned / iterations:.1f} alerts returned per request")
+    print("-" * 60)
+
+
+if __name__ == '__main__':
+    alert_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    print(f"Location alert feed benchmark: {alert_count} alerts, {iterations} requests each")
+    print("=" * 60)
+    seed(alert_count)
+    run('Python filtering over latest 100 alerts', legacy_alerts_by_location, iterations)
+    run('Indexed district_key query', database.get_alerts_by_location, iterations)
+    database.get_pool().close_all()
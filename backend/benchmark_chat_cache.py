@@ -0,0 +1,119 @@
+"""
+Chat answer cache benchmark: exact-key cache vs semantic (TF-IDF) cache on a replayed question log
+Usage: python benchmark_chat_cache.py [log.jsonl] [questions]
+
+Replays farmer questions through the exact response cache alone and with the
+semantic cache at several similarity thresholds, counting provider calls avoided
+and wrong answers served (a cached answer from a different intent). The log is
+one JSON object per line with message, crop, disease, language and optionally
+intent; without a log a synthetic one is generated from paraphrase groups.
+No AI provider is called: a miss is answered with its intent label.
+"""
+import sys
+import time
+import json
+import random
+from metrics import Histogram
+from chat_service import response_cache_key
+from semantic_cache import SemanticCache
+
+CONTEXTS = [('Tomato', 'Late Blight'), ('Corn', 'Common Rust'), ('Potato', 'Early Blight'), ('Apple', 'Apple Scab'),
+            ('Grape', 'Black Rot'), ('Rice', 'Leaf Blast')]
+
+# Paraphrases of the questions farmers ask most, {d} is the disease name
+INTENTS = {
+    'treat': ['How to treat {d}?', '{d} treatment?', 'how do i treat {d}', 'What is the treatment for {d}',
+              'best treatment for {d} please', 'how can I cure {d}', 'treating {d}'],
+    'prevent': ['How to prevent {d}?', '{d} prevention', 'how do I stop {d} from coming back',
+                'how can i prevent {d} next season', 'preventing {d}'],
+    'spread': ['Does {d} spread to other plants?', 'will {d} spread', 'is {d} contagious to nearby plants',
+               'can {d} spread to my other fields'],
+    'fertilizer': ['Which fertilizer should I use?', 'best fertilizer for this', 'what fertilizer to apply',
+                   'fertilizer recommendation'],
+    'organic': ['Is there an organic remedy for {d}?', 'organic treatment for {d}', 'natural remedy for {d}',
+                'home remedy for {d}'],
+    'spray': ['How should I spray fungicide?', 'how to spray fungicide', 'how do i apply the fungicide spray'],
+    # Same words as 'spray' with a different question word: must not share its answer
+    'spray_timing': ['When to spray fungicide?', 'when should I spray fungicide', 'fungicide spray schedule',
+                     'how often should I spray fungicide'],
+    'spray_reason': ['Why spray fungicide?', 'why should i spray fungicide', 'why is fungicide spray needed'],
+    'eat': ['Is the fruit safe to eat?', 'can we eat the produce', 'is the harvest safe to eat'],
+    'symptoms': ['What are the symptoms of {d}?', '{d} symptoms', 'how to identify {d}', 'signs of {d}'],
+}
+HINDI_INTENTS = {
+    'treat': ['{d} का इलाज कैसे करें?', '{d} का इलाज', '{d} का उपचार क्या है'],
+    'prevent': ['{d} से बचाव कैसे करें', '{d} की रोकथाम', '{d} से बचाव'],
+}
+
+
+def synthetic_log(count, seed=42):
+    """Questions drawn with a skew towards popular crops and intents, as in real traffic"""
+    rng = random.Random(seed)
+    groups = [(crop, disease, 'en', intent, phrasings) for crop, disease in CONTEXTS
+              for intent, phrasings in INTENTS.items()]
+    groups += [(crop, disease, 'hi', intent, phrasings) for crop, disease in CONTEXTS[:2]
+               for intent, phrasings in HINDI_INTENTS.items()]
+    rng.shuffle(groups)
+    weights = [1 / (rank + 1) for rank in range(len(groups))]
+    log = []
+    for crop, disease, language, intent, phrasings in rng.choices(groups, weights, k=count):
+        message = rng.choice(phrasings).format(d=disease if rng.random() < 0.5 else disease.lower())
+        if rng.random() < 0.3:
+            message = message.rstrip('?') + rng.choice(['', '?', '??', ' ?'])
+        if rng.random() < 0.3:
+            message = rng.choice(['sir ', 'please tell me ', 'hello, ', 'urgent: ', 'my field - ']) + message
+        log.append({'message': message, 'crop': crop, 'disease': disease, 'language': language,
+                    'intent': f'{crop}/{disease}/{language}/{intent}'})
+    return log
+
+
+def replay(log, threshold=None):
+    """Replay the log; threshold None means the exact-key cache only"""
+    exact = {}
+    semantic = SemanticCache(threshold=threshold) if threshold is not None else None
+    histogram = Histogram()
+    stats = {'exact': 0, 'semantic': 0, 'calls': 0, 'wrong': 0}
+    for question in log:
+        context = {'crop': question['crop'], 'disease': question['disease']}
+        intent = question.get('intent')
+        key = response_cache_key(question['message'], context, question['language'])
+        answer = exact.get(key)
+        if answer is not None:
+            stats['exact'] += 1
+        elif semantic is not None:
+            start = time.perf_counter()
+            answer, _ = semantic.match(question['message'], context, question['language'])
+            histogram.observe((time.perf_counter() - start) * 1000)
+            if answer is not None:
+                stats['semantic'] += 1
+                exact[key] = answer
+        if answer is None:
+            stats['calls'] += 1
+            answer = intent or question['message']
+            exact[key] = answer
+            if semantic is not None:
+                semantic.add(question['message'], context, question['language'], answer)
+        elif intent is not None and answer != intent:
+            stats['wrong'] += 1
+    return stats, histogram.snapshot()
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else None
+    count = int(sys.argv[-1]) if len(sys.argv) > 1 and sys.argv[-1].isdigit() else 5000
+    if path:
+        with open(path, encoding='utf-8') as f:
+            log = [json.loads(line) for line in f if line.strip()][:count]
+    else:
+        log = synthetic_log(count)
+
+    print(f"Chat cache benchmark: {len(log)} questions ({path or 'synthetic log'})")
+    print("=" * 60)
+    for threshold in (None, 0.9, 0.8, 0.7, 0.6, 0.5):
+        stats, latency = replay(log, threshold)
+        label = 'Exact key only' if threshold is None else f'Semantic, threshold {threshold}'
+        wrong = f"{stats['wrong']}" if all('intent' in q for q in log) else 'n/a'
+        print(f"{label:28s} provider calls {stats['calls']:5d} ({stats['calls'] / len(log):.1%})  "
+              f"exact hits {stats['exact']:5d}  semantic hits {stats['semantic']:5d}  wrong answers {wrong}")
+        if threshold is not None:
+            print(f"{'':28s} semantic lookup avg {latency['avg_ms']:.3f}ms  p99 <= {latency['p99_ms']}ms")
@@ -0,0 +1,82 @@
+"""
+SQLite concurrency benchmark: rollback journal vs WAL storage configuration
+Usage: python benchmark_db_concurrency.py [readers] [writers] [duration_seconds]
+
+Runs concurrent history reads (get_user_scans) and scan inserts (save_scan)
+against a throwaway database for each configuration and prints throughput.
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+import database
+
+CONFIGURATIONS = [
+    ('rollback journal (DELETE, synchronous=FULL)', 'DELETE', 'FULL'),
+    ('WAL, synchronous=NORMAL', 'WAL', 'NORMAL'),
+]
+
+TEST_EMAIL = 'bench@example.com'
+
+
+def run_configuration(label, journal_mode, synchronous, readers, writers, duration):
+    """Benchmark one storage configuration on a fresh database"""
+    db_dir = tempfile.mkdtemp(prefix='agridetect_bench_')
+    database.DB_JOURNAL_MODE = journal_mode
+    database.DB_SYNCHRONOUS = synchronous
+    database.DATABASE_NAME = os.path.join(db_dir, f'bench_{journal_mode.lower()}.db')
+    database.init_db()
+
+    # Seed some history so reads do real work
+    for i in range(500):
+        database.save_scan(TEST_EMAIL, 'Corn_Common_Rust' if i % 3 else 'Corn_Healthy', 90.0, 'Corn')
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def reader():
+        done = 0
+        while time.perf_counter() < deadline:
+            database.get_user_scans(TEST_EMAIL, 50)
+            done += 1
+        with lock:
+            counts['reads'] += done
+
+    def writer():
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            success, _ = database.save_scan(TEST_EMAIL, 'Corn_Common_Rust', 88.5, 'Corn')
+            if success:
+                done += 1
+            else:
+                errors += 1
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    database.get_pool().close_all()
+
+    print(label)
+    print(f"  Reads:  {counts['reads'] / duration:.1f} ops/s")
+    print(f"  Writes: {counts['writes'] / duration:.1f} ops/s ({counts['errors']} errors)")
+    print("-" * 60)
+
+
+if __name__ == '__main__':
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    duration = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    print(f"SQLite concurrency benchmark: {readers} readers, {writers} writers, {duration}s each")
+    print("=" * 60)
+    for label, journal_mode, synchronous in CONFIGURATIONS:
+        run_configuration(label, journal_mode, synchronous, readers, writers, duration)
@@ -3,11 +3,19 @@ Chat service for AI-powered agricultural assistant using Google Gemini
 Provides context-aware multilingual advice for plant disease management
 """
 import os
+import re
+import json
+import time
 import requests
+import unicodedata
 import google.generativeai as genai
 from typing import Dict, Optional
 import hashlib
 import sys
+from database import get_db_connection
+from metrics import metrics_registry
+from ttl_cache import LRUTTLCache
+from semantic_cache import semantic_cache, SEMANTIC_CACHE_ENABLED
 
 # Language names for prompt context
 LANGUAGE_NAMES = {
@@ -19,8 +27,79 @@ LANGUAGE_NAMES = {
     'bn': 'Bengali'
 }
 
-# Simple response cache to handle quota limits
-_response_cache = {}
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', 2000))
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', 86400))  # seconds
+# Also keep answers in SQLite so every worker and restarts reuse them
+CHAT_CACHE_PERSIST = os.getenv('CHAT_CACHE_PERSIST', 'false').lower() == 'true'
+
+# Answers from the AI provider, keyed by normalized question, context and language.
+# Fallback and error text is never cached, so a quota outage doesn't outlive itself.
+response_cache = LRUTTLCache('chat_responses', CHAT_CACHE_SIZE, CHAT_CACHE_TTL)
+_last_purge = 0.0
+
+# Context fields build_system_prompt() uses
+PROMPT_CONTEXT_KEYS = ('crop', 'disease')
+
+
+def normalize_message(message: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivial variants share a key"""
+    message = unicodedata.normalize('NFKC', message or '').casefold()
+    return re.sub(r'\s+', ' ', message).strip().rstrip('?!.。।').strip()
+
+
+def response_cache_key(user_message: str, context: Dict, language: str) -> str:
+    """
+    Stable key over what the prompt is built from: the normalized question, crop,
+    disease and language (per-scan fields like confidence don't change the answer)
+    """
+    context = context or {}
+    prompt_context = {key: context.get(key) for key in PROMPT_CONTEXT_KEYS}
+    canonical = json.dumps([normalize_message(user_message), prompt_context, language],
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_cached_response(cache_key: str) -> Optional[str]:
+    """Cached answer from memory, then (if enabled) SQLite"""
+    response = response_cache.get(cache_key)
+    if response is not None or not CHAT_CACHE_PERSIST:
+        return response
+    try:
+        token = response_cache.begin_fill()
+        with get_db_connection() as conn:
+            row = conn.execute('''
+                SELECT response, expires_at FROM chat_response_cache WHERE cache_key = ? AND expires_at > ?
+            ''', (cache_key, time.time())).fetchone()
+    except Exception as e:
+        print(f"[WARNING] Chat cache read failed: {str(e)}")
+        return None
+    if row is None:
+        return None
+    metrics_registry.counter('chat.cache.db_hit').inc()
+    response_cache.fill(cache_key, row['response'], token)
+    return row['response']
+
+
+def cache_response(cache_key: str, response: str):
+    """Remember a real provider answer"""
+    global _last_purge
+    if not response:
+        return
+    response_cache.set(cache_key, response)
+    if not CHAT_CACHE_PERSIST:
+        return
+    try:
+        now = time.time()
+        with get_db_connection() as conn:
+            conn.execute('''
+                INSERT INTO chat_response_cache (cache_key, response, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET response = excluded.response, expires_at = excluded.expires_at
+            ''', (cache_key, response, now + CHAT_CACHE_TTL))
+            if now - _last_purge > 3600:
+                conn.execute('DELETE FROM chat_response_cache WHERE expires_at <= ?', (now,))
+                _last_purge = now
+    except Exception as e:
+        print(f"[WARNING] Chat cache write failed: {str(e)}")
 
 class ChatService:
     """Service for handling AI chat interactions with agricultural context"""
@@ -116,6 +195,12 @@ Respond ONLY in {language_name}. Be practical and direct."""
         
         return greetings.get(language, greetings['en'])
     
+    def _remember_answer(self, cache_key: str, user_message: str, context: Dict, language: str, response_text: str):
+        """Cache a provider answer for repeats and paraphrases of the question"""
+        cache_response(cache_key, response_text)
+        if SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(user_message, context, language, response_text)
+    
     def get_chat_response(
         self, 
         user_message: str, 
@@ -125,21 +210,32 @@ Respond ONLY in {language_name}. Be practical and direct."""
     ) -> Dict:
         """Get AI response with agricultural context"""
         try:
-            # Create cache key
-            cache_key = hashlib.md5(
-                f"{user_message}:{context}:{language}".encode()
-            ).hexdigest()
-            
             # Check cache
-            if cache_key in _response_cache:
+            cache_key = response_cache_key(user_message, context, language)
+            cached_response = get_cached_response(cache_key)
+            if cached_response is not None:
                 print(f"[OK] Cached response for: {user_message[:30]}...")
                 return {
                     'success': True,
-                    'response': _response_cache[cache_key],
+                    'response': cached_response,
                     'language': language,
                     'cached': True
                 }
             
+            # Paraphrase of a question already answered for this crop, disease and language?
+            if SEMANTIC_CACHE_ENABLED:
+                similar_response = semantic_cache.lookup(user_message, context, language)
+                if similar_response is not None:
+                    print(f"[OK] Similar-question cached response for: {user_message[:30]}...")
+                    response_cache.set(cache_key, similar_response)
+                    return {
+                        'success': True,
+                        'response': similar_response,
+                        'language': language,
+                        'cached': True,
+                        'semantic': True
+                    }
+            
             system_prompt = self.build_system_prompt(context, language)
             full_prompt = f"{system_prompt}\n\nQ: {user_message}\n\nA:"
             
@@ -173,7 +269,7 @@ Respond ONLY in {language_name}. Be practical and direct."""
                         data = resp.json()
                         response_text = data['choices'][0]['message']['content'].strip()
                         # Cache and return
-                        _response_cache[cache_key] = response_text
+                        self._remember_answer(cache_key, user_message, context, language, response_text)
                         return {'success': True, 'response': response_text, 'language': language}
                     else:
                         api_error = Exception(f'OpenAI API error: {resp.status_code} {resp.text}')
@@ -192,7 +288,6 @@ Respond ONLY in {language_name}. Be practical and direct."""
                             'en': f"For {crop} with {disease}: 1) Remove infected parts immediately, 2) Improve air circulation around the plant, 3) Apply fungicide if needed, 4) Consult local agricultural extension.",
                         }
                         response_text = fallback_responses.get(language, fallback_responses['en'])
-                        _response_cache[cache_key] = response_text
                         return {'success': True, 'response': response_text, 'language': language, 'fallback': True}
                     # otherwise fallthrough to Gemini path if available
             # Not using OpenAI or OpenAI failed - use Gemini if configured
@@ -220,7 +315,6 @@ Respond ONLY in {language_name}. Be practical and direct."""
                         'bn': f"{crop} {disease}: 1) প্রভাবিত অংশ সরান, 2) বায়ু সংচালন উন্নত করুন, 3) ছত্রাকনাশক প্রয়োগ করুন।"
                     }
                     response_text = fallback_responses.get(language, fallback_responses['en'])
-                    _response_cache[cache_key] = response_text
                     return {'success': True, 'response': response_text, 'language': language, 'fallback': True}
                 # Retry with simpler prompt
                 print("[INFO] Retrying with simpler prompt...")
@@ -239,11 +333,10 @@ Respond ONLY in {language_name}. Be practical and direct."""
 
             response_text = response.text.strip()
             
-            if not response_text:
+            if response_text:
+                self._remember_answer(cache_key, user_message, context, language, response_text)
+            else:
                 response_text = "I couldn't generate a response. Please try again."
-            
-            # Cache it
-            _response_cache[cache_key] = response_text
             print(f"[OK] Response: {len(response_text)} chars")
             
             return {
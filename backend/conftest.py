@@ -0,0 +1,20 @@
+"""
+Shared fixtures for the backend tests
+Usage: pytest test_scan_writer.py  (from backend/; the server does not need to be running)
+"""
+import pytest
+import database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    Point the database module at a fresh migrated database under tmp_path
+    Returns: tmp_path (for other per-test files, e.g. a scan journal directory)
+    """
+    previous = database.DATABASE_NAME
+    database.DATABASE_NAME = str(tmp_path / 'test.db')
+    database.init_db()
+    yield tmp_path
+    database.get_pool().close_all()
+    database.DATABASE_NAME = previous
@@ -2,135 +2,301 @@
 SQLite database module for AgriDetect AI
 Handles user authentication and scan history persistence
 """
+import os
+import time
 import sqlite3
-import bcrypt
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from contextlib import contextmanager
+from migrations import run_migrations, get_schema_version
+from metrics import metrics_registry
+from location_helpers import district_key
+from alert_broker import alert_broker
+from ttl_cache import LRUTTLCache
+from password_hashing import get_password_hasher, PasswordHasherBusy
 
 DATABASE_NAME = 'agridetect.db'
 
-@contextmanager
-def get_db_connection():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DATABASE_NAME)
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))  # Max idle connections kept open
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))  # Seconds idle before re-checking
+
+# ============== STORAGE CONFIGURATION ==============
+
+# WAL lets readers proceed while a writer commits (rollback journal blocks them)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+# NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 16384))  # Page cache per connection
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 128 * 1024 * 1024))  # Memory-mapped I/O window
+DB_TEMP_STORE = os.getenv('DB_TEMP_STORE', 'MEMORY')  # Temp tables/indices for sorts
+DB_CHECKPOINT_INTERVAL = float(os.getenv('DB_CHECKPOINT_INTERVAL', 300))  # Seconds between WAL checkpoints
+
+def _configure_connection(conn):
+    """Apply per-connection settings (runs once when a connection is created)"""
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    try:
-        yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA temp_store = {DB_TEMP_STORE}")
 
-def init_db():
-    """Initialize database and create tables if they don't exist"""
+def configure_storage():
+    """
+    Apply database-wide settings (journal mode is persistent in the database file)
+    Returns: active journal mode
+    """
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                full_name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                password_hash TEXT NOT NULL,
-                profile_picture_url TEXT,
-                address TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Migrate existing table if needed (add new columns)
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN profile_picture_url TEXT")
-            print("Added profile_picture_url column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN address TEXT")
-            print("Added address column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN notifications_enabled INTEGER DEFAULT 1")
-            print("Added notifications_enabled column")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
-        # Create scan_history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scan_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_email TEXT NOT NULL,
-                disease_name TEXT NOT NULL,
-                confidence REAL NOT NULL,
-                crop_name TEXT,
-                severity TEXT,
-                risk_level TEXT,
-                health_status TEXT,
-                image_url TEXT,
-                scan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_email) REFERENCES users(email)
-            )
-        ''')
-        
-        # Migrate existing table if needed (add new columns)
-        try:
-            cursor.execute("ALTER TABLE scan_history ADD COLUMN image_url TEXT")
-            print("Added image_url column to scan_history")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
+        mode = conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}").fetchone()[0]
+    return mode
+
+def checkpoint(mode='PASSIVE'):
+    """
+    Run a WAL checkpoint, copying committed pages back into the database file
+    Returns: (busy, wal_pages, checkpointed_pages)
+    """
+    with get_db_connection() as conn:
+        row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return tuple(row)
 
+_checkpoint_thread = None
+_checkpoint_stop = threading.Event()
+
+def _checkpoint_loop(interval):
+    while not _checkpoint_stop.wait(interval):
         try:
-            cursor.execute("ALTER TABLE scan_history ADD COLUMN risk_level TEXT")
-            print("Added risk_level column to scan_history")
-        except sqlite3.OperationalError:
-            pass
+            checkpoint()
+        except Exception as e:
+            print(f"[WARNING] WAL checkpoint failed: {str(e)}")
 
+def start_checkpoint_scheduler(interval=DB_CHECKPOINT_INTERVAL):
+    """Start the background WAL checkpoint thread for this process (idempotent)"""
+    global _checkpoint_thread
+    if DB_JOURNAL_MODE.upper() != 'WAL' or interval <= 0:
+        return
+    if _checkpoint_thread is not None and _checkpoint_thread.is_alive():
+        return
+    _checkpoint_stop.clear()
+    _checkpoint_thread = threading.Thread(target=_checkpoint_loop, args=(interval,), name='wal-checkpoint', daemon=True)
+    _checkpoint_thread.start()
+
+def stop_checkpoint_scheduler():
+    """Stop the background WAL checkpoint thread"""
+    _checkpoint_stop.set()
+
+class ConnectionPool:
+    """
+    Thread-safe pool of SQLite connections
+    A thread reuses the same connection for nested get_db_connection() calls;
+    when the outermost block exits the connection goes back to the idle pool.
+    """
+    
+    def __init__(self, database, max_idle=DB_POOL_SIZE, health_check_interval=DB_HEALTH_CHECK_INTERVAL):
+        self.database = database
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'closed': 0,
+            'health_check_failures': 0,
+            'checkouts': 0,
+            'in_use': 0
+        }
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        _configure_connection(conn)
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+    
+    def _close(self, conn):
         try:
-            cursor.execute("ALTER TABLE scan_history ADD COLUMN health_status TEXT")
-            print("Added health_status column to scan_history")
-        except sqlite3.OperationalError:
+            conn.close()
+        except sqlite3.Error:
             pass
+        with self._lock:
+            self._stats['closed'] += 1
+    
+    def _is_healthy(self, conn, last_used):
+        """Ping connections that have been idle longer than the health check interval"""
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+    
+    def _check_fork(self):
+        """Drop connections inherited from a parent process (SQLite handles must not cross fork)"""
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._idle = []
+                self._local = threading.local()
+                self._pid = os.getpid()
+    
+    def acquire(self):
+        """
+        Check out a connection for the current thread
+        Returns: (connection, is_outermost)
+        """
+        self._check_fork()
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            local.depth += 1
+            return local.conn, False
         
-        # Create community alerts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                farmer_name TEXT NOT NULL,
-                location TEXT NOT NULL,
-                disease_reported TEXT NOT NULL,
-                description TEXT,
-                prevention_methods TEXT,
-                image_url TEXT,
-                user_email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_email) REFERENCES users(email)
-            )
-        ''')
+        conn = None
+        while conn is None:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                conn = self._connect()
+                break
+            if self._is_healthy(*entry):
+                conn = entry[0]
+                with self._lock:
+                    self._stats['reused'] += 1
+            else:
+                self._close(entry[0])
         
-        # Migrate existing alerts table if needed
-        try:
-            cursor.execute("ALTER TABLE alerts ADD COLUMN prevention_methods TEXT")
-            print("Added prevention_methods column to alerts")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+        local.conn = conn
+        local.depth = 1
+        return conn, True
+    
+    def release(self, conn, discard=False):
+        """Release a connection checked out with acquire()"""
+        local = self._local
+        local.depth -= 1
+        if local.depth > 0:
+            return
+        local.conn = None
         
-        print("Database initialized successfully")
+        with self._lock:
+            self._stats['in_use'] -= 1
+            if not discard and len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._close(conn)
+    
+    def close_all(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+    
+    def stats(self):
+        """Pool metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['max_idle'] = self.max_idle
+        stats['database'] = self.database
+        return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the connection pool for the current DATABASE_NAME"""
+    global _pool
+    pool = _pool
+    if pool is None or pool.database != DATABASE_NAME:
+        with _pool_lock:
+            if _pool is None or _pool.database != DATABASE_NAME:
+                if _pool is not None:
+                    _pool.close_all()
+                _pool = ConnectionPool(DATABASE_NAME)
+            pool = _pool
+    return pool
+
+def get_pool_stats():
+    """Connection pool metrics (for the metrics endpoint)"""
+    return get_pool().stats()
+
+@contextmanager
+def get_db_connection():
+    """
+    Context manager for pooled database connections
+    Commits (or rolls back) when the outermost block for the thread exits
+    """
+    pool = get_pool()
+    conn, outermost = pool.acquire()
+    discard = False
+    try:
+        yield conn
+        if outermost:
+            conn.commit()
+    except Exception as e:
+        if outermost:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True  # Connection is unusable, don't return it to the pool
+        raise e
+    finally:
+        pool.release(conn, discard=discard)
+
+def init_db():
+    """Initialize database: storage settings, then pending schema migrations"""
+    journal_mode = configure_storage()
+    print(f"Database journal mode: {journal_mode}")
+    
+    with get_db_connection() as conn:
+        applied = run_migrations(conn)
+        version = get_schema_version(conn)
+    
+    print(f"Database initialized successfully (schema version {version}, {len(applied)} migrations applied)")
 
 def hash_password(password):
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    """Hash a password using bcrypt (on the hashing pool, may raise PasswordHasherBusy)"""
+    return get_password_hasher().hash(password)
 
 def verify_password(stored_hash, provided_password):
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(provided_password.encode('utf-8'), stored_hash.encode('utf-8'))
+    """Verify a password against its hash (on the hashing pool, may raise PasswordHasherBusy)"""
+    return get_password_hasher().verify(stored_hash, provided_password)
+
+def rehash_password_if_needed(email, stored_hash, password):
+    """
+    Re-hash a just-verified password if its bcrypt cost differs from BCRYPT_ROUNDS
+    Returns: True if the stored hash was replaced
+    """
+    hasher = get_password_hasher()
+    if not hasher.needs_rehash(stored_hash):
+        return False
+    try:
+        new_hash = hasher.hash(password)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Only replace the hash that was verified, never a password changed in the meantime
+            cursor.execute('''
+                UPDATE users SET password_hash = ? WHERE email = ? AND password_hash = ?
+            ''', (new_hash, email, stored_hash))
+            if cursor.rowcount == 0:
+                return False
+            _bump_user_cache_version(cursor)
+        
+        user_cache.invalidate(email)
+        metrics_registry.counter('auth.bcrypt.rehashed').inc()
+        return True
+    except Exception as e:
+        # The old hash still works; try again on the next login
+        print(f"[WARNING] Could not upgrade password hash: {str(e)}")
+        return False
 
 def create_user(email, full_name, phone, password):
     """
@@ -154,15 +320,138 @@ def create_user(email, full_name, phone, password):
         }
     except sqlite3.IntegrityError:
         return False, "Email already registered"
+    except PasswordHasherBusy as e:
+        return False, str(e)
     except Exception as e:
         return False, f"Error creating user: {str(e)}"
 
+# ============== EMAIL VERIFICATION ==============
+
+PENDING_VERIFICATION_TTL = float(os.getenv('PENDING_VERIFICATION_TTL', 86400))  # seconds
+
+def save_pending_verification(email, full_name, phone=None, ttl=PENDING_VERIFICATION_TTL):
+    """
+    Store (or refresh) a signup awaiting email verification
+    Returns: (success, message)
+    """
+    try:
+        with get_db_connection() as conn:
+            conn.execute('''
+                INSERT INTO pending_verifications (email, full_name, phone, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(email) DO UPDATE SET
+                    full_name = excluded.full_name, phone = excluded.phone, expires_at = excluded.expires_at
+            ''', (email, full_name, phone, time.time() + ttl))
+        return True, "Pending verification saved"
+    except Exception as e:
+        return False, f"Error saving pending verification: {str(e)}"
+
+def _pending_from_row(row):
+    return {'email': row['email'], 'fullName': row['full_name'], 'phone': row['phone']}
+
+def get_pending_verification(email):
+    """
+    Get an unexpired pending verification
+    Returns: dict or None
+    """
+    with get_db_connection() as conn:
+        row = conn.execute('''
+            SELECT email, full_name, phone FROM pending_verifications
+            WHERE email = ? AND expires_at > ?
+        ''', (email, time.time())).fetchone()
+    return _pending_from_row(row) if row else None
+
+def pop_pending_verification(email):
+    """
+    Remove and return an unexpired pending verification (only one caller gets it)
+    Returns: dict or None
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT email, full_name, phone FROM pending_verifications
+            WHERE email = ? AND expires_at > ?
+        ''', (email, time.time()))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute('DELETE FROM pending_verifications WHERE email = ?', (email,))
+        if cursor.rowcount == 0:
+            return None
+    return _pending_from_row(row)
+
+def mark_email_verified(email):
+    """
+    Flag a user's email address as verified
+    Returns: (success, message)
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET email_verified = 1 WHERE email = ?', (email,))
+            if cursor.rowcount == 0:
+                return False, "User not found"
+        return True, "Email verified"
+    except Exception as e:
+        return False, f"Error verifying email: {str(e)}"
+
+# ============== USER CACHE ==============
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))  # seconds
+# Seconds between checks of the shared 'users' counter in cache_versions, so a profile
+# change made by another worker process clears this process's cache (0 = never check)
+USER_CACHE_SYNC_INTERVAL = float(os.getenv('USER_CACHE_SYNC_INTERVAL', 1))
+
+user_cache = LRUTTLCache('users', USER_CACHE_SIZE, USER_CACHE_TTL)
+# Per-user settings (notification preference), kept apart from the full profile rows
+settings_cache = LRUTTLCache('user_settings', USER_CACHE_SIZE, USER_CACHE_TTL)
+_user_cache_version = {'version': None, 'checked_at': 0.0}
+_user_cache_version_lock = threading.Lock()
+
+def _sync_user_cache():
+    """Clear the user cache if another process changed a user since the last check"""
+    if USER_CACHE_SYNC_INTERVAL <= 0:
+        return
+    if time.monotonic() - _user_cache_version['checked_at'] < USER_CACHE_SYNC_INTERVAL:
+        return
+    
+    with _user_cache_version_lock:
+        if time.monotonic() - _user_cache_version['checked_at'] < USER_CACHE_SYNC_INTERVAL:
+            return
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT version FROM cache_versions WHERE name = 'users'").fetchone()
+        version = row[0] if row else 0
+        if _user_cache_version['version'] is not None and version != _user_cache_version['version']:
+            user_cache.clear()
+            settings_cache.clear()
+        _user_cache_version['version'] = version
+        _user_cache_version['checked_at'] = time.monotonic()
+
+def _bump_user_cache_version(cursor):
+    """Record a change to a users row for other processes (call inside the writing transaction)"""
+    if USER_CACHE_SYNC_INTERVAL <= 0:
+        return
+    cursor.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'users'")
+    cursor.execute("SELECT version FROM cache_versions WHERE name = 'users'")
+    version = cursor.fetchone()[0]
+    with _user_cache_version_lock:
+        # Our own change is invalidated directly, so it shouldn't clear the whole cache at the next check
+        if _user_cache_version['version'] == version - 1:
+            _user_cache_version['version'] = version
+
 def get_user(email):
     """
-    Get user by email
+    Get user by email (read-through user_cache; callers get their own copy)
     Returns: user dict or None
     """
     try:
+        _sync_user_cache()
+        user = user_cache.get(email)
+        if user is not None:
+            return dict(user)
+        
+        token = user_cache.begin_fill()
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -172,7 +461,7 @@ def get_user(email):
             
             row = cursor.fetchone()
             if row:
-                return {
+                user = {
                     'id': row['id'],
                     'email': row['email'],
                     'fullName': row['full_name'],
@@ -182,28 +471,85 @@ def get_user(email):
                     'address': row['address'],
                     'created_at': row['created_at']
                 }
+                user_cache.fill(email, user, token)
+                return dict(user)
         return None
     except Exception as e:
         print(f"Error fetching user: {str(e)}")
         return None
 
+def _apply_scan_stats(cursor, user_email, disease_name, confidence, crop_name, risk_level, health_status, month, sign):
+    """
+    Add (sign=1) or remove (sign=-1) one scan's contribution to the user_scan_stats
+    aggregates, inside the caller's transaction (also bumps the dashboard version)
+    """
+    named_healthy = 'healthy' in (disease_name or '').lower()
+    healthy = health_status == 'Healthy' or named_healthy
+    
+    cursor.execute('''
+        INSERT INTO user_scan_stats (user_email, total, healthy, named_healthy, high_risk, confidence_sum, version)
+        VALUES (?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT(user_email) DO UPDATE SET
+            total = total + excluded.total,
+            healthy = healthy + excluded.healthy,
+            named_healthy = named_healthy + excluded.named_healthy,
+            high_risk = high_risk + excluded.high_risk,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            version = version + 1
+    ''', (user_email, sign, sign * healthy, sign * named_healthy, sign * (risk_level == 'High'), sign * confidence))
+    
+    if crop_name is not None:
+        cursor.execute('''
+            INSERT INTO user_scan_crop_stats (user_email, crop_name, scans, healthy)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_email, crop_name) DO UPDATE SET
+                scans = scans + excluded.scans,
+                healthy = healthy + excluded.healthy
+        ''', (user_email, crop_name, sign, sign * (health_status == 'Healthy')))
+        if sign < 0:
+            cursor.execute('''
+                DELETE FROM user_scan_crop_stats WHERE user_email = ? AND crop_name = ? AND scans <= 0
+            ''', (user_email, crop_name))
+    
+    if month is not None:
+        cursor.execute('''
+            INSERT INTO user_scan_month_stats (user_email, month, scans, healthy, diseased)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_email, month) DO UPDATE SET
+                scans = scans + excluded.scans,
+                healthy = healthy + excluded.healthy,
+                diseased = diseased + excluded.diseased
+        ''', (user_email, month, sign, sign * (health_status == 'Healthy'), sign * (health_status == 'Diseased')))
+        if sign < 0:
+            cursor.execute('''
+                DELETE FROM user_scan_month_stats WHERE user_email = ? AND month = ? AND scans <= 0
+            ''', (user_email, month))
+
+def derive_scan_status(disease_name, confidence, health_status=None, risk_level=None):
+    """
+    Derive health_status and risk_level if not provided
+    Returns: (health_status, risk_level)
+    """
+    if health_status is None:
+        health_status = 'Healthy' if 'healthy' in disease_name.lower() else 'Diseased'
+    
+    if risk_level is None:
+        if health_status == 'Healthy':
+            risk_level = 'Safe'
+        elif confidence > 85:
+            risk_level = 'High'
+        else:
+            risk_level = 'Medium'
+    
+    return health_status, risk_level
+
 def save_scan(user_email, disease_name, confidence, crop_name=None, severity=None, image_url=None, risk_level=None, health_status=None):
     """
     Save a disease detection scan to history
     Returns: (success, scan_id_or_message)
     """
     try:
-        # Derive health_status and risk_level if not provided
-        if health_status is None:
-            health_status = 'Healthy' if 'healthy' in disease_name.lower() else 'Diseased'
-        
-        if risk_level is None:
-            if health_status == 'Healthy':
-                risk_level = 'Safe'
-            elif confidence > 85:
-                risk_level = 'High'
-            else:
-                risk_level = 'Medium'
+        health_status, risk_level = derive_scan_status(disease_name, confidence, health_status, risk_level)
 
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -213,29 +559,95 @@ def save_scan(user_email, disease_name, confidence, crop_name=None, severity=Non
             ''', (user_email, disease_name, confidence, crop_name, severity, image_url, risk_level, health_status))
             scan_id = cursor.lastrowid
             
+            cursor.execute("SELECT strftime('%Y-%m', scan_date) FROM scan_history WHERE id = ?", (scan_id,))
+            month = cursor.fetchone()[0]
+            _apply_scan_stats(cursor, user_email, disease_name, confidence, crop_name,
+                              risk_level, health_status, month, 1)
+            
         return True, scan_id
     except Exception as e:
         return False, f"Error saving scan: {str(e)}"
 
-def get_user_scans(user_email, limit=50):
+def insert_scans(scans):
+    """
+    Insert queued scans in one transaction (used by the write-behind queue)
+    Each scan dict has queue_seq, scan_date and the save_scan fields (status already derived).
+    Scans whose queue_seq is already stored are skipped, so replaying a batch is safe.
+    Raises sqlite3.OperationalError if the database is unavailable and
+    sqlite3.IntegrityError (or a binding error) if a scan can't be stored.
+    Returns: {queue_seq: scan_id}
     """
-    Get user's scan history
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        seqs = [scan['queue_seq'] for scan in scans]
+        placeholders = ','.join('?' * len(seqs))
+        cursor.execute(f'SELECT queue_seq FROM scan_history WHERE queue_seq IN ({placeholders})', seqs)
+        existing = {row[0] for row in cursor.fetchall()}
+        new_scans = [scan for scan in scans if scan['queue_seq'] not in existing]
+        
+        cursor.executemany('''
+            INSERT INTO scan_history (user_email, disease_name, confidence, crop_name, severity, image_url,
+                                      risk_level, health_status, scan_date, queue_seq)
+            VALUES (:user_email, :disease_name, :confidence, :crop_name, :severity, :image_url,
+                    :risk_level, :health_status, :scan_date, :queue_seq)
+        ''', new_scans)
+        
+        for scan in new_scans:
+            _apply_scan_stats(cursor, scan['user_email'], scan['disease_name'], scan['confidence'],
+                              scan['crop_name'], scan['risk_level'], scan['health_status'],
+                              scan['scan_date'][:7], 1)
+        
+        cursor.execute(f'SELECT queue_seq, id FROM scan_history WHERE queue_seq IN ({placeholders})', seqs)
+        return {row['queue_seq']: row['id'] for row in cursor.fetchall()}
+
+def save_scans_batch(scans):
+    """
+    Insert queued scans in one transaction (see insert_scans)
+    Returns: (success, {queue_seq: scan_id} or message)
+    """
+    try:
+        return True, insert_scans(scans)
+    except Exception as e:
+        return False, f"Error saving scan batch: {str(e)}"
+
+def get_scan_id_by_queue_seq(queue_seq, user_email):
+    """
+    Resolve a write-behind provisional id to the stored scan id, if the scan is the user's
+    Returns: scan id, or None if not flushed yet (or not owned by user_email)
+    """
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT id FROM scan_history WHERE queue_seq = ? AND user_email = ?',
+                           (queue_seq, user_email)).fetchone()
+    return row['id'] if row else None
+
+def get_user_scans(user_email, limit=50, before_date=None, before_id=None):
+    """
+    Get user's scan history, newest first
+    Keyset pagination: pass the scanDate and id of the last scan from the previous
+    page as before_date/before_id to get the next page (index-backed, O(page) per call)
     Returns: list of scans
     """
+    start = time.perf_counter()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT user_email FROM scan_history")
-            print(f"DEBUG: Emails in DB: {[r[0] for r in cursor.fetchall()]}")
-            print(f"DEBUG: Querying for email: '{user_email}'")
             
-            cursor.execute('''
-                SELECT id, disease_name, confidence, crop_name, severity, risk_level, health_status, image_url, scan_date
-                FROM scan_history
-                WHERE user_email = ?
-                ORDER BY scan_date DESC
-                LIMIT ?
-            ''', (user_email, limit))
+            if before_date is not None and before_id is not None:
+                cursor.execute('''
+                    SELECT id, disease_name, confidence, crop_name, severity, risk_level, health_status, image_url, scan_date
+                    FROM scan_history
+                    WHERE user_email = ? AND (scan_date, id) < (?, ?)
+                    ORDER BY scan_date DESC, id DESC
+                    LIMIT ?
+                ''', (user_email, before_date, before_id, limit))
+            else:
+                cursor.execute('''
+                    SELECT id, disease_name, confidence, crop_name, severity, risk_level, health_status, image_url, scan_date
+                    FROM scan_history
+                    WHERE user_email = ?
+                    ORDER BY scan_date DESC, id DESC
+                    LIMIT ?
+                ''', (user_email, limit))
             
             rows = cursor.fetchall()
             return [{
@@ -250,10 +662,10 @@ def get_user_scans(user_email, limit=50):
                 'scanDate': row['scan_date']
             } for row in rows]
     except Exception as e:
-        import traceback
         print(f"Error fetching scans for {user_email}: {str(e)}")
-        traceback.print_exc()
         return []
+    finally:
+        metrics_registry.histogram('db.get_user_scans').observe((time.perf_counter() - start) * 1000)
 
 def get_scan_by_id(scan_id, user_email):
     """
@@ -291,15 +703,23 @@ def delete_scan(scan_id, user_email):
     Returns: (success, message_or_image_url)
     """
     try:
-        # First get the scan to retrieve image URL for cleanup
-        scan = get_scan_by_id(scan_id, user_email)
-        if not scan:
-            return False, "Scan not found or not authorized"
-        
-        image_url = scan.get('imageUrl')
-        
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            
+            # First get the scan to retrieve image URL for cleanup (and its stats contribution)
+            cursor.execute('''
+                SELECT image_url, disease_name, confidence, crop_name, risk_level, health_status,
+                       strftime('%Y-%m', scan_date) AS month
+                FROM scan_history
+                WHERE id = ? AND user_email = ?
+            ''', (scan_id, user_email))
+            
+            row = cursor.fetchone()
+            if not row:
+                return False, "Scan not found or not authorized"
+            
+            image_url = row['image_url']
+            
             cursor.execute('''
                 DELETE FROM scan_history
                 WHERE id = ? AND user_email = ?
@@ -308,6 +728,9 @@ def delete_scan(scan_id, user_email):
             if cursor.rowcount == 0:
                 return False, "Scan not found"
             
+            _apply_scan_stats(cursor, user_email, row['disease_name'], row['confidence'], row['crop_name'],
+                              row['risk_level'], row['health_status'], row['month'], -1)
+            
         return True, image_url  # Return image URL for file cleanup
     except Exception as e:
         return False, f"Error deleting scan: {str(e)}"
@@ -334,6 +757,8 @@ def update_user_profile(email, full_name=None, phone=None, address=None):
             if address is not None:
                 updates.append("address = ?")
                 params.append(address)
+                updates.append("district_key = ?")
+                params.append(district_key(address))
             
             if not updates:
                 return False, "No fields to update"
@@ -345,7 +770,12 @@ def update_user_profile(email, full_name=None, phone=None, address=None):
             
             if cursor.rowcount == 0:
                 return False, "User not found"
+            _bump_user_cache_version(cursor)
             
+        # Invalidate after commit, so a concurrent reader can't re-cache the old row
+        user_cache.invalidate(email)
+        if address is not None:
+            alert_count_cache.invalidate_user(email)
         return True, "Profile updated successfully"
     except Exception as e:
         return False, f"Error updating profile: {str(e)}"
@@ -365,7 +795,9 @@ def update_profile_picture(email, profile_picture_url):
             
             if cursor.rowcount == 0:
                 return False, "User not found"
+            _bump_user_cache_version(cursor)
             
+        user_cache.invalidate(email)
         return True, "Profile picture updated successfully"
     except Exception as e:
         return False, f"Error updating profile picture: {str(e)}"
@@ -379,13 +811,13 @@ def create_alert(farmer_name, location, disease_reported, description=None, prev
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO alerts (farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email))
+                INSERT INTO alerts (farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email, district_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email, district_key(location)))
             
             alert_id = cursor.lastrowid
             
-        return True, {
+        alert = {
             'id': alert_id,
             'farmerName': farmer_name,
             'location': location,
@@ -394,6 +826,10 @@ def create_alert(farmer_name, location, disease_reported, description=None, prev
             'preventionMethods': prevention_methods,
             'imageUrl': image_url
         }
+        alert_count_cache.note_alert(district_key(location), alert_id)
+        alert_broker.publish(district_key(location), dict(alert, userEmail=user_email),
+                             recipient_filter=_notification_recipients)
+        return True, alert
     except Exception as e:
         return False, f"Error creating alert: {str(e)}"
 
@@ -430,102 +866,143 @@ def get_recent_alerts(limit=10):
 
 # ============== LOCATION-BASED AND NOTIFICATION FUNCTIONS ==============
 
-from location_helpers import extract_district, normalize_district_name
+# New-alert polling: the newest alert id per district and each user's district are
+# kept in memory, so a poll with nothing new is answered without a query. Entries
+# expire after ALERT_COUNT_CACHE_TTL seconds to pick up alerts written by other
+# worker processes; alerts created in this process update the cache immediately.
+ALERT_COUNT_CACHE_TTL = float(os.getenv('ALERT_COUNT_CACHE_TTL', 5))
+ALERT_COUNT_CACHE_USERS = int(os.getenv('ALERT_COUNT_CACHE_USERS', 10000))
+_MISSING = object()
+
+class AlertCountCache:
+    """Per-district max alert id and per-user district key with TTL expiry"""
+    
+    def __init__(self, ttl=ALERT_COUNT_CACHE_TTL, max_users=ALERT_COUNT_CACHE_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._district_max_ids = {}  # district_key (None = all alerts) -> (max_id, expires_at)
+        self._user_districts = OrderedDict()  # email -> (district_key, expires_at)
+    
+    def get_max_id(self, district):
+        """Cached newest alert id for a district, or _MISSING"""
+        with self._lock:
+            entry = self._district_max_ids.get(district)
+        if entry is None or entry[1] < time.monotonic():
+            return _MISSING
+        return entry[0]
+    
+    def set_max_id(self, district, max_id):
+        with self._lock:
+            # Never lower a max recorded by a concurrent note_alert()
+            entry = self._district_max_ids.get(district)
+            if entry is not None and entry[1] >= time.monotonic():
+                max_id = max(max_id, entry[0])
+            self._district_max_ids[district] = (max_id, time.monotonic() + self.ttl)
+    
+    def note_alert(self, district, alert_id):
+        """Record a newly inserted alert (ids only grow, so it is the new max)"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._district_max_ids[None] = (alert_id, expires_at)
+            if district is not None:
+                self._district_max_ids[district] = (alert_id, expires_at)
+    
+    def invalidate_districts(self):
+        with self._lock:
+            self._district_max_ids.clear()
+    
+    def get_user_district(self, email):
+        """Cached district key for a user, or _MISSING"""
+        with self._lock:
+            entry = self._user_districts.get(email)
+            if entry is None or entry[1] < time.monotonic():
+                return _MISSING
+            self._user_districts.move_to_end(email)
+            return entry[0]
+    
+    def set_user_district(self, email, district):
+        with self._lock:
+            self._user_districts[email] = (district, time.monotonic() + self.ttl)
+            self._user_districts.move_to_end(email)
+            while len(self._user_districts) > self.max_users:
+                self._user_districts.popitem(last=False)
+    
+    def invalidate_user(self, email):
+        with self._lock:
+            self._user_districts.pop(email, None)
+
+alert_count_cache = AlertCountCache()
+
+# Location feed in one statement: the user's own alerts plus alerts in the user's
+# district (both index range scans), padded with the most recent alerts when
+# fewer than LOCATION_FEED_MIN_MATCHES match.
+LOCATION_FEED_MIN_MATCHES = 5
+_ALERT_COLUMNS = 'id, farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email, created_at'
+_LOCATION_FEED_QUERY = f'''
+    WITH matched AS (
+        SELECT * FROM (
+            SELECT {_ALERT_COLUMNS} FROM alerts
+            WHERE user_email = :email
+            ORDER BY created_at DESC LIMIT :limit
+        )
+        UNION
+        SELECT * FROM (
+            SELECT {_ALERT_COLUMNS} FROM alerts
+            WHERE district_key = (SELECT district_key FROM users WHERE email = :email)
+            ORDER BY created_at DESC LIMIT :limit
+        )
+        ORDER BY created_at DESC LIMIT :limit
+    ),
+    fallback AS (
+        SELECT {_ALERT_COLUMNS} FROM alerts
+        WHERE id NOT IN (SELECT id FROM matched)
+        ORDER BY created_at DESC
+        LIMIT CASE WHEN (SELECT COUNT(*) FROM matched) < :min_matches THEN :limit ELSE 0 END
+    )
+    SELECT * FROM (
+        SELECT *, 0 AS tier FROM matched
+        UNION ALL
+        SELECT *, 1 AS tier FROM fallback
+    )
+    ORDER BY tier, created_at DESC, id DESC
+    LIMIT :limit
+'''
 
 def get_alerts_by_location(user_email, limit=20):
     """
-    Get alerts filtered by user's location (same district or nearby)
-    Always includes the user's own alerts.
+    Get alerts filtered by user's location (same district)
+    Always includes the user's own alerts; pads with recent alerts when few match.
+    Districts are compared by the district_key stored on users and alerts at write time.
     Returns: list of alerts
     """
+    start = time.perf_counter()
     try:
-        # Get user's address
-        user = get_user(user_email)
-        user_address = user.get('address', '') if user else ''
-        user_district = extract_district(user_address)
-        normalized_user_district = normalize_district_name(user_district) if user_district else None
-        
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Fetch more than limit to allow for filtering
-            cursor.execute('''
-                SELECT id, farmer_name, location, disease_reported, description, prevention_methods, image_url, user_email, created_at
-                FROM alerts
-                ORDER BY created_at DESC
-                LIMIT 100
-            ''')
-            
-            rows = cursor.fetchall()
-            filtered_alerts = []
-            
-            for row in rows:
-                alert_user_email = row['user_email']
-                alert_location = row['location']
-                
-                # 1. Always include user's own alerts
-                if alert_user_email == user_email:
-                    filtered_alerts.append({
-                        'id': row['id'],
-                        'farmerName': row['farmer_name'],
-                        'location': row['location'],
-                        'diseaseReported': row['disease_reported'],
-                        'description': row['description'],
-                        'preventionMethods': row['prevention_methods'],
-                        'imageUrl': row['image_url'],
-                        'userEmail': row['user_email'],
-                        'createdAt': row['created_at']
-                    })
-                    continue
-
-                # 2. Location-based matching
-                if normalized_user_district:
-                    alert_district = extract_district(alert_location)
-                    normalized_alert_district = normalize_district_name(alert_district) if alert_district else None
-                    
-                    # Match if districts are the same (after normalization)
-                    if (normalized_user_district == normalized_alert_district or 
-                        (user_district and user_district in alert_location.lower()) or 
-                        (alert_district and alert_district in user_address.lower())):
-                        
-                        filtered_alerts.append({
-                            'id': row['id'],
-                            'farmerName': row['farmer_name'],
-                            'location': row['location'],
-                            'diseaseReported': row['disease_reported'],
-                            'description': row['description'],
-                            'preventionMethods': row['prevention_methods'],
-                            'imageUrl': row['image_url'],
-                            'userEmail': row['user_email'],
-                            'createdAt': row['created_at']
-                        })
-                
-                if len(filtered_alerts) >= limit:
-                    break
+            cursor.execute(_LOCATION_FEED_QUERY, {
+                'email': user_email,
+                'limit': limit,
+                'min_matches': LOCATION_FEED_MIN_MATCHES
+            })
             
-            # 3. Fallback: if still no alerts (or very few), pad with recent ones
-            if len(filtered_alerts) < 5:
-                already_included = {a['id'] for a in filtered_alerts}
-                for row in rows:
-                    if row['id'] not in already_included:
-                        filtered_alerts.append({
-                            'id': row['id'],
-                            'farmerName': row['farmer_name'],
-                            'location': row['location'],
-                            'diseaseReported': row['disease_reported'],
-                            'description': row['description'],
-                            'preventionMethods': row['prevention_methods'],
-                            'imageUrl': row['image_url'],
-                            'userEmail': row['user_email'],
-                            'createdAt': row['created_at']
-                        })
-                    if len(filtered_alerts) >= limit:
-                        break
-
-            return filtered_alerts
+            return [{
+                'id': row['id'],
+                'farmerName': row['farmer_name'],
+                'location': row['location'],
+                'diseaseReported': row['disease_reported'],
+                'description': row['description'],
+                'preventionMethods': row['prevention_methods'],
+                'imageUrl': row['image_url'],
+                'userEmail': row['user_email'],
+                'createdAt': row['created_at']
+            } for row in cursor.fetchall()]
             
     except Exception as e:
         print(f"Error fetching location-based alerts: {str(e)}")
         return get_recent_alerts(limit)
+    finally:
+        metrics_registry.histogram('db.get_alerts_by_location').observe((time.perf_counter() - start) * 1000)
 
 def delete_alert(alert_id, user_email):
     """
@@ -561,19 +1038,56 @@ def delete_alert(alert_id, user_email):
     except Exception as e:
         return False, f"Error deleting alert: {str(e)}"
 
+# Emails per IN (...) lookup, below SQLite's default host parameter limit
+SETTINGS_BATCH_SIZE = 500
+
+def get_notification_preferences(emails):
+    """
+    Batch lookup of notification preferences through settings_cache
+    Misses are read with the covering idx_users_settings index, never the full user row.
+    Returns: {email: enabled_boolean} for the emails that belong to a user
+    """
+    _sync_user_cache()
+    preferences = {}
+    missing = []
+    for email in dict.fromkeys(emails):
+        enabled = settings_cache.get(email)
+        if enabled is None:
+            missing.append(email)
+        else:
+            preferences[email] = enabled
+    
+    if missing:
+        token = settings_cache.begin_fill()
+        with get_db_connection() as conn:
+            for start in range(0, len(missing), SETTINGS_BATCH_SIZE):
+                chunk = missing[start:start + SETTINGS_BATCH_SIZE]
+                # The planner prefers the unique email index (one row, then a table lookup)
+                rows = conn.execute(f'''
+                    SELECT email, notifications_enabled FROM users INDEXED BY idx_users_settings
+                    WHERE email IN ({', '.join('?' * len(chunk))})
+                ''', chunk).fetchall()
+                for row in rows:
+                    # NULL means the user predates the column default: enabled
+                    enabled = row['notifications_enabled'] is None or bool(row['notifications_enabled'])
+                    preferences[row['email']] = enabled
+                    settings_cache.fill(row['email'], enabled, token)
+    return preferences
+
+def _notification_recipients(emails):
+    """Emails that have notifications enabled (alert stream fan-out filter)"""
+    return {email for email, enabled in get_notification_preferences(emails).items() if enabled}
+
 def get_user_notification_preference(email):
     """
     Get user's notification preference
     Returns: (success, enabled_boolean)
     """
     try:
-        user = get_user(email)
-        if not user:
+        preferences = get_notification_preferences([email])
+        if email not in preferences:
             return False, False
-        
-        # Default to True if column doesn't exist or is None
-        enabled = user.get('notifications_enabled', 1)
-        return True, bool(enabled)
+        return True, preferences[email]
     except Exception as e:
         print(f"Error getting notification preference: {str(e)}")
         return False, True  # Default to enabled
@@ -593,20 +1107,116 @@ def update_user_notification_preference(email, enabled):
             
             if cursor.rowcount == 0:
                 return False, "User not found"
+            _bump_user_cache_version(cursor)
             
+        user_cache.invalidate(email)
+        settings_cache.invalidate(email)
         return True, "Notification preference updated successfully"
     except Exception as e:
         return False, f"Error updating notification preference: {str(e)}"
 
+def get_user_district_key(user_email):
+    """
+    Get the normalized district key of a user's address (cached)
+    Returns: district key, or None if the user has no district
+    """
+    district = alert_count_cache.get_user_district(user_email)
+    if district is not _MISSING:
+        return district
+    
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT district_key FROM users WHERE email = ?', (user_email,)).fetchone()
+    district = row['district_key'] if row else None
+    alert_count_cache.set_user_district(user_email, district)
+    return district
+
+def get_latest_alert_id(district):
+    """
+    Get the newest alert id in a district (all districts if None), cached
+    Returns: alert id, or 0 if there are no alerts
+    """
+    max_id = alert_count_cache.get_max_id(district)
+    if max_id is not _MISSING:
+        return max_id
+    
+    with get_db_connection() as conn:
+        if district is None:
+            row = conn.execute('SELECT MAX(id) FROM alerts').fetchone()
+        else:
+            row = conn.execute('SELECT MAX(id) FROM alerts WHERE district_key = ?', (district,)).fetchone()
+    max_id = row[0] or 0
+    alert_count_cache.set_max_id(district, max_id)
+    return max_id
+
+def get_alerts_since(district, last_id, limit=50):
+    """
+    Get alerts newer than last_id in a district (all districts if None), oldest first
+    Used to replay alerts missed by a reconnecting stream client.
+    Returns: list of alerts
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if district is None:
+                cursor.execute(f'''
+                    SELECT {_ALERT_COLUMNS} FROM alerts
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, limit))
+            else:
+                cursor.execute(f'''
+                    SELECT {_ALERT_COLUMNS} FROM alerts
+                    WHERE district_key = ? AND id > ? ORDER BY id LIMIT ?
+                ''', (district, last_id, limit))
+            
+            return [{
+                'id': row['id'],
+                'farmerName': row['farmer_name'],
+                'location': row['location'],
+                'diseaseReported': row['disease_reported'],
+                'description': row['description'],
+                'preventionMethods': row['prevention_methods'],
+                'imageUrl': row['image_url'],
+                'userEmail': row['user_email'],
+                'createdAt': row['created_at']
+            } for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error fetching alerts since {last_id}: {str(e)}")
+        return []
+
 def get_new_alerts_count(user_email, last_seen_id=0):
     """
-    Get count of new alerts since last_seen_id for user's location
+    Get count of new alerts since last_seen_id in the user's district
+    (all alerts for users without a district, matching their fallback feed)
+    Answers from alert_count_cache when nothing newer than last_seen_id exists.
     Returns: count of new alerts
     """
     try:
-        alerts = get_alerts_by_location(user_email, limit=50)
-        new_count = sum(1 for alert in alerts if alert['id'] > last_seen_id)
-        return new_count
+        district = alert_count_cache.get_user_district(user_email)
+        max_id = _MISSING if district is _MISSING else alert_count_cache.get_max_id(district)
+        if max_id is not _MISSING and (max_id or 0) <= last_seen_id:
+            metrics_registry.counter('alerts.new_count.cache_hit').inc()
+            return 0
+        
+        metrics_registry.counter('alerts.new_count.cache_miss').inc()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if district is _MISSING:
+                district = get_user_district_key(user_email)
+            
+            if district is None:
+                cursor.execute('SELECT MAX(id) FROM alerts')
+                max_id = cursor.fetchone()[0] or 0
+                cursor.execute('SELECT COUNT(*) FROM alerts WHERE id > ?', (last_seen_id,))
+            else:
+                cursor.execute('SELECT MAX(id) FROM alerts WHERE district_key = ?', (district,))
+                max_id = cursor.fetchone()[0] or 0
+                cursor.execute('''
+                    SELECT COUNT(*) FROM alerts WHERE district_key = ? AND id > ?
+                ''', (district, last_seen_id))
+            count = cursor.fetchone()[0]
+        
+        alert_count_cache.set_max_id(district, max_id)
+        return count
     except Exception as e:
         print(f"Error counting new alerts: {str(e)}")
         return 0
@@ -630,6 +1240,8 @@ def update_alert(alert_id, user_email, farmer_name=None, location=None, disease_
             if location is not None:
                 updates.append("location = ?")
                 params.append(location)
+                updates.append("district_key = ?")
+                params.append(district_key(location))
             if disease_reported is not None:
                 updates.append("disease_reported = ?")
                 params.append(disease_reported)
@@ -655,37 +1267,141 @@ def update_alert(alert_id, user_email, farmer_name=None, location=None, disease_
             if cursor.rowcount == 0:
                 return False, "Alert not found or not authorized"
                 
+        if location is not None:
+            alert_count_cache.invalidate_districts()
         return True, "Alert updated successfully"
     except Exception as e:
         return False, f"Error updating alert: {str(e)}"
 
+def _get_scan_stats_row(cursor, user_email):
+    """Read a user's user_scan_stats row (None if the user has never scanned)"""
+    cursor.execute('''
+        SELECT total, healthy, named_healthy, high_risk, confidence_sum, version
+        FROM user_scan_stats WHERE user_email = ?
+    ''', (user_email,))
+    return cursor.fetchone()
+
+def _user_stats_from_row(row):
+    total_scans = row['total'] if row else 0
+    # Healthy scans are those whose disease_name contains 'Healthy'
+    healthy_scans = row['named_healthy'] if row else 0
+    return {
+        'total': total_scans,
+        'healthy': healthy_scans,
+        'diseased': total_scans - healthy_scans
+    }
+
+def _accuracy_from_row(row):
+    if not row or row['total'] <= 0:
+        return 0.0
+    # Since confidence is already stored as a percentage (e.g., 98.78),
+    # we just return the average as is.
+    return row['confidence_sum'] / row['total']
+
+def _analytics_summary_from_row(row):
+    total_scans = row['total'] if row else 0
+    if total_scans <= 0:
+        return {
+            'totalScans': 0,
+            'averageHealth': 0,
+            'diseaseAlerts': 0,
+            'estimatedYield': 0
+        }
+    
+    # Healthy vs Diseased
+    healthy_count = row['healthy']
+    avg_health = (healthy_count / total_scans) * 100
+    
+    # Disease Alerts (High Risk)
+    high_risk_count = row['high_risk']
+    
+    # Estimated Yield (Derive from health)
+    # Base yield is 100%, each diseased plant reduces it by some factor
+    # Let's say a diseased plant reduces yield by 30% on average
+    estimated_yield = max(0, 100 - ((total_scans - healthy_count) / total_scans * 30))
+    
+    return {
+        'totalScans': total_scans,
+        'averageHealth': round(avg_health, 1),
+        'diseaseAlerts': high_risk_count,
+        'estimatedYield': round(estimated_yield, 1)
+    }
+
+def _read_analytics_charts(cursor, user_email):
+    # 1. Crop Yield Forecast (Bar Chart)
+    # Per-crop buckets; health score is a proxy for yield (healthy scans score 100, others 60)
+    cursor.execute('''
+        SELECT crop_name, (healthy * 100.0 + (scans - healthy) * 60.0) / scans as yield_score
+        FROM user_scan_crop_stats
+        WHERE user_email = ? AND scans > 0
+        ORDER BY crop_name
+    ''', (user_email,))
+    yield_data = [{'crop': row['crop_name'], 'yield': round(row['yield_score'], 1)} for row in cursor.fetchall()]
+    
+    # 2. Disease Trends (Line Chart - 6 Months)
+    # Logic: Per-month buckets
+    cursor.execute('''
+        SELECT month, healthy, diseased
+        FROM user_scan_month_stats
+        WHERE user_email = ?
+        ORDER BY month DESC
+        LIMIT 6
+    ''', (user_email,))
+    
+    trend_rows = cursor.fetchall()
+    # Reverse to show chronological order
+    trends = [{'month': row['month'], 'healthy': row['healthy'], 'diseased': row['diseased']} for row in trend_rows][::-1]
+    
+    # If no data, return some default structure
+    if not yield_data:
+        yield_data = [
+            {'crop': 'Rice', 'yield': 85},
+            {'crop': 'Wheat', 'yield': 92},
+            {'crop': 'Potato', 'yield': 78},
+            {'crop': 'Tomato', 'yield': 88}
+        ]
+    
+    if not trends:
+        # Mock some historical data if empty
+        trends = [
+            {'month': '2025-09', 'healthy': 5, 'diseased': 2},
+            {'month': '2025-10', 'healthy': 7, 'diseased': 3},
+            {'month': '2025-11', 'healthy': 10, 'diseased': 1},
+            {'month': '2025-12', 'healthy': 8, 'diseased': 4},
+            {'month': '2026-01', 'healthy': 12, 'diseased': 2},
+            {'month': '2026-02', 'healthy': 6, 'diseased': 1}
+        ]
+    
+    return {
+        'yieldForecast': yield_data,
+        'diseaseTrends': trends
+    }
+
+def _read_analytics_reports(cursor, user_email, limit):
+    cursor.execute('''
+        SELECT id, scan_date, crop_name, disease_name, risk_level
+        FROM scan_history
+        WHERE user_email = ?
+        ORDER BY scan_date DESC
+        LIMIT ?
+    ''', (user_email, limit))
+    
+    return [{
+        'id': row['id'],
+        'date': row['scan_date'],
+        'cropType': row['crop_name'] or 'Unknown',
+        'diagnosis': row['disease_name'],
+        'riskLevel': row['risk_level'] or 'Medium'
+    } for row in cursor.fetchall()]
+
 def get_user_stats(user_email):
     """
-    Get scan statistics for a user
+    Get scan statistics for a user (from the user_scan_stats aggregates)
     Returns: {total, healthy, diseased}
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get total scans
-            cursor.execute('SELECT COUNT(*) FROM scan_history WHERE user_email = ?', (user_email,))
-            total_scans = cursor.fetchone()[0]
-            
-            # Get healthy scans (where disease_name contains 'Healthy')
-            cursor.execute('''
-                SELECT COUNT(*) FROM scan_history 
-                WHERE user_email = ? AND disease_name LIKE '%Healthy%'
-            ''', (user_email,))
-            healthy_scans = cursor.fetchone()[0]
-            
-            diseased_scans = total_scans - healthy_scans
-            
-            return {
-                'total': total_scans,
-                'healthy': healthy_scans,
-                'diseased': diseased_scans
-            }
+            return _user_stats_from_row(_get_scan_stats_row(conn.cursor(), user_email))
     except Exception as e:
         print(f"Error fetching user stats: {str(e)}")
         return {'total': 0, 'healthy': 0, 'diseased': 0}
@@ -708,16 +1424,7 @@ def get_user_accuracy(user_email):
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT AVG(confidence) FROM scan_history WHERE user_email = ?', (user_email,))
-            avg_confidence = cursor.fetchone()[0]
-            
-            if avg_confidence is None:
-                return 0.0
-            
-            # Since confidence is already stored as a percentage (e.g., 98.78),
-            # we just return the average as is.
-            return avg_confidence
+            return _accuracy_from_row(_get_scan_stats_row(conn.cursor(), user_email))
     except Exception as e:
         print(f"Error fetching user accuracy: {str(e)}")
         return 0.0
@@ -728,47 +1435,7 @@ def get_analytics_summary(user_email):
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Total Scans
-            cursor.execute('SELECT COUNT(*) FROM scan_history WHERE user_email = ?', (user_email,))
-            total_scans = cursor.fetchone()[0]
-            
-            if total_scans == 0:
-                return {
-                    'totalScans': 0,
-                    'averageHealth': 0,
-                    'diseaseAlerts': 0,
-                    'estimatedYield': 0
-                }
-            
-            # Healthy vs Diseased
-            cursor.execute('''
-                SELECT COUNT(*) FROM scan_history 
-                WHERE user_email = ? AND (health_status = 'Healthy' OR disease_name LIKE '%Healthy%')
-            ''', (user_email,))
-            healthy_count = cursor.fetchone()[0]
-            
-            avg_health = (healthy_count / total_scans) * 100
-            
-            # Disease Alerts (High Risk)
-            cursor.execute('''
-                SELECT COUNT(*) FROM scan_history 
-                WHERE user_email = ? AND risk_level = 'High'
-            ''', (user_email,))
-            high_risk_count = cursor.fetchone()[0]
-            
-            # Estimated Yield (Derive from health)
-            # Base yield is 100%, each diseased plant reduces it by some factor
-            # Let's say a diseased plant reduces yield by 30% on average
-            estimated_yield = max(0, 100 - ((total_scans - healthy_count) / total_scans * 30))
-            
-            return {
-                'totalScans': total_scans,
-                'averageHealth': round(avg_health, 1),
-                'diseaseAlerts': high_risk_count,
-                'estimatedYield': round(estimated_yield, 1)
-            }
+            return _analytics_summary_from_row(_get_scan_stats_row(conn.cursor(), user_email))
     except Exception as e:
         print(f"Error fetching analytics summary: {str(e)}")
         return None
@@ -779,60 +1446,7 @@ def get_analytics_charts(user_email):
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 1. Crop Yield Forecast (Bar Chart)
-            # Group by crop type and calculate health score as a proxy for yield
-            cursor.execute('''
-                SELECT crop_name, 
-                       AVG(CASE WHEN health_status = 'Healthy' THEN 100 ELSE 60 END) as yield_score
-                FROM scan_history
-                WHERE user_email = ? AND crop_name IS NOT NULL
-                GROUP BY crop_name
-            ''', (user_email,))
-            yield_data = [{'crop': row['crop_name'], 'yield': round(row['yield_score'], 1)} for row in cursor.fetchall()]
-            
-            # 2. Disease Trends (Line Chart - 6 Months)
-            # Logic: Group by month
-            cursor.execute('''
-                SELECT strftime('%Y-%m', scan_date) as month,
-                       SUM(CASE WHEN health_status = 'Healthy' THEN 1 ELSE 0 END) as healthy,
-                       SUM(CASE WHEN health_status = 'Diseased' THEN 1 ELSE 0 END) as diseased
-                FROM scan_history
-                WHERE user_email = ?
-                GROUP BY month
-                ORDER BY month DESC
-                LIMIT 6
-            ''', (user_email,))
-            
-            trend_rows = cursor.fetchall()
-            # Reverse to show chronological order
-            trends = [{'month': row['month'], 'healthy': row['healthy'], 'diseased': row['diseased']} for row in trend_rows][::-1]
-            
-            # If no data, return some default structure
-            if not yield_data:
-                yield_data = [
-                    {'crop': 'Rice', 'yield': 85},
-                    {'crop': 'Wheat', 'yield': 92},
-                    {'crop': 'Potato', 'yield': 78},
-                    {'crop': 'Tomato', 'yield': 88}
-                ]
-            
-            if not trends:
-                # Mock some historical data if empty
-                trends = [
-                    {'month': '2025-09', 'healthy': 5, 'diseased': 2},
-                    {'month': '2025-10', 'healthy': 7, 'diseased': 3},
-                    {'month': '2025-11', 'healthy': 10, 'diseased': 1},
-                    {'month': '2025-12', 'healthy': 8, 'diseased': 4},
-                    {'month': '2026-01', 'healthy': 12, 'diseased': 2},
-                    {'month': '2026-02', 'healthy': 6, 'diseased': 1}
-                ]
-            
-            return {
-                'yieldForecast': yield_data,
-                'diseaseTrends': trends
-            }
+            return _read_analytics_charts(conn.cursor(), user_email)
     except Exception as e:
         print(f"Error fetching analytics charts: {str(e)}")
         return None
@@ -843,22 +1457,51 @@ def get_analytics_reports(user_email, limit=10):
     """
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, scan_date, crop_name, disease_name, risk_level
-                FROM scan_history
-                WHERE user_email = ?
-                ORDER BY scan_date DESC
-                LIMIT ?
-            ''', (user_email, limit))
-            
-            return [{
-                'id': row['id'],
-                'date': row['scan_date'],
-                'cropType': row['crop_name'] or 'Unknown',
-                'diagnosis': row['disease_name'],
-                'riskLevel': row['risk_level'] or 'Medium'
-            } for row in cursor.fetchall()]
+            return _read_analytics_reports(conn.cursor(), user_email, limit)
     except Exception as e:
         print(f"Error fetching analytics reports: {str(e)}")
         return []
+
+# ============== DASHBOARD ==============
+
+DASHBOARD_FIELDS = ('summary', 'charts', 'reports', 'stats', 'accuracy')
+
+def get_dashboard_version(user_email):
+    """
+    Get the version of a user's analytics (bumped by every save_scan/delete_scan)
+    Returns: version number (0 if the user has never scanned)
+    """
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT version FROM user_scan_stats WHERE user_email = ?', (user_email,)).fetchone()
+    return row['version'] if row else 0
+
+def get_dashboard(user_email, fields=DASHBOARD_FIELDS, reports_limit=10):
+    """
+    Get the selected dashboard parts (summary, charts, reports, stats, accuracy)
+    from one read transaction, sharing a single user_scan_stats lookup
+    Returns: (version, dashboard) or None on error
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if not conn.in_transaction:
+                # All parts see the same snapshot (and the version matches the data)
+                cursor.execute('BEGIN')
+            
+            row = _get_scan_stats_row(cursor, user_email)
+            dashboard = {}
+            if 'summary' in fields:
+                dashboard['summary'] = _analytics_summary_from_row(row)
+            if 'charts' in fields:
+                dashboard['charts'] = _read_analytics_charts(cursor, user_email)
+            if 'reports' in fields:
+                dashboard['reports'] = _read_analytics_reports(cursor, user_email, reports_limit)
+            if 'stats' in fields:
+                dashboard['stats'] = _user_stats_from_row(row)
+            if 'accuracy' in fields:
+                dashboard['accuracy'] = round(_accuracy_from_row(row), 2)
+            
+            return (row['version'] if row else 0), dashboard
+    except Exception as e:
+        print(f"Error fetching dashboard: {str(e)}")
+        return None
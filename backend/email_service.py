@@ -1,8 +1,7 @@
-import smtplib
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from mail_outbox import MAIL_OUTBOX_ENABLED, SMTPConnection, build_message, enqueue_email
+from email_templates import get_template
 
 load_dotenv()
 
@@ -13,6 +12,28 @@ class EmailService:
         self.smtp_email = os.getenv('SMTP_EMAIL')
         self.smtp_password = os.getenv('SMTP_PASSWORD')
         self.app_name = "AgriDetect AI"
+        self.sender = f"{self.app_name} <{self.smtp_email}>"
+        # Compiled once with the app name folded in; each send renders only the per-user fields
+        self.verification_template = get_template('verification').bind(app_name=self.app_name)
+        self.welcome_template = get_template('welcome').bind(app_name=self.app_name)
+    
+    def _deliver(self, to_email, subject, html_content):
+        """
+        Queue an email in the outbox (or send it right away if the outbox is disabled)
+        Returns: (success, message)
+        """
+        if MAIL_OUTBOX_ENABLED:
+            success, result = enqueue_email(to_email, subject, html_content)
+            return (True, "Email queued") if success else (False, result)
+        
+        connection = SMTPConnection(self.smtp_server, self.smtp_port, self.smtp_email, self.smtp_password)
+        try:
+            connection.send(build_message(self.sender, to_email, subject, html_content))
+            return True, "Email sent"
+        except Exception as e:
+            return False, f"Failed to send email: {str(e)}"
+        finally:
+            connection.close()
         
     def send_verification_email(self, to_email, verification_token, user_name):
         """Send email verification link to user"""
@@ -21,199 +42,23 @@ class EmailService:
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8081')
         verification_url = f"{frontend_url}/verify-email/{verification_token}"
         
-        # Create HTML email template
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .container {{
-                    background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-                    border-radius: 16px;
-                    padding: 40px;
-                    color: white;
-                }}
-                .logo {{
-                    font-size: 28px;
-                    font-weight: bold;
-                    margin-bottom: 20px;
-                    text-align: center;
-                }}
-                .content {{
-                    background: white;
-                    color: #333;
-                    padding: 30px;
-                    border-radius: 12px;
-                    margin-top: 20px;
-                }}
-                .button {{
-                    display: inline-block;
-                    background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-                    color: white;
-                    padding: 14px 32px;
-                    text-decoration: none;
-                    border-radius: 8px;
-                    font-weight: 600;
-                    margin: 20px 0;
-                    text-align: center;
-                }}
-                .footer {{
-                    text-align: center;
-                    margin-top: 30px;
-                    color: rgba(255,255,255,0.8);
-                    font-size: 14px;
-                }}
-                .warning {{
-                    background: #fef3c7;
-                    border-left: 4px solid #f59e0b;
-                    padding: 12px;
-                    margin: 20px 0;
-                    border-radius: 4px;
-                    color: #92400e;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="logo">🌾 {self.app_name}</div>
-                
-                <div class="content">
-                    <h2 style="color: #10b981; margin-top: 0;">Welcome, {user_name}! 🌱</h2>
-                    
-                    <p>Thank you for joining <strong>{self.app_name}</strong>! We're excited to help you protect your crops with AI-powered disease detection.</p>
-                    
-                    <p>To complete your registration and activate your account, please verify your email address by clicking the button below:</p>
-                    
-                    <div style="text-align: center;">
-                        <a href="{verification_url}" class="button">
-                            Verify Email Address
-                        </a>
-                    </div>
-                    
-                    <p style="color: #666; font-size: 14px;">Or copy and paste this link into your browser:</p>
-                    <p style="background: #f3f4f6; padding: 12px; border-radius: 6px; word-break: break-all; font-size: 13px;">
-                        {verification_url}
-                    </p>
-                    
-                    <div class="warning">
-                        ⏱️ <strong>Note:</strong> This verification link will expire in <strong>24 hours</strong>.
-                    </div>
-                    
-                    <p>If you didn't create an account with {self.app_name}, please ignore this email.</p>
-                </div>
-                
-                <div class="footer">
-                    <p>© 2024 {self.app_name} | Helping farmers protect their crops</p>
-                    <p style="font-size: 12px;">This is an automated email. Please do not reply.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Create message
-        message = MIMEMultipart('alternative')
-        message['Subject'] = f"Verify your {self.app_name} email address 🌾"
-        message['From'] = f"{self.app_name} <{self.smtp_email}>"
-        message['To'] = to_email
+        html_content = self.verification_template.render(user_name=user_name, verification_url=verification_url)
         
-        # Attach HTML content
-        html_part = MIMEText(html_content, 'html')
-        message.attach(html_part)
-        
-        try:
-            # Send email via SMTP
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_email, self.smtp_password)
-                server.send_message(message)
-                
-            return True, "Verification email sent successfully"
-            
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
-            return False, f"Failed to send email: {str(e)}"
+        success, message = self._deliver(to_email, f"Verify your {self.app_name} email address 🌾", html_content)
+        if not success:
+            print(f"Error sending email: {message}")
+            return False, message
+        return True, "Verification email sent successfully"
     
     def send_welcome_email(self, to_email, user_name):
         """Send welcome email after successful verification"""
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .container {{
-                    background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-                    border-radius: 16px;
-                    padding: 40px;
-                    color: white;
-                }}
-                .content {{
-                    background: white;
-                    color: #333;
-                    padding: 30px;
-                    border-radius: 12px;
-                    margin-top: 20px;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div style="font-size: 28px; font-weight: bold; text-align: center; margin-bottom: 20px;">
-                    🌾 {self.app_name}
-                </div>
-                
-                <div class="content">
-                    <h2 style="color: #10b981;">Welcome to {self.app_name}! 🎉</h2>
-                    <p>Hi {user_name},</p>
-                    <p>Your email has been verified successfully! You can now access all features of {self.app_name}.</p>
-                    <p><strong>Get started with:</strong></p>
-                    <ul>
-                        <li>📸 Upload plant images for disease detection</li>
-                        <li>🌤️ Check real-time weather conditions</li>
-                        <li>📊 View your scan history and analytics</li>
-                        <li>👥 Join our farming community</li>
-                    </ul>
-                    <p>Happy farming! 🌱</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = self.welcome_template.render(user_name=user_name)
         
-        message = MIMEMultipart('alternative')
-        message['Subject'] = f"Welcome to {self.app_name}! 🎉"
-        message['From'] = f"{self.app_name} <{self.smtp_email}>"
-        message['To'] = to_email
-        
-        html_part = MIMEText(html_content, 'html')
-        message.attach(html_part)
-        
-        try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_email, self.smtp_password)
-                server.send_message(message)
-            return True
-        except Exception as e:
-            print(f"Error sending welcome email: {str(e)}")
-            return False
+        success, message = self._deliver(to_email, f"Welcome to {self.app_name}! 🎉", html_content)
+        if not success:
+            print(f"Error sending welcome email: {message}")
+        return success
 
 # Create singleton instance
 email_service = EmailService()
@@ -0,0 +1,160 @@
+"""
+Precompiled HTML email templates for AgriDetect AI
+Templates in templates/email/ are loaded once, their <style> rules are inlined into
+the elements (mail clients drop or ignore <head> styles) and the result is split
+into static text and {{ name }} placeholders, so a render only escapes and joins
+the variable fragments. {{ name|raw }} inserts pre-rendered HTML unescaped.
+"""
+import os
+import re
+import time
+import threading
+from html import escape
+from metrics import metrics_registry
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)(\|raw)?\s*\}\}')
+_STYLE_BLOCK = re.compile(r'<style[^>]*>(.*?)</style>\s*', re.S | re.I)
+_CSS_RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_SIMPLE_SELECTOR = re.compile(r'^([a-z][a-z0-9]*)?(?:\.([\w-]+))?$', re.I)
+_START_TAG = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>')
+_CLASS_ATTR = re.compile(r'\sclass="([^"]*)"')
+_STYLE_ATTR = re.compile(r'\sstyle="([^"]*)"')
+
+
+def _declarations(body):
+    return [d.strip() for d in body.split(';') if d.strip()]
+
+
+def inline_css(html):
+    """
+    Move <style> rules onto the elements they match
+    Only tag, .class and tag.class selectors are inlined; anything else
+    (pseudo-classes, descendant selectors) stays in a <style> block.
+    Existing style="" attributes win over inlined rules.
+    """
+    rules = []
+    leftover = []
+    for css in _STYLE_BLOCK.findall(html):
+        for selectors, body in _CSS_RULE.findall(css):
+            for selector in selectors.split(','):
+                selector = selector.strip()
+                match = _SIMPLE_SELECTOR.match(selector)
+                if match and selector:
+                    tag, cls = match.group(1), match.group(2)
+                    specificity = (10 if cls else 0) + (1 if tag else 0)
+                    rules.append((specificity, len(rules), tag and tag.lower(), cls, _declarations(body)))
+                else:
+                    leftover.append(f"{selector} {{ {'; '.join(_declarations(body))} }}")
+    rules.sort(key=lambda rule: rule[:2])
+
+    def apply(match):
+        tag, attrs, close = match.group(1), match.group(2) or '', match.group(3)
+        class_attr = _CLASS_ATTR.search(attrs)
+        classes = set(class_attr.group(1).split()) if class_attr else set()
+        declarations = [d for _, _, rule_tag, cls, body in rules
+                        if (rule_tag is None or rule_tag == tag.lower()) and (cls is None or cls in classes)
+                        for d in body]
+        if not declarations:
+            return match.group(0)
+        style_attr = _STYLE_ATTR.search(attrs)
+        if style_attr:
+            declarations += _declarations(style_attr.group(1))
+            attrs = attrs[:style_attr.start()] + attrs[style_attr.end():]
+        return f'<{tag}{attrs} style="{"; ".join(declarations)}"{close}>'
+
+    html = _STYLE_BLOCK.sub(lambda m: '', html)
+    html = _START_TAG.sub(apply, html)
+    if leftover:
+        html = html.replace('</head>', f"<style>{' '.join(leftover)}</style></head>", 1)
+    return html
+
+
+class EmailTemplate:
+    """Compiled template: static text parts with (name, raw) fields between them"""
+
+    def __init__(self, name, static, fields):
+        self.name = name
+        self._static = static  # len(fields) + 1 strings
+        self._fields = fields
+
+    @classmethod
+    def compile(cls, name, source):
+        """Inline CSS, collapse indentation and split a template source into parts"""
+        html = re.sub(r'\n\s*', '\n', inline_css(source))
+        static, fields = [], []
+        position = 0
+        for match in _PLACEHOLDER.finditer(html):
+            static.append(html[position:match.start()])
+            fields.append((match.group(1), bool(match.group(2))))
+            position = match.end()
+        static.append(html[position:])
+        return cls(name, static, fields)
+
+    @property
+    def variables(self):
+        """Names still to be supplied at render time"""
+        return {name for name, _ in self._fields}
+
+    @staticmethod
+    def _value(name, raw, context):
+        value = context[name]
+        return str(value) if raw else escape(str(value))
+
+    def bind(self, **values):
+        """
+        Fold values shared by many messages into the static parts
+        Returns: a new EmailTemplate needing only the remaining variables
+        """
+        static, fields = [self._static[0]], []
+        for (name, raw), text in zip(self._fields, self._static[1:]):
+            if name in values:
+                static[-1] += self._value(name, raw, values) + text
+            else:
+                fields.append((name, raw))
+                static.append(text)
+        return EmailTemplate(self.name, static, fields)
+
+    def render(self, **context):
+        """Render one message (raises KeyError for a missing variable)"""
+        static = self._static
+        out = [static[0]]
+        for i, (name, raw) in enumerate(self._fields, 1):
+            out.append(self._value(name, raw, context))
+            out.append(static[i])
+        return ''.join(out)
+
+    def render_many(self, contexts, **shared):
+        """
+        Render one message per context, with shared values escaped only once
+        Returns: list of HTML strings in the order of contexts
+        """
+        start = time.perf_counter()
+        template = self.bind(**shared) if shared else self
+        rendered = [template.render(**context) for context in contexts]
+        metrics_registry.histogram('email.render_batch').observe((time.perf_counter() - start) * 1000)
+        metrics_registry.counter('email.rendered').inc(len(rendered))
+        return rendered
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_template(name):
+    """Get a compiled template by file name (without .html), loading it on first use"""
+    template = _templates.get(name)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(name)
+            if template is None:
+                with open(os.path.join(TEMPLATE_DIR, f"{name}.html"), encoding='utf-8') as f:
+                    template = EmailTemplate.compile(name, f.read())
+                _templates[name] = template
+    return template
+
+
+def render_many(name, contexts, **shared):
+    """Batch-render a named template (see EmailTemplate.render_many)"""
+    return get_template(name).render_many(contexts, **shared)
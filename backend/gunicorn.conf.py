@@ -0,0 +1,68 @@
+"""
+Gunicorn configuration for the AgriDetect AI backend
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+
+Graceful reload of workers: kill -HUP <master pid>
+Zero-downtime code upgrade: kill -USR2 <master pid>, then kill -WINCH / -QUIT the old master
+"""
+import os
+import multiprocessing
+
+# Server socket
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))  # Pending connections queued by the kernel
+
+# Workers: inference is CPU-bound, so default to one process per core (capped, each holds all models)
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))  # Threads cover DB/file/chat I/O waits
+
+# Load app (and models) in the master before forking workers
+preload_app = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+# Timeouts
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))  # Kill workers silent for this long
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))  # Time to finish in-flight requests on reload
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+# Logging
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Per-worker setup after fork"""
+    # First, while this worker is still single-threaded: fork the bcrypt processes
+    from password_hashing import start_password_hasher
+    start_password_hasher()
+
+    from logging_config import reinit_logging_after_fork
+    reinit_logging_after_fork()
+
+    # Background threads from the master do not survive fork
+    from database import start_checkpoint_scheduler
+    start_checkpoint_scheduler()
+    from token_store import start_token_sweeper
+    start_token_sweeper()
+
+    # Each worker owns its scan write-behind journal (and replays journals of crashed workers)
+    from scan_writer import start_scan_writer
+    start_scan_writer()
+
+    # Each worker drains the shared email outbox (rows are claimed, so none is sent twice)
+    from mail_outbox import start_mail_sender
+    start_mail_sender()
+
+    # Every worker checks for a due alert digest; the period is claimed so only one sends it
+    from alert_digest import start_digest_scheduler
+    start_digest_scheduler()
+
+    if not preload_app:
+        # Models were not loaded in the master, load them in this worker
+        from app import init_models
+        init_models()
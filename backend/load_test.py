@@ -0,0 +1,81 @@
+"""
+Simple load test for comparing serving modes (Flask dev server vs gunicorn)
+Usage: python load_test.py [endpoint] [concurrency] [duration_seconds] [image_path]
+
+Examples:
+    python load_test.py /health 32 20
+    python load_test.py /predict 8 30 sample.jpg
+
+Run once against `python app.py` and once against
+`gunicorn -c gunicorn.conf.py wsgi:app`, then compare requests/sec and latency.
+"""
+import sys
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = "http://localhost:5000"
+
+
+def worker(endpoint, deadline, image_bytes, latencies, errors, lock):
+    """Send requests in a loop until the deadline"""
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if image_bytes is not None:
+                response = session.post(f"{BASE_URL}{endpoint}", files={'image': ('image.jpg', image_bytes)})
+            else:
+                response = session.get(f"{BASE_URL}{endpoint}")
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+
+
+def run_load_test(endpoint='/health', concurrency=16, duration=20, image_path=None):
+    """Run the load test and print throughput and latency percentiles"""
+    image_bytes = None
+    if image_path:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    print(f"Load testing {BASE_URL}{endpoint} with {concurrency} clients for {duration}s")
+    print("-" * 60)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker, endpoint, deadline, image_bytes, latencies, errors, lock)
+
+    total = len(latencies) + len(errors)
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    print(f"Requests:    {total} ({len(errors)} errors)")
+    print(f"Throughput:  {len(latencies) / duration:.1f} req/s")
+    print(f"Latency p50: {percentile(50):.1f} ms")
+    print(f"Latency p90: {percentile(90):.1f} ms")
+    print(f"Latency p99: {percentile(99):.1f} ms")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    endpoint = sys.argv[1] if len(sys.argv) > 1 else '/health'
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    duration = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    image_path = sys.argv[4] if len(sys.argv) > 4 else None
+    run_load_test(endpoint, concurrency, duration, image_path)
@@ -60,3 +60,10 @@ def normalize_district_name(district):
     }
     
     return variations.get(district, district)
+
+def district_key(address):
+    """
+    Normalized district key stored on alerts and users at write time
+    Returns: key such as 'bengaluru', or None if no district can be extracted
+    """
+    return normalize_district_name(extract_district(address))
@@ -0,0 +1,106 @@
+"""
+Structured, asynchronous logging for AgriDetect AI
+Request threads only enqueue log records; a background listener formats and writes them
+"""
+import os
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # Level for 'agridetect.*' loggers
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Fraction of requests that emit detailed DEBUG records (when LOG_LEVEL=DEBUG)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0.01))
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging():
+    """Configure the root logger with a queue handler and background writer (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    # LOG_LEVEL applies to application loggers only, keeping library DEBUG noise out
+    logging.getLogger('agridetect').setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def reinit_logging_after_fork():
+    """
+    Restart the background writer in a forked worker process
+    The listener thread does not survive fork(), so records would otherwise pile up in the queue
+    """
+    global _listener
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    _listener = None
+    return setup_logging()
+
+
+def get_logger(name):
+    """Get a logger under the application namespace"""
+    return logging.getLogger(f"agridetect.{name}")
+
+
+def sample_debug(logger):
+    """
+    Decide whether this request should emit detailed DEBUG records
+    Lets callers skip computing expensive debug detail for unsampled requests
+    """
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_DEBUG_SAMPLE_RATE
@@ -0,0 +1,83 @@
+"""
+Failed sign-in limiter for AgriDetect AI
+Counts failed logins per account from each client IP, and per client IP, in a sliding
+window and blocks further attempts (before any bcrypt work) once either limit is
+reached, so credential stuffing cannot keep the hashing pool saturated. Account
+failures only block the IP they came from, so nobody can lock a user out by failing
+on their account from elsewhere. Behind a reverse proxy the client IP is only known
+with TRUSTED_PROXY_HOPS set (see app.py).
+Counts are per worker process.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from metrics import metrics_registry
+
+LOGIN_WINDOW = float(os.getenv('LOGIN_WINDOW', 900))  # seconds
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5))  # from one IP
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', 20))
+LOGIN_LIMITER_KEYS = int(os.getenv('LOGIN_LIMITER_KEYS', 100000))  # tracked (account, IP) pairs + IPs
+
+
+class LoginLimiter:
+    """Sliding-window failure counts keyed by ('account', email, address) and ('ip', address)"""
+
+    def __init__(self, window=LOGIN_WINDOW, max_per_account=LOGIN_MAX_FAILURES_PER_ACCOUNT,
+                 max_per_ip=LOGIN_MAX_FAILURES_PER_IP, max_keys=LOGIN_LIMITER_KEYS):
+        self.window = window
+        self.limits = {'account': max_per_account, 'ip': max_per_ip}
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()  # key -> deque of failure timestamps
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def check(self, email, ip):
+        """
+        Check whether a login attempt may proceed
+        Returns: (allowed, retry_after_seconds)
+        """
+        now = time.monotonic()
+        retry_after = 0
+        with self._lock:
+            for key in (('account', email, ip), ('ip', ip)):
+                failures = self._recent(key, now)
+                if failures is not None and len(failures) >= self.limits[key[0]]:
+                    retry_after = max(retry_after, failures[0] + self.window - now)
+        if retry_after:
+            metrics_registry.counter('auth.login.throttled').inc()
+            return False, int(retry_after) + 1
+        return True, 0
+
+    def record_failure(self, email, ip):
+        """Count a failed login against the account (from this IP) and the IP"""
+        now = time.monotonic()
+        with self._lock:
+            for key in (('account', email, ip), ('ip', ip)):
+                failures = self._recent(key, now)
+                if failures is None:
+                    failures = self._failures[key] = deque(maxlen=self.limits[key[0]])
+                failures.append(now)
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+        metrics_registry.counter('auth.login.failed').inc()
+
+    def record_success(self, email, ip):
+        """Forget the account's failures from this IP (the IP's own stay counted)"""
+        with self._lock:
+            self._failures.pop(('account', email, ip), None)
+
+
+# Global limiter instance
+login_limiter = LoginLimiter()
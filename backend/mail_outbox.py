@@ -0,0 +1,313 @@
+"""
+Outbound email queue for AgriDetect AI
+EmailService writes messages to the email_outbox table and returns; a background
+sender in each worker claims due messages, sends them over one reused,
+authenticated SMTP connection, retries transient failures with exponential
+backoff and keeps under a per-process send rate.
+"""
+import os
+import time
+import uuid
+import atexit
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from dotenv import load_dotenv
+from database import get_db_connection
+from metrics import metrics_registry
+from logging_config import get_logger
+
+load_dotenv()
+
+MAIL_OUTBOX_ENABLED = os.getenv('MAIL_OUTBOX_ENABLED', 'true').lower() == 'true'
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 50))
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', 2))  # seconds between outbox checks
+MAIL_RATE_LIMIT = float(os.getenv('MAIL_RATE_LIMIT', 5))  # messages per second per worker (0 = no limit)
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', 30))  # seconds, doubled per attempt
+MAIL_RETRY_MAX = float(os.getenv('MAIL_RETRY_MAX', 3600))
+# A connection is dropped after this many seconds unused or messages sent, whichever comes first
+MAIL_CONNECTION_IDLE = float(os.getenv('MAIL_CONNECTION_IDLE', 60))
+MAIL_CONNECTION_MAX_MESSAGES = int(os.getenv('MAIL_CONNECTION_MAX_MESSAGES', 100))
+MAIL_CLAIM_TIMEOUT = float(os.getenv('MAIL_CLAIM_TIMEOUT', 300))  # seconds before a crashed sender's claim lapses
+MAIL_SENT_RETENTION = float(os.getenv('MAIL_SENT_RETENTION', 7 * 86400))  # seconds sent rows are kept
+
+# Claim order: due transactional mail first, then bulk mail such as digests
+MAIL_PRIORITY_NORMAL = 0
+MAIL_PRIORITY_BULK = 1
+
+logger = get_logger('mail_outbox')
+
+
+def enqueue_email(to_email, subject, html):
+    """
+    Queue an email for the background sender
+    Returns: (success, outbox_id_or_message)
+    """
+    try:
+        now = time.time()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO email_outbox (to_email, subject, html, status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, 'pending', 0, ?, ?)
+            ''', (to_email, subject, html, now, now))
+            outbox_id = cursor.lastrowid
+        metrics_registry.counter('mail.queued').inc()
+        if _sender is not None and _sender.pid == os.getpid():
+            _sender.wake()
+        return True, outbox_id
+    except Exception as e:
+        return False, f"Error queueing email: {str(e)}"
+
+
+def enqueue_emails(messages, priority=MAIL_PRIORITY_BULK):
+    """
+    Queue many emails in one statement; joins the caller's transaction if one is open
+    messages: iterable of (to_email, subject, html)
+    Returns: number of emails queued
+    """
+    now = time.time()
+    rows = [(to_email, subject, html, priority, now, now) for to_email, subject, html in messages]
+    if not rows:
+        return 0
+    with get_db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO email_outbox (to_email, subject, html, status, attempts, priority, next_attempt_at, created_at)
+            VALUES (?, ?, ?, 'pending', 0, ?, ?, ?)
+        ''', rows)
+    metrics_registry.counter('mail.queued').inc(len(rows))
+    if _sender is not None and _sender.pid == os.getpid():
+        _sender.wake()
+    return len(rows)
+
+
+def build_message(sender, to_email, subject, html):
+    """MIME message with an HTML body"""
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = to_email
+    message.attach(MIMEText(html, 'html'))
+    return message
+
+
+class SMTPConnection:
+    """
+    One SMTP session reused across messages
+    Opened (STARTTLS + login) on first use and reopened when the server drops it,
+    it has been idle for MAIL_CONNECTION_IDLE or sent MAIL_CONNECTION_MAX_MESSAGES.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None, use_tls=SMTP_USE_TLS):
+        self.host = host or os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+        self.port = port or int(os.getenv('SMTP_PORT', 587))
+        self.username = username if username is not None else os.getenv('SMTP_EMAIL')
+        self.password = password if password is not None else os.getenv('SMTP_PASSWORD')
+        self.use_tls = use_tls
+        self._smtp = None
+        self._sent = 0
+        self._last_used = 0.0
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        metrics_registry.counter('mail.connections_opened').inc()
+        self._smtp = smtp
+        self._sent = 0
+
+    def send(self, message):
+        """Send a message, (re)connecting as needed"""
+        if self._smtp is not None and (time.monotonic() - self._last_used > MAIL_CONNECTION_IDLE
+                                       or self._sent >= MAIL_CONNECTION_MAX_MESSAGES):
+            self.close()
+        if self._smtp is None:
+            self._open()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle session; one fresh connection is part of the same attempt
+            self.close()
+            self._open()
+            self._smtp.send_message(message)
+        self._sent += 1
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+
+def _is_permanent(error):
+    """5xx replies and refused recipients will fail the same way on retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, 'smtp_code', None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+class OutboxSender:
+    """Background sender for email_outbox rows, one per worker process"""
+
+    def __init__(self, connection=None, sender_address=None, batch_size=MAIL_BATCH_SIZE,
+                 rate_limit=MAIL_RATE_LIMIT, poll_interval=MAIL_POLL_INTERVAL):
+        self.pid = os.getpid()
+        self.worker_id = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+        self.connection = connection or SMTPConnection()
+        self.sender_address = sender_address or f"AgriDetect AI <{os.getenv('SMTP_EMAIL')}>"
+        self.batch_size = batch_size
+        self.rate_limit = rate_limit
+        self.poll_interval = poll_interval
+        self._next_send_at = 0.0
+        self._last_purge = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _claim(self):
+        """Claim up to batch_size due messages (claims from crashed senders lapse)"""
+        now = time.time()
+        with get_db_connection() as conn:
+            conn.execute('''
+                UPDATE email_outbox SET claimed_by = ?, claimed_until = ?
+                WHERE id IN (
+                    SELECT id FROM email_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                      AND (claimed_until IS NULL OR claimed_until < ?)
+                    ORDER BY priority, next_attempt_at LIMIT ?
+                )
+            ''', (self.worker_id, now + MAIL_CLAIM_TIMEOUT, now, now, self.batch_size))
+            rows = conn.execute('''
+                SELECT id, to_email, subject, html, attempts, created_at FROM email_outbox
+                WHERE claimed_by = ? AND status = 'pending' ORDER BY id
+            ''', (self.worker_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _throttle(self):
+        if self.rate_limit <= 0:
+            return
+        delay = self._next_send_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_send_at = max(self._next_send_at, time.monotonic() - 1.0) + 1.0 / self.rate_limit
+
+    def _finish(self, outbox_id, status, attempts, error=None, next_attempt_at=None):
+        with get_db_connection() as conn:
+            conn.execute('''
+                UPDATE email_outbox
+                SET status = ?, attempts = ?, last_error = COALESCE(?, last_error), claimed_by = NULL, claimed_until = NULL,
+                    next_attempt_at = COALESCE(?, next_attempt_at),
+                    sent_at = CASE WHEN ? = 'sent' THEN ? ELSE sent_at END
+                WHERE id = ?
+            ''', (status, attempts, error, next_attempt_at, status, time.time(), outbox_id))
+
+    def send_pending(self):
+        """
+        Send every due message in the outbox
+        Returns: number of messages sent
+        """
+        sent = 0
+        while not self._stop.is_set():
+            batch = self._claim()
+            if not batch:
+                break
+            for row in batch:
+                self._throttle()
+                attempts = row['attempts'] + 1
+                start = time.perf_counter()
+                try:
+                    self.connection.send(build_message(self.sender_address, row['to_email'],
+                                                       row['subject'], row['html']))
+                except Exception as e:
+                    self.connection.close()
+                    if _is_permanent(e) or attempts >= MAIL_MAX_ATTEMPTS:
+                        self._finish(row['id'], 'failed', attempts, str(e))
+                        metrics_registry.counter('mail.failed').inc()
+                        logger.error("Email failed permanently",
+                                     extra={'fields': {'outbox_id': row['id'], 'attempts': attempts, 'error': str(e)}})
+                    else:
+                        backoff = min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+                        self._finish(row['id'], 'pending', attempts, str(e), time.time() + backoff)
+                        metrics_registry.counter('mail.retried').inc()
+                        logger.warning("Email send failed, will retry",
+                                       extra={'fields': {'outbox_id': row['id'], 'retry_in_s': backoff, 'error': str(e)}})
+                    continue
+                metrics_registry.histogram('mail.send').observe((time.perf_counter() - start) * 1000)
+                metrics_registry.histogram('mail.queue_to_send').observe((time.time() - row['created_at']) * 1000)
+                self._finish(row['id'], 'sent', attempts)
+                metrics_registry.counter('mail.sent').inc()
+                sent += 1
+        return sent
+
+    def _purge_sent(self):
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < ?",
+                         (time.time() - MAIL_SENT_RETENTION,))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.send_pending()
+                if time.monotonic() - self._last_purge > 3600:
+                    self._purge_sent()
+                    self._last_purge = time.monotonic()
+            except Exception as e:
+                logger.error("Outbox sender error", extra={'fields': {'error': str(e)}})
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self.connection.close()
+
+    def wake(self):
+        """Check the outbox now instead of at the next poll"""
+        self._wake.set()
+
+    def start(self):
+        """Start the sender thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='mail-sender', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_outbox_sender():
+    """Get this process's outbox sender, starting it on first use (recreated after fork)"""
+    global _sender
+    if _sender is None or _sender.pid != os.getpid():
+        with _sender_lock:
+            if _sender is None or _sender.pid != os.getpid():
+                _sender = OutboxSender()
+                _sender.start()
+                atexit.register(_sender.stop)
+    return _sender
+
+
+def start_mail_sender():
+    """Start the background sender if the outbox is enabled"""
+    if MAIL_OUTBOX_ENABLED:
+        get_outbox_sender()
@@ -0,0 +1,213 @@
+"""
+In-process metrics for AgriDetect AI
+Latency histograms used to break request time down by processing stage,
+plus simple counters (cache hits/misses and similar events) and gauges
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Thread-safe fixed-bucket latency histogram (values in milliseconds)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded observations"""
+        with self._lock:
+            self.bucket_counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+    def observe(self, value_ms):
+        """Record a single observation"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value_ms <= bound:
+                index = i
+                break
+
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.total += value_ms
+            self.min = value_ms if self.min is None else min(self.min, value_ms)
+            self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def _quantile(self, q, counts, count):
+        """Estimate a quantile from bucket counts (upper bound of matching bucket)"""
+        if count == 0:
+            return 0.0
+        target = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return float(self.buckets[i]) if i < len(self.buckets) else float(self.max)
+        return float(self.max)
+
+    def snapshot(self):
+        """Return a JSON-serializable summary of this histogram"""
+        with self._lock:
+            counts = list(self.bucket_counts)
+            count, total = self.count, self.total
+            min_value, max_value = self.min, self.max
+
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+
+        return {
+            'count': count,
+            'sum_ms': round(total, 3),
+            'avg_ms': round(total / count, 3) if count else 0.0,
+            'min_ms': round(min_value, 3) if min_value is not None else 0.0,
+            'max_ms': round(max_value, 3) if max_value is not None else 0.0,
+            'p50_ms': self._quantile(0.50, counts, count),
+            'p90_ms': self._quantile(0.90, counts, count),
+            'p99_ms': self._quantile(0.99, counts, count),
+            'buckets': buckets
+        }
+
+
+class Counter:
+    """Thread-safe monotonically increasing counter"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Increase the counter"""
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        """Reset the counter to zero"""
+        with self._lock:
+            self.value = 0
+
+
+class Gauge(Counter):
+    """Thread-safe value that can go up and down (e.g. open connections)"""
+
+    def dec(self, amount=1):
+        """Decrease the gauge"""
+        self.inc(-amount)
+
+    def set(self, value):
+        """Set the gauge to an absolute value"""
+        with self._lock:
+            self.value = value
+
+
+class MetricsRegistry:
+    """Named collection of histograms, counters and gauges shared across the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def histogram(self, name):
+        """Get or create a histogram by name"""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def counter(self, name):
+        """Get or create a counter by name"""
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, Counter())
+        return counter
+
+    def gauge(self, name):
+        """Get or create a gauge by name"""
+        gauge = self._gauges.get(name)
+        if gauge is None:
+            with self._lock:
+                gauge = self._gauges.setdefault(name, Gauge())
+        return gauge
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serializable dict"""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {
+            'histograms': {name: h.snapshot() for name, h in sorted(histograms.items())},
+            'counters': {name: c.value for name, c in sorted(counters.items())},
+            'gauges': {name: g.value for name, g in sorted(gauges.items())}
+        }
+
+    def reset(self):
+        """Reset every registered histogram and counter (gauges track live state and are kept)"""
+        with self._lock:
+            metrics = list(self._histograms.values()) + list(self._counters.values())
+        for metric in metrics:
+            metric.reset()
+
+
+class StageTimer:
+    """
+    Collects per-stage durations for a single request
+    Durations of repeated stages are summed, then recorded into the registry
+    as '<prefix>.<stage>' histograms when finish() is called; the total is also
+    recorded as '<prefix>.total.<status>' so failed requests can be told apart.
+    """
+
+    def __init__(self, prefix, registry=None):
+        self.prefix = prefix
+        self.registry = registry or metrics_registry
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, duration_ms):
+        """Add a duration (ms) to a stage"""
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def finish(self, status=None):
+        """Record stage and total durations into histograms (once), labelling the total with the response status"""
+        if self._finished:
+            return
+        self._finished = True
+        self.stages['total'] = (time.perf_counter() - self._started) * 1000
+        for name, duration_ms in self.stages.items():
+            self.registry.histogram(f"{self.prefix}.{name}").observe(duration_ms)
+        if status is not None:
+            self.registry.histogram(f"{self.prefix}.total.{status}").observe(self.stages['total'])
+
+    def server_timing_header(self):
+        """Format collected stages as a Server-Timing header value"""
+        return ', '.join(f"{name};dur={duration_ms:.2f}" for name, duration_ms in self.stages.items())
+
+
+# Global registry
+metrics_registry = MetricsRegistry()
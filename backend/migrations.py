@@ -0,0 +1,386 @@
+"""
+Versioned schema migrations for AgriDetect AI
+Each migration runs once, in order, and is recorded in the schema_version table
+"""
+import time
+from location_helpers import district_key
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column(cursor, table, column, definition):
+    """Add a column if it doesn't exist yet (databases created before migrations)"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"Added {column} column to {table}")
+
+
+def migration_001_initial_schema(cursor):
+    """Base tables, including columns that older databases added ad hoc"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            full_name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            profile_picture_url TEXT,
+            address TEXT,
+            notifications_enabled INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _add_column(cursor, 'users', 'profile_picture_url', 'TEXT')
+    _add_column(cursor, 'users', 'address', 'TEXT')
+    _add_column(cursor, 'users', 'notifications_enabled', 'INTEGER DEFAULT 1')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT NOT NULL,
+            disease_name TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            crop_name TEXT,
+            severity TEXT,
+            risk_level TEXT,
+            health_status TEXT,
+            image_url TEXT,
+            scan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_email) REFERENCES users(email)
+        )
+    ''')
+    _add_column(cursor, 'scan_history', 'image_url', 'TEXT')
+    _add_column(cursor, 'scan_history', 'risk_level', 'TEXT')
+    _add_column(cursor, 'scan_history', 'health_status', 'TEXT')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            farmer_name TEXT NOT NULL,
+            location TEXT NOT NULL,
+            disease_reported TEXT NOT NULL,
+            description TEXT,
+            prevention_methods TEXT,
+            image_url TEXT,
+            user_email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_email) REFERENCES users(email)
+        )
+    ''')
+    _add_column(cursor, 'alerts', 'prevention_methods', 'TEXT')
+
+
+def migration_002_history_and_alert_indexes(cursor):
+    """Indexes for per-user history/stats/analytics queries and the recent alerts feed"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_date
+        ON scan_history (user_email, scan_date DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alerts_created_at
+        ON alerts (created_at DESC)
+    ''')
+
+
+def migration_003_history_keyset_index(cursor):
+    """Add id to the history index so (scan_date, id) keyset pages need no sort"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_date_id
+        ON scan_history (user_email, scan_date DESC, id DESC)
+    ''')
+    # Superseded: the new index serves every query the old one did
+    cursor.execute('DROP INDEX IF EXISTS idx_scan_history_user_date')
+
+
+def migration_004_district_keys(cursor):
+    """Normalized district keys on alerts and users, backfilled, for indexed location feeds"""
+    _add_column(cursor, 'alerts', 'district_key', 'TEXT')
+    _add_column(cursor, 'users', 'district_key', 'TEXT')
+
+    for table, column, key in (('alerts', 'location', 'id'), ('users', 'address', 'id')):
+        cursor.execute(f"SELECT {key}, {column} FROM {table} WHERE {column} IS NOT NULL")
+        cursor.executemany(
+            f"UPDATE {table} SET district_key = ? WHERE {key} = ?",
+            [(district_key(row[1]), row[0]) for row in cursor.fetchall()]
+        )
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alerts_district_created
+        ON alerts (district_key, created_at DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alerts_user_created
+        ON alerts (user_email, created_at DESC)
+    ''')
+
+
+def migration_005_alert_district_id_index(cursor):
+    """Index for counting alerts newer than an id within a district"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alerts_district_id
+        ON alerts (district_key, id)
+    ''')
+
+
+def migration_006_user_scan_stats(cursor):
+    """Per-user analytics aggregates maintained by save_scan/delete_scan, backfilled from history"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_scan_stats (
+            user_email TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            healthy INTEGER NOT NULL DEFAULT 0,
+            named_healthy INTEGER NOT NULL DEFAULT 0,
+            high_risk INTEGER NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_scan_crop_stats (
+            user_email TEXT NOT NULL,
+            crop_name TEXT NOT NULL,
+            scans INTEGER NOT NULL DEFAULT 0,
+            healthy INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_email, crop_name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_scan_month_stats (
+            user_email TEXT NOT NULL,
+            month TEXT NOT NULL,
+            scans INTEGER NOT NULL DEFAULT 0,
+            healthy INTEGER NOT NULL DEFAULT 0,
+            diseased INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_email, month)
+        )
+    ''')
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO user_scan_stats (user_email, total, healthy, named_healthy, high_risk, confidence_sum)
+        SELECT user_email,
+               COUNT(*),
+               SUM(health_status = 'Healthy' OR disease_name LIKE '%Healthy%'),
+               SUM(disease_name LIKE '%Healthy%'),
+               SUM(risk_level = 'High'),
+               SUM(confidence)
+        FROM scan_history
+        GROUP BY user_email
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO user_scan_crop_stats (user_email, crop_name, scans, healthy)
+        SELECT user_email, crop_name, COUNT(*), SUM(health_status = 'Healthy')
+        FROM scan_history
+        WHERE crop_name IS NOT NULL
+        GROUP BY user_email, crop_name
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO user_scan_month_stats (user_email, month, scans, healthy, diseased)
+        SELECT user_email, strftime('%Y-%m', scan_date), COUNT(*),
+               SUM(health_status = 'Healthy'), SUM(health_status = 'Diseased')
+        FROM scan_history
+        WHERE scan_date IS NOT NULL
+        GROUP BY user_email, strftime('%Y-%m', scan_date)
+    ''')
+
+
+def migration_007_user_scan_stats_version(cursor):
+    """Version counter on user_scan_stats, used for dashboard ETags"""
+    _add_column(cursor, 'user_scan_stats', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def migration_008_scan_queue_seq(cursor):
+    """Write-behind queue sequence on scan_history, unique so journal replays are idempotent"""
+    _add_column(cursor, 'scan_history', 'queue_seq', 'TEXT')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_scan_history_queue_seq
+        ON scan_history (queue_seq) WHERE queue_seq IS NOT NULL
+    ''')
+
+
+def migration_009_cache_versions(cursor):
+    """Version counters bumped on writes, so other processes can drop stale cache entries"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('users', 0)")
+
+
+def migration_010_user_settings_index(cursor):
+    """Covering index so notification settings are read without loading the user row"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_settings
+        ON users (email, notifications_enabled)
+    ''')
+
+
+def migration_011_verification_tokens(cursor):
+    """Used verification tokens and pending verifications, shared by all workers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS used_tokens (
+            token_hash TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_used_tokens_expires ON used_tokens (expires_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pending_verifications (
+            email TEXT PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_verifications_expires ON pending_verifications (expires_at)')
+    _add_column(cursor, 'users', 'email_verified', 'INTEGER DEFAULT 0')
+
+
+def migration_012_email_outbox(cursor):
+    """Outbound email queue drained by the background sender"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            claimed_by TEXT,
+            claimed_until REAL,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, next_attempt_at)
+    ''')
+
+
+def migration_013_alert_digests(cursor):
+    """District alert digest runs and progress, subscriber index and bulk mail priority"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_digest_runs (
+            period_end INTEGER PRIMARY KEY,
+            first_alert_id INTEGER NOT NULL,
+            last_alert_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            claimed_by TEXT,
+            claimed_until REAL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            districts INTEGER,
+            emails INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_digest_progress (
+            period_end INTEGER NOT NULL,
+            district_key TEXT NOT NULL,
+            last_email TEXT NOT NULL DEFAULT '',
+            emails INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period_end, district_key)
+        ) WITHOUT ROWID
+    ''')
+    # Subscribers of a district in email order, read without touching the user rows
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_district_notify
+        ON users (district_key, email, notifications_enabled, full_name)
+    ''')
+    # Bulk mail (digests) is sent after transactional mail that is due
+    _add_column(cursor, 'email_outbox', 'priority', 'INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('DROP INDEX IF EXISTS idx_email_outbox_due')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, priority, next_attempt_at)
+    ''')
+
+
+def migration_014_chat_response_cache(cursor):
+    """Persistent chat answers shared by workers and kept across restarts"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+# Ordered list of (version, description, function). Append only; never renumber.
+MIGRATIONS = [
+    (1, 'initial schema', migration_001_initial_schema),
+    (2, 'history and alert indexes', migration_002_history_and_alert_indexes),
+    (3, 'history keyset pagination index', migration_003_history_keyset_index),
+    (4, 'alert and user district keys', migration_004_district_keys),
+    (5, 'alert district/id index', migration_005_alert_district_id_index),
+    (6, 'user scan stats aggregates', migration_006_user_scan_stats),
+    (7, 'user scan stats version', migration_007_user_scan_stats_version),
+    (8, 'scan history queue sequence', migration_008_scan_queue_seq),
+    (9, 'cache version counters', migration_009_cache_versions),
+    (10, 'user settings covering index', migration_010_user_settings_index),
+    (11, 'verification token store', migration_011_verification_tokens),
+    (12, 'email outbox', migration_012_email_outbox),
+    (13, 'alert digests', migration_013_alert_digests),
+    (14, 'chat response cache', migration_014_chat_response_cache),
+]
+
+
+def get_schema_version(conn):
+    """Get the highest applied migration version (0 for a new database)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    """
+    Apply pending migrations in order, each in its own transaction
+    BEGIN IMMEDIATE takes the write lock first, so concurrent workers starting
+    at the same time apply each migration exactly once.
+    Returns: list of applied versions
+    """
+    applied = []
+    if conn.in_transaction:
+        conn.commit()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock in case another process got here first
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+
+            start = time.perf_counter()
+            migrate(cursor)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+            print(f"Applied migration {version:03d} ({description}) in {(time.perf_counter() - start) * 1000:.1f}ms")
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
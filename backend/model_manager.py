@@ -4,6 +4,9 @@ Handles loading and prediction for all 4 models covering 8 crops
 """
 import os
 import json
+import zlib
+import logging
+from contextlib import nullcontext
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -11,6 +14,8 @@ from tensorflow.keras.applications.efficientnet import preprocess_input as effic
 import torch
 from PIL import Image
 
+logger = logging.getLogger('agridetect.model_manager')
+
 class MultiModelManager:
     def __init__(self, models_dir='models'):
         """Initialize multi-model manager"""
@@ -111,44 +116,50 @@ class MultiModelManager:
             # This is simplified - real implementation needs model architecture
             return {'config': config, 'weights_path': weights_path}
     
-    def preprocess_image(self, image, model_name, target_size=(224, 224)):
+    def _stage(self, timer, name):
+        """Timing context for a stage (no-op when no timer is given)"""
+        return timer.stage(name) if timer is not None else nullcontext()
+    
+    def preprocess_image(self, image, model_name, target_size=(224, 224), timer=None):
         """Preprocess image for prediction (model-specific)"""
-        # Resize image
-        if isinstance(image, Image.Image):
-            img_resized = image.resize(target_size)
-        else:
-            img_resized = Image.fromarray(image).resize(target_size)
-        
-        # Convert to array
-        img_array = np.array(img_resized, dtype='float32')
-        
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        # Model-specific preprocessing
-        if model_name == 'corn_blackgram':
-            # Model 2 uses EfficientNet preprocessing (critical!)
-            img_array = efficientnet_preprocess(img_array)
-        else:
-            # Other models use simple [0,1] normalization
-            img_array = img_array / 255.0
+        # Resize image (skipped when predict_all already resized it)
+        with self._stage(timer, 'resize'):
+            if not isinstance(image, Image.Image):
+                image = Image.fromarray(image)
+            img_resized = image if image.size == target_size else image.resize(target_size)
+        
+        with self._stage(timer, 'normalize'):
+            # Convert to array
+            img_array = np.array(img_resized, dtype='float32')
+            
+            # Add batch dimension
+            img_array = np.expand_dims(img_array, axis=0)
+            
+            # Model-specific preprocessing
+            if model_name == 'corn_blackgram':
+                # Model 2 uses EfficientNet preprocessing (critical!)
+                img_array = efficientnet_preprocess(img_array)
+            else:
+                # Other models use simple [0,1] normalization
+                img_array = img_array / 255.0
         
         return img_array
     
-    def predict_single_model(self, model_name, image):
+    def predict_single_model(self, model_name, image, timer=None):
         """Run prediction on a single model"""
         if model_name not in self.models:
             return None
         
         model = self.models[model_name]
-        processed_image = self.preprocess_image(image, model_name)  # Pass model_name for correct preprocessing
+        processed_image = self.preprocess_image(image, model_name, timer=timer)  # Pass model_name for correct preprocessing
         
         # Handle different model types
-        if model_name == 'tomato_cotton':  # PyTorch model
-            return self._predict_pytorch(model, processed_image)
-        else:  # TensorFlow/Keras models
-            predictions = model.predict(processed_image, verbose=0)
-            return predictions[0]
+        with self._stage(timer, f'forward.{model_name}'):
+            if model_name == 'tomato_cotton':  # PyTorch model
+                return self._predict_pytorch(model, processed_image)
+            else:  # TensorFlow/Keras models
+                predictions = model.predict(processed_image, verbose=0)
+                return predictions[0]
     
     def _predict_pytorch(self, model, image):
         """Make prediction with PyTorch model"""
@@ -172,38 +183,51 @@ class MultiModelManager:
                 predictions = exp_pred / exp_pred.sum()
                 return predictions
     
-    def predict_all(self, image):
+    def predict_all(self, image, timer=None, fingerprint=False):
         """
         Run all models and return best prediction
+        Optional timer (metrics.StageTimer) records resize/normalize/forward/post_process stages
+        If fingerprint is True, a CRC32 of the downscaled 224x224 input is included
         Returns: dict with disease, confidence, model_used, and all_predictions
         """
         all_predictions = []
         
+        # All models share the same input size, so resize once up front
+        with self._stage(timer, 'resize'):
+            if not isinstance(image, Image.Image):
+                image = Image.fromarray(image)
+            if image.size != (224, 224):
+                image = image.resize((224, 224))
+        
+        input_fingerprint = f"{zlib.crc32(image.tobytes()):08x}" if fingerprint else None
+        
         for model_name in self.models.keys():
             try:
-                predictions = self.predict_single_model(model_name, image)
+                predictions = self.predict_single_model(model_name, image, timer=timer)
                 
                 if predictions is not None:
-                    class_idx = np.argmax(predictions)
-                    confidence = float(predictions[class_idx])
-                    
-                    # Get class label
-                    labels = self.class_labels.get(model_name, [])
-                    disease_name = labels[class_idx] if class_idx < len(labels) else f"Class_{class_idx}"
-                    
-                    all_predictions.append({
-                        'model': model_name,
-                        'disease': disease_name,
-                        'confidence': confidence,
-                        'class_index': int(class_idx)
-                    })
+                    with self._stage(timer, 'post_process'):
+                        class_idx = np.argmax(predictions)
+                        confidence = float(predictions[class_idx])
+                        
+                        # Get class label
+                        labels = self.class_labels.get(model_name, [])
+                        disease_name = labels[class_idx] if class_idx < len(labels) else f"Class_{class_idx}"
+                        
+                        all_predictions.append({
+                            'model': model_name,
+                            'disease': disease_name,
+                            'confidence': confidence,
+                            'class_index': int(class_idx)
+                        })
             except Exception as e:
-                print(f"[ERROR] Prediction failed for {model_name}: {str(e)}")
+                logger.error("Prediction failed for %s: %s", model_name, e)
         
         if not all_predictions:
             return {
                 'error': 'All models failed to make predictions',
-                'success': False
+                'success': False,
+                'fingerprint': input_fingerprint
             }
         
         # Get best prediction (highest confidence)
@@ -216,7 +240,8 @@ class MultiModelManager:
                 'error': 'Low confidence detection',
                 'message': 'Please upload a clear image of Rice, Potato, Corn, Blackgram, Tomato, or Cotton crop',
                 'confidence': best_prediction['confidence'],
-                'all_predictions': all_predictions
+                'all_predictions': all_predictions,
+                'fingerprint': input_fingerprint
             }
         
         return {
@@ -224,7 +249,8 @@ class MultiModelManager:
             'disease': best_prediction['disease'],
             'confidence': best_prediction['confidence'],
             'model_used': best_prediction['model'],
-            'all_predictions': all_predictions
+            'all_predictions': all_predictions,
+            'fingerprint': input_fingerprint
         }
 
 # Global instance
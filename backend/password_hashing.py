@@ -0,0 +1,138 @@
+"""
+Password hashing off the request thread
+bcrypt is deliberately slow (~0.25s of CPU per call at cost 12), so hashes and
+checks run on a small process pool instead of the request threads. At most
+PASSWORD_HASH_MAX_PENDING operations are queued per worker process; beyond that
+(or when a hash takes longer than PASSWORD_HASH_TIMEOUT) callers get
+PasswordHasherBusy instead of piling up behind a burst of logins.
+The pool is forked by start_password_hasher() while the worker is still
+single-threaded (gunicorn post_fork); processes that never call it hash on the
+request thread.
+"""
+import os
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from metrics import metrics_registry
+
+# bcrypt cost factor for new hashes; hashes with another cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# Hashing processes per worker (0 = hash on the request thread, e.g. on Windows dev servers)
+PASSWORD_HASH_WORKERS = int(os.getenv(
+    'PASSWORD_HASH_WORKERS', 2 if 'fork' in multiprocessing.get_all_start_methods() else 0))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+PASSWORD_HASH_QUEUE_WAIT = float(os.getenv('PASSWORD_HASH_QUEUE_WAIT', 2))  # seconds to wait for a slot
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 30))
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password hashes are already queued (or the pool did not answer in time)"""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, stored_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+
+
+def hash_rounds(stored_hash):
+    """Cost factor of a bcrypt hash ('$2b$12$...' -> 12), or None if it is not one"""
+    try:
+        return int(stored_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Bounded process pool for bcrypt hash/check calls"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.rounds = rounds
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        if workers > 0:
+            # Forked children only run bcrypt; spawn would re-import the app (and its models)
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+    def _run(self, name, func, *args):
+        if not self._slots.acquire(timeout=PASSWORD_HASH_QUEUE_WAIT):
+            metrics_registry.counter('auth.bcrypt.rejected').inc()
+            raise PasswordHasherBusy("Too many sign-ins in progress, please retry shortly")
+        start = time.perf_counter()
+        try:
+            if self._pool is None:
+                return func(*args)
+            future = self._pool.submit(func, *args)
+            try:
+                return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+            except FutureTimeoutError:
+                future.cancel()
+                metrics_registry.counter('auth.bcrypt.timeout').inc()
+                raise PasswordHasherBusy("Sign-in is taking too long, please retry shortly") from None
+        finally:
+            self._slots.release()
+            metrics_registry.histogram(f'auth.bcrypt.{name}').observe((time.perf_counter() - start) * 1000)
+
+    def warm(self):
+        """Fork all hashing processes now (fork pools otherwise start them on the first hash)"""
+        if self._pool is not None:
+            for future in [self._pool.submit(hash_rounds, '') for _ in range(self.workers)]:
+                future.result(timeout=PASSWORD_HASH_TIMEOUT)
+
+    def hash(self, password):
+        """Hash a password with the configured cost factor"""
+        return self._run('hash', _hash, password, self.rounds)
+
+    def verify(self, stored_hash, password):
+        """Check a password against its stored hash"""
+        return self._run('verify', _check, password, stored_hash)
+
+    def needs_rehash(self, stored_hash):
+        """True if the hash was made with a different cost factor than the configured one"""
+        return hash_rounds(stored_hash) != self.rounds
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def start_password_hasher(workers=PASSWORD_HASH_WORKERS):
+    """
+    Create this process's password hasher and fork its hashing processes
+    Call before the process starts any other thread (gunicorn post_fork): a child forked
+    while another thread holds a lock (logging, the database pool, ...) can deadlock on it.
+    """
+    global _hasher
+    with _hasher_lock:
+        if _hasher is not None and _hasher.pid == os.getpid():
+            _hasher.shutdown()
+        _hasher = PasswordHasher(workers=workers)
+        _hasher.warm()
+        atexit.register(_hasher.shutdown)
+    return _hasher
+
+
+def get_password_hasher():
+    """
+    Get this process's password hasher
+    Without start_password_hasher() in this process (dev servers, forked workers) it hashes
+    on the calling thread: forking the pool lazily would happen with other threads running.
+    """
+    global _hasher
+    if _hasher is None or _hasher.pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher.pid != os.getpid():
+                _hasher = PasswordHasher(workers=0)
+    return _hasher
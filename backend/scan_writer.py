@@ -0,0 +1,341 @@
+"""
+Write-behind queue for scan history
+/api/history/save appends the scan to a local journal file and returns a provisional
+id immediately; a background writer inserts queued scans into SQLite in batched
+transactions. Journals left behind by a crashed process are replayed on startup.
+A scan the database rejects is moved to queue_dir/dead_letter/ instead of
+blocking the scans queued after it.
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from database import insert_scans, derive_scan_status
+from metrics import metrics_registry
+from logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server, no journal locking
+    fcntl = None
+
+SCAN_WRITE_BEHIND = os.getenv('SCAN_WRITE_BEHIND', 'true').lower() == 'true'
+SCAN_QUEUE_DIR = os.getenv('SCAN_QUEUE_DIR', 'scan_queue')
+SCAN_QUEUE_BATCH_SIZE = int(os.getenv('SCAN_QUEUE_BATCH_SIZE', 500))
+SCAN_QUEUE_FLUSH_INTERVAL = float(os.getenv('SCAN_QUEUE_FLUSH_INTERVAL', 0.2))  # seconds
+# Backpressure: saves wait up to SCAN_QUEUE_PUT_TIMEOUT for room, then are rejected
+SCAN_QUEUE_MAX_PENDING = int(os.getenv('SCAN_QUEUE_MAX_PENDING', 10000))
+SCAN_QUEUE_PUT_TIMEOUT = float(os.getenv('SCAN_QUEUE_PUT_TIMEOUT', 2))
+# fsync every journal append (survives power loss, not just process crashes)
+SCAN_QUEUE_FSYNC = os.getenv('SCAN_QUEUE_FSYNC', 'false').lower() == 'true'
+SCAN_QUEUE_RETRY_MAX = float(os.getenv('SCAN_QUEUE_RETRY_MAX', 30))  # max seconds between failed flushes
+
+logger = get_logger('scan_writer')
+
+
+class ScanWriter:
+    """
+    Durable write-behind queue for scans owned by one process
+    Every enqueued scan is appended to this process's journal before it is
+    acknowledged; the journal is truncated once everything in it is committed.
+    """
+
+    def __init__(self, queue_dir=SCAN_QUEUE_DIR, batch_size=SCAN_QUEUE_BATCH_SIZE,
+                 flush_interval=SCAN_QUEUE_FLUSH_INTERVAL, max_pending=SCAN_QUEUE_MAX_PENDING):
+        self.queue_dir = queue_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pid = os.getpid()
+        self._pending = []  # scans not yet committed, in journal order
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._journal = None
+        self._journal_rows = 0  # lines in the journal, including scans already committed
+        self._journal_path = os.path.join(queue_dir, f"scans-{self.pid}-{uuid.uuid4().hex[:8]}.jsonl")
+        self._dead_letter_path = os.path.join(queue_dir, 'dead_letter', os.path.basename(self._journal_path))
+
+    # ----- journal -----
+
+    @staticmethod
+    def _open_locked(path):
+        handle = open(path, 'a+', encoding='utf-8')
+        if fcntl is not None:
+            # Held for the life of the process; recovery skips journals that are still locked
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return handle
+
+    def _open_journal(self):
+        os.makedirs(self.queue_dir, exist_ok=True)
+        self._journal = self._open_locked(self._journal_path)
+
+    def _append_journal(self, scan):
+        self._journal.write(json.dumps(scan) + '\n')
+        self._journal.flush()
+        if SCAN_QUEUE_FSYNC:
+            os.fsync(self._journal.fileno())
+        self._journal_rows += 1
+
+    def _truncate_journal(self):
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._journal_rows = 0
+
+    def _compact_journal(self):
+        """
+        Rewrite the journal with only the pending scans (caller holds the lock)
+        The new file is locked before it replaces the old one, so recovery never sees it unowned.
+        """
+        tmp_path = self._journal_path + '.compact'
+        handle = self._open_locked(tmp_path)
+        handle.writelines(json.dumps(scan) + '\n' for scan in self._pending)
+        handle.flush()
+        os.fsync(handle.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._journal.close()
+        self._journal = handle
+        self._journal_rows = len(self._pending)
+        metrics_registry.counter('scan_queue.compactions').inc()
+
+    def _dead_letter(self, scan, error):
+        """Set aside a scan the database will never accept, with the reason"""
+        os.makedirs(os.path.dirname(self._dead_letter_path), exist_ok=True)
+        with open(self._dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({**scan, 'error': error, 'failed_at': time.time()}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        metrics_registry.counter('scan_queue.dead_lettered').inc()
+        logger.error("Scan rejected by the database, moved to dead letter",
+                     extra={'fields': {'queue_seq': scan.get('queue_seq'), 'error': error,
+                                       'dead_letter': self._dead_letter_path}})
+
+    def _claim_orphans(self):
+        """Load scans from journals whose owning process is gone"""
+        recovered = []
+        claimed = []
+        for name in sorted(os.listdir(self.queue_dir)):
+            path = os.path.join(self.queue_dir, name)
+            if not name.endswith('.jsonl') or path == self._journal_path:
+                continue
+            try:
+                handle = open(path, 'r+', encoding='utf-8')
+            except OSError:
+                continue
+            if fcntl is not None:
+                try:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    handle.close()  # Owned by a live process
+                    continue
+            for line in handle:
+                try:
+                    recovered.append(json.loads(line))
+                except ValueError:
+                    # A crash can leave the last line half-written; it was never acknowledged
+                    logger.warning("Skipping torn journal line", extra={'fields': {'journal': name}})
+            claimed.append((path, handle))
+        return recovered, claimed
+
+    # ----- lifecycle -----
+
+    def start(self):
+        """Open the journal, replay orphaned journals and start the flush thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._journal is None:
+            self._open_journal()
+            recovered, claimed = self._claim_orphans()
+            if recovered:
+                # Re-journal before deleting the orphans, so a crash during replay loses nothing
+                with self._lock:
+                    for scan in recovered:
+                        self._append_journal(scan)
+                        self._pending.append(scan)
+                metrics_registry.counter('scan_queue.replayed').inc(len(recovered))
+                logger.info("Replaying queued scans from previous run",
+                            extra={'fields': {'scans': len(recovered), 'journals': len(claimed)}})
+            for path, handle in claimed:
+                handle.close()
+                os.remove(path)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='scan-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Flush what is queued, stop the flush thread and remove the journal if it is empty"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            if self._journal is not None and not self._pending:
+                self._journal.close()
+                self._journal = None
+                os.remove(self._journal_path)
+
+    # ----- producer side -----
+
+    def enqueue(self, user_email, disease_name, confidence, crop_name=None, severity=None,
+                image_url=None, risk_level=None, health_status=None):
+        """
+        Journal a scan for background insertion
+        Returns: (success, provisional_id_or_message)
+        """
+        health_status, risk_level = derive_scan_status(disease_name, confidence, health_status, risk_level)
+        scan = {
+            'queue_seq': uuid.uuid4().hex,
+            'enqueued_at': time.time(),
+            'scan_date': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'user_email': user_email,
+            'disease_name': disease_name,
+            'confidence': confidence,
+            'crop_name': crop_name,
+            'severity': severity,
+            'image_url': image_url,
+            'risk_level': risk_level,
+            'health_status': health_status
+        }
+
+        with self._not_full:
+            if not self._not_full.wait_for(lambda: len(self._pending) < self.max_pending,
+                                           timeout=SCAN_QUEUE_PUT_TIMEOUT):
+                metrics_registry.counter('scan_queue.rejected').inc()
+                return False, "Scan queue is full, please retry shortly"
+            self._append_journal(scan)
+            self._pending.append(scan)
+            pending = len(self._pending)
+
+        metrics_registry.gauge('scan_queue.pending').set(pending)
+        if pending >= self.batch_size:
+            self._wake.set()
+        return True, scan['queue_seq']
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    # ----- flusher side -----
+
+    def _insert_rows(self, batch):
+        """
+        Insert a batch, falling back to one scan per transaction if the database rejects it
+        sqlite3.OperationalError (locked, disk full) is raised so the whole batch is retried later.
+        Returns: list of scans that were dead-lettered
+        """
+        rows = [{key: value for key, value in scan.items() if key != 'enqueued_at'} for scan in batch]
+        try:
+            insert_scans(rows)
+            return []
+        except sqlite3.OperationalError:
+            raise
+        except Exception as e:
+            if len(rows) == 1:
+                self._dead_letter(rows[0], str(e))
+                return batch
+            logger.warning("Scan batch rejected, retrying row by row",
+                           extra={'fields': {'scans': len(rows), 'error': str(e)}})
+
+        rejected = []
+        for scan, row in zip(batch, rows):
+            try:
+                insert_scans([row])  # rows committed before an OperationalError are skipped on retry
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                self._dead_letter(row, str(e))
+                rejected.append(scan)
+        return rejected
+
+    def flush(self):
+        """
+        Write queued scans to the database in batches
+        Returns: number of scans committed
+        """
+        committed = 0
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+            if not batch:
+                return committed
+
+            start = time.perf_counter()
+            try:
+                rejected = self._insert_rows(batch)
+            except Exception:
+                metrics_registry.counter('scan_queue.flush_errors').inc()
+                raise
+            flush_ms = (time.perf_counter() - start) * 1000
+
+            now = time.time()
+            with self._not_full:
+                del self._pending[:len(batch)]
+                if not self._pending:
+                    self._truncate_journal()
+                elif self._journal_rows > 2 * len(self._pending) + self.batch_size:
+                    # Mostly committed scans: drop them so a restart doesn't replay the whole file
+                    self._compact_journal()
+                pending = len(self._pending)
+                self._not_full.notify_all()
+
+            stored = len(batch) - len(rejected)
+            metrics_registry.histogram('scan_queue.flush').observe(flush_ms)
+            metrics_registry.histogram('scan_queue.batch_size').observe(len(batch))
+            enqueue_to_commit = metrics_registry.histogram('scan_queue.enqueue_to_commit')
+            rejected_ids = {id(scan) for scan in rejected}
+            for scan in batch:
+                if id(scan) in rejected_ids:
+                    continue
+                enqueue_to_commit.observe((now - scan['enqueued_at']) * 1000)
+            metrics_registry.counter('scan_queue.flushed').inc(stored)
+            metrics_registry.gauge('scan_queue.pending').set(pending)
+            committed += stored
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                self.flush()
+                backoff = self.flush_interval
+            except Exception as e:
+                backoff = min(max(backoff * 2, 0.5), SCAN_QUEUE_RETRY_MAX)
+                logger.error("Scan queue flush failed, will retry",
+                             extra={'fields': {'error': str(e), 'retry_in_s': backoff}})
+            if stopping:
+                return
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_scan_writer():
+    """
+    Get this process's scan writer, starting it on first use (recreated after fork)
+    Call it after forking (gunicorn post_fork), not in a preloading master process,
+    so the journal lock belongs to the worker.
+    """
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                _writer = ScanWriter()
+                _writer.start()
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def start_scan_writer():
+    """Start the writer (replaying journals left by crashed processes) if write-behind is enabled"""
+    if SCAN_WRITE_BEHIND:
+        get_scan_writer()
@@ -0,0 +1,231 @@
+"""
+Semantic answer cache for the chat assistant
+Questions are reduced to stemmed content words and compared as TF-IDF vectors
+within their (crop, disease, language) partition, so "how to treat rust" and
+"rust treatment?" asked about the same scan reuse one provider answer. A cached
+answer is only returned when the cosine similarity reaches the threshold; IDF is
+computed over each partition's questions, so words every question there shares
+(the crop, "disease") count for little and the intent words decide the match.
+Question words are not terms: "when to spray" and "why spray" share every content
+word with "how to spray", so they are kept as an intent that must not differ.
+"""
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from metrics import metrics_registry
+
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))  # cosine similarity
+SEMANTIC_CACHE_ENTRIES = int(os.getenv('SEMANTIC_CACHE_ENTRIES', 200))  # questions kept per partition
+SEMANTIC_CACHE_PARTITIONS = int(os.getenv('SEMANTIC_CACHE_PARTITIONS', 500))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', os.getenv('CHAT_CACHE_TTL', 86400)))  # seconds
+
+# Words that carry no intent in a farmer's question (negations are deliberately kept)
+STOPWORDS = frozenset('''
+    a an and any are about as at be can could do does for from give have i in is it me my of on or
+    please should tell the this that to will with would you your plant plants crop crops
+    hello hi namaste sir madam kindly help urgent
+'''.split())
+# Question words, by the kind of answer they ask for (Hindi क्या is left out: it also marks yes/no questions)
+QUESTION_WORDS = {
+    'how': 'how', 'कैसे': 'how',
+    'what': 'what', 'which': 'what',
+    'when': 'when', 'कब': 'when',
+    'why': 'why', 'क्यों': 'why',
+    'where': 'where', 'कहाँ': 'where',
+}
+_SUFFIXES = ('ations', 'ation', 'ments', 'ment', 'ings', 'ing', 'ions', 'ion', 'ers', 'er', 'ies', 'es', 'ed', 's')
+# Latin letters and digits plus the Indic scripts the chat supports (Devanagari to Tamil/Telugu/Kannada)
+_WORD = re.compile(r'[\w\u0900-\u0cff]+')
+
+
+def _stem(word):
+    """Crude English suffix stripping; other scripts are compared as written"""
+    if not word.isascii():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    return word[:-1] if word.endswith('e') and len(word) > 3 else word
+
+
+def question_terms(message, context=None):
+    """
+    Term counts of a question's stemmed content words
+    Words of the context's crop and disease are dropped: the partition already implies them
+    """
+    text = unicodedata.normalize('NFKC', message or '').casefold()
+    terms = Counter(_stem(word) for word in _WORD.findall(text)
+                    if word not in STOPWORDS and word not in QUESTION_WORDS and word != '_')
+    if context:
+        for word in _WORD.findall(f"{context.get('crop') or ''} {context.get('disease') or ''}".casefold()):
+            terms.pop(_stem(word), None)
+    return terms
+
+
+def question_intent(message):
+    """Kinds of question asked (how, when, ...); empty for a bare topic such as 'rust treatment'"""
+    text = unicodedata.normalize('NFKC', message or '').casefold()
+    return frozenset(QUESTION_WORDS[word] for word in _WORD.findall(text) if word in QUESTION_WORDS)
+
+
+def _intents_conflict(a, b):
+    """Two questions ask different things if both name a kind of question and they differ"""
+    return bool(a) and bool(b) and a != b
+
+
+def _partition_key(context, language):
+    context = context or {}
+    return (str(context.get('crop') or '').casefold().strip(),
+            str(context.get('disease') or '').casefold().strip(),
+            language)
+
+
+class _Partition:
+    """Questions and answers for one (crop, disease, language), with an inverted index"""
+
+    def __init__(self):
+        self.entries = OrderedDict()  # id -> (terms, intent, answer, expires_at), least recently used first
+        self.by_terms = {}  # (frozenset of terms, intent) -> id, so a repeated question replaces its entry
+        self.postings = {}  # term -> set of ids
+        self.df = Counter()
+        self.next_id = 0
+
+    def remove(self, entry_id):
+        terms, intent, _, _ = self.entries.pop(entry_id)
+        self.by_terms.pop((frozenset(terms), intent), None)
+        for term in terms:
+            self.df[term] -= 1
+            ids = self.postings[term]
+            ids.discard(entry_id)
+            if not ids:
+                del self.postings[term]
+                del self.df[term]
+
+    def add(self, terms, intent, answer, expires_at, max_entries):
+        existing = self.by_terms.get((frozenset(terms), intent))
+        if existing is not None:
+            self.remove(existing)
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = (terms, intent, answer, expires_at)
+        self.by_terms[(frozenset(terms), intent)] = entry_id
+        for term in terms:
+            self.df[term] += 1
+            self.postings.setdefault(term, set()).add(entry_id)
+        while len(self.entries) > max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def best_match(self, terms, intent, now):
+        """(similarity, entry_id) of the closest unexpired question not asking something else, or (0.0, None)"""
+        count = len(self.entries)
+        idf = {term: math.log((1 + count) / (1 + self.df.get(term, 0))) + 1 for term in terms}
+        query = {term: tf * idf[term] for term, tf in terms.items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+        candidates = set()
+        for term in terms:
+            candidates |= self.postings.get(term, set())
+
+        best, best_id, expired = 0.0, None, []
+        for entry_id in candidates:
+            entry_terms, entry_intent, _, expires_at = self.entries[entry_id]
+            if expires_at < now:
+                expired.append(entry_id)
+                continue
+            if _intents_conflict(intent, entry_intent):
+                continue
+            dot = 0.0
+            norm = 0.0
+            for term, tf in entry_terms.items():
+                weight = tf * (math.log((1 + count) / (1 + self.df[term])) + 1)
+                norm += weight * weight
+                if term in query:
+                    dot += weight * query[term]
+            similarity = dot / (query_norm * math.sqrt(norm))
+            if similarity > best:
+                best, best_id = similarity, entry_id
+        for entry_id in expired:
+            self.remove(entry_id)
+        return best, best_id
+
+
+class SemanticCache:
+    """Thread-safe nearest-question answer cache, bounded per partition and in partitions"""
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_ENTRIES,
+                 max_partitions=SEMANTIC_CACHE_PARTITIONS, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_partitions = max_partitions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._partitions = OrderedDict()  # (crop, disease, language) -> _Partition
+        self._hits = metrics_registry.counter('chat.semantic.hit')
+        self._misses = metrics_registry.counter('chat.semantic.miss')
+
+    def match(self, message, context, language):
+        """
+        Closest cached question in the same partition
+        Returns: (answer, similarity) if the similarity reaches the threshold, else (None, best similarity)
+        """
+        start = time.perf_counter()
+        terms = question_terms(message, context)
+        answer, similarity = None, 0.0
+        if terms:
+            with self._lock:
+                partition = self._partitions.get(_partition_key(context, language))
+                if partition is not None:
+                    similarity, entry_id = partition.best_match(terms, question_intent(message), time.monotonic())
+                    if entry_id is not None and similarity >= self.threshold:
+                        partition.entries.move_to_end(entry_id)
+                        answer = partition.entries[entry_id][2]
+        metrics_registry.histogram('chat.semantic.lookup').observe((time.perf_counter() - start) * 1000)
+        (self._hits if answer is not None else self._misses).inc()
+        return answer, similarity
+
+    def lookup(self, message, context, language):
+        """Cached answer to an equivalent question, or None"""
+        return self.match(message, context, language)[0]
+
+    def add(self, message, context, language, answer):
+        """Remember a provider answer for later paraphrases"""
+        terms = question_terms(message, context)
+        if not terms or not answer:
+            return
+        key = _partition_key(context, language)
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition()
+                while len(self._partitions) > self.max_partitions:
+                    self._partitions.popitem(last=False)
+            self._partitions.move_to_end(key)
+            partition.add(terms, question_intent(message), answer, time.monotonic() + self.ttl, self.max_entries)
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self):
+        """Size and hit rate for /api/metrics"""
+        hits, misses = self._hits.value, self._misses.value
+        with self._lock:
+            partitions = len(self._partitions)
+            size = sum(len(partition.entries) for partition in self._partitions.values())
+        return {
+            'size': size,
+            'partitions': partitions,
+            'threshold': self.threshold,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0
+        }
+
+
+# Global cache instance
+semantic_cache = SemanticCache()
@@ -0,0 +1,98 @@
+"""
+Signed, stateless session tokens for AgriDetect AI
+Issued at login and sent back as 'Authorization: Bearer <token>' (or ?access_token=
+where headers cannot be set, e.g. EventSource). Checking one is an HMAC verification
+with the itsdangerous serializer also used for email verification links; no
+database lookup is needed to know who a request is for.
+"""
+import os
+from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
+from dotenv import load_dotenv
+from metrics import metrics_registry
+
+load_dotenv()
+
+SESSION_TOKEN_MAX_AGE = int(os.getenv('SESSION_TOKEN_MAX_AGE', 7 * 86400))  # seconds
+# Reject requests that name a user by email parameter without a session token
+# (false accepts the legacy ?email= identification, letting any client act as any user)
+SESSION_REQUIRED = os.getenv('SESSION_REQUIRED', 'true').lower() == 'true'
+# Keys anyone can read in the source or .env.example; signing with one lets a client mint tokens for any email
+_PUBLIC_KEYS = frozenset({'your-secret-key-change-in-production'})
+
+
+class SessionKeyMissing(RuntimeError):
+    """SECRET_KEY is unset (or a published placeholder), so session tokens cannot be issued or trusted"""
+
+
+class SessionManager:
+    """Issue and verify session tokens (salted apart from verification tokens)"""
+
+    def __init__(self, secret_key=None, max_age=SESSION_TOKEN_MAX_AGE):
+        secret_key = secret_key or os.getenv('SECRET_KEY', '')
+        self.secret_key = secret_key if secret_key not in _PUBLIC_KEYS else ''
+        self.serializer = URLSafeTimedSerializer(self.secret_key, salt='session') if self.secret_key else None
+        self.max_age = max_age
+
+    def require_key(self):
+        """Raise SessionKeyMissing unless a private signing key is configured (checked at app startup)"""
+        if self.serializer is None:
+            raise SessionKeyMissing("SECRET_KEY is not set (or is the .env.example placeholder); "
+                                    "set it to a long random value, e.g. python -c 'import secrets; print(secrets.token_hex(32))'")
+
+    def issue(self, email, full_name=None):
+        """Create a session token for a signed-in user"""
+        self.require_key()
+        return self.serializer.dumps({'email': email, 'fullName': full_name})
+
+    def verify(self, token):
+        """
+        Verify a session token
+        Returns: (success, principal_dict_or_error_message)
+        """
+        if self.serializer is None:
+            return False, "Sessions are not configured on this server"
+        try:
+            principal = self.serializer.loads(token, max_age=self.max_age)
+        except SignatureExpired:
+            metrics_registry.counter('auth.session.expired').inc()
+            return False, "Session expired, please log in again"
+        except BadSignature:
+            metrics_registry.counter('auth.session.invalid').inc()
+            return False, "Invalid session token"
+        if not isinstance(principal, dict) or not principal.get('email'):
+            return False, "Invalid session token"
+        return True, principal
+
+    def authenticate(self, authorization, access_token, claimed_emails):
+        """
+        Resolve the principal for a request
+        authorization is the Authorization header, claimed_emails the email
+        parameters the request carries (query, form or JSON body).
+        Returns: (principal_or_None, error_message_or_None, http_status)
+        """
+        token = authorization[7:].strip() if authorization and authorization.startswith('Bearer ') else access_token
+        claimed = {email for email in claimed_emails if email}
+        if not token:
+            if claimed and SESSION_REQUIRED:
+                return None, "Login required", 401
+            return None, None, 200
+
+        if self.serializer is None:
+            return None, "Sessions are not configured on this server", 503
+        success, result = self.verify(token)
+        if not success:
+            return None, result, 401
+        if claimed - {result['email']}:
+            return None, "Email does not match the signed-in user", 403
+        return result, None, 200
+
+
+def principal_email(principal, params, key='email'):
+    """Email a request acts for: the session principal's, else the legacy email parameter"""
+    if principal is not None:
+        return principal['email']
+    return params.get(key)
+
+
+# Create singleton instance
+session_manager = SessionManager()
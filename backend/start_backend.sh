@@ -6,4 +6,8 @@ echo "1. Python installed"
 echo "2. Dependencies installed (pip install -r requirements.txt)"
 echo "3. Your model.h5 file in backend/models/"
 echo ""
-python app.py
+if [ "$1" = "prod" ]; then
+    gunicorn -c gunicorn.conf.py wsgi:app
+else
+    python app.py
+fi
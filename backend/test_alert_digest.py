@@ -0,0 +1,104 @@
+"""
+Check district alert digests: one email per subscriber per period, and resuming an interrupted run
+Digests are only queued on the outbox, nothing is sent.
+"""
+import time
+import database
+import alert_digest
+from alert_digest import DigestEngine
+from location_helpers import district_key
+
+
+def add_users(users):
+    """users: (email, address, notifications_enabled)"""
+    with database.get_db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO users (email, full_name, phone, password_hash, address, district_key, notifications_enabled) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(email, email.split('@')[0].title(), '0000000000', 'x', address, district_key(address), enabled)
+             for email, address, enabled in users]
+        )
+
+
+def post_alert(location, user_email, disease='Tomato_Late_Blight', created_at=None):
+    with database.get_db_connection() as conn:
+        conn.execute('INSERT INTO alerts (farmer_name, location, disease_reported, user_email, district_key, created_at) '
+                     "VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))",
+                     ('Farmer', location, disease, user_email, district_key(location), created_at or time.time()))
+
+
+def queued():
+    with database.get_db_connection() as conn:
+        rows = conn.execute('SELECT to_email, subject, html, priority FROM email_outbox ORDER BY id').fetchall()
+    return [dict(row) for row in rows]
+
+
+def test_one_digest_per_subscriber_per_period(db):
+    add_users([('asha@example.com', 'Mysore, Karnataka', 1), ('ravi@example.com', 'Mysuru, Karnataka', 1),
+               ('muted@example.com', 'Mysore, Karnataka', 0), ('far@example.com', 'Hubli, Karnataka', 1)])
+    post_alert('Mysore, Karnataka', 'ravi@example.com')
+    engine = DigestEngine(period=3600)
+    now = time.time() + 3600  # The digest is sent once the period the alert was posted in is over
+
+    summary = engine.run(now)
+    assert summary['districts'] == 1 and summary['emails'] == 1
+    [mail] = queued()
+    assert mail['to_email'] == 'asha@example.com' and mail['priority'] == 1
+    assert 'Hi Asha,' in mail['html'] and 'Tomato Late Blight' in mail['html']
+    assert engine.run(now) is None and DigestEngine(period=3600).run(now) is None
+
+    # Next period only covers alerts posted since; the author of one alert still hears about the other
+    post_alert('Mysore, Karnataka', 'asha@example.com', 'Corn_Common_Rust')
+    post_alert('Bangalore, Karnataka', None)
+    summary = engine.run(now + 3600)
+    assert summary['districts'] == 2 and summary['emails'] == 1
+    assert [mail['to_email'] for mail in queued()] == ['asha@example.com', 'ravi@example.com']
+    assert 'Corn Common Rust' in queued()[1]['html'] and 'Tomato' not in queued()[1]['html']
+
+
+def test_interrupted_run_resumes_without_duplicates(db):
+    add_users([(f'farmer{i:02d}@example.com', 'Mysore, Karnataka', 1) for i in range(7)])
+    post_alert('Mysore, Karnataka', None)
+    now = time.time() + 3600
+
+    calls = []
+    enqueue_emails = alert_digest.enqueue_emails
+
+    def failing_enqueue(messages, priority):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError('worker killed')
+        return enqueue_emails(messages, priority)
+
+    alert_digest.enqueue_emails = failing_enqueue
+    try:
+        DigestEngine(period=3600, batch_size=2).run(now)
+        assert False, 'run should have failed'
+    except RuntimeError:
+        pass
+    finally:
+        alert_digest.enqueue_emails = enqueue_emails
+    assert len(queued()) == 4
+
+    # A live claim blocks other workers until it lapses
+    other = DigestEngine(period=3600, batch_size=2)
+    assert other.run(now) is None
+    with database.get_db_connection() as conn:
+        conn.execute('UPDATE alert_digest_runs SET claimed_until = 0')
+    assert other.run(now)['emails'] == 7
+    recipients = [mail['to_email'] for mail in queued()]
+    assert sorted(recipients) == [f'farmer{i:02d}@example.com' for i in range(7)]
+
+
+def test_late_run_leaves_next_period_alerts_to_the_next_digest(db):
+    add_users([('asha@example.com', 'Mysore, Karnataka', 1)])
+    period_end = int(time.time()) // 3600 * 3600
+    post_alert('Mysore, Karnataka', None, created_at=period_end - 60)
+    post_alert('Mysore, Karnataka', None, disease='Corn_Common_Rust', created_at=period_end + 60)
+
+    engine = DigestEngine(period=3600)
+    # The check for the period ending at period_end only runs two minutes after it
+    assert engine.run(period_end + 120)['alerts'] == 1
+    assert 'Corn' not in queued()[0]['html']
+    assert engine.run(period_end + 3600 + 120)['alerts'] == 1
+    assert 'Corn' in queued()[1]['html']
@@ -0,0 +1,103 @@
+"""
+Check the chat response caches: canonical keys, no caching of fallback text, SQLite persistence,
+and semantic matching of paraphrased questions
+Uses a scripted model; no AI provider is called.
+"""
+import pytest
+import database
+import chat_service
+from chat_service import ChatService, response_cache, response_cache_key
+from semantic_cache import SemanticCache, semantic_cache
+
+CONTEXT = {'crop': 'Tomato', 'disease': 'Late Blight', 'confidence': 0.93, 'location': 'Mysore'}
+
+
+class ScriptedModel:
+    """Stands in for the Gemini model: raises or answers from a list, counting calls"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return type('Response', (), {
+            'text': outcome, 'candidates': [type('Candidate', (), {'finish_reason': 1})()]
+        })()
+
+
+def make_service(model):
+    service = ChatService.__new__(ChatService)
+    service.use_openai = False
+    service.model = model
+    return service
+
+
+@pytest.fixture
+def empty_caches(db):
+    response_cache.clear()
+    semantic_cache.clear()
+
+
+def test_keys_ignore_formatting_and_context_order():
+    key = response_cache_key('How to treat blight?', CONTEXT, 'en')
+    reordered = dict(reversed(list(CONTEXT.items())), confidence=0.41)
+    assert response_cache_key('  how to TREAT   blight ', reordered, 'en') == key
+    assert response_cache_key('How to treat blight?', dict(CONTEXT, disease='Early Blight'), 'en') != key
+    assert response_cache_key('How to treat blight?', CONTEXT, 'hi') != key
+
+
+def test_fallbacks_are_not_cached_and_answers_persist(empty_caches):
+    model = ScriptedModel(Exception('429 quota exceeded'), 'Spray copper fungicide weekly.')
+    service = make_service(model)
+
+    first = service.get_chat_response('How to treat blight?', CONTEXT)
+    assert first.get('fallback') and model.calls == 1
+    second = service.get_chat_response('how to treat blight', CONTEXT)
+    assert second['response'] == 'Spray copper fungicide weekly.' and model.calls == 2
+    third = service.get_chat_response('How to treat blight?', dict(CONTEXT, confidence=0.5))
+    assert third.get('cached') and model.calls == 2
+
+    # Another worker (empty memory cache) finds the answer in SQLite
+    chat_service.CHAT_CACHE_PERSIST = True
+    try:
+        model.outcomes.append('Use NPK 19:19:19.')
+        service.get_chat_response('Best fertilizer?', CONTEXT)
+        response_cache.clear()
+        semantic_cache.clear()
+        assert service.get_chat_response('best fertilizer', CONTEXT).get('cached') and model.calls == 3
+    finally:
+        chat_service.CHAT_CACHE_PERSIST = False
+
+
+def test_paraphrases_share_an_answer_within_their_crop_and_disease():
+    cache = SemanticCache(threshold=0.8)
+    cache.add('How to treat late blight?', CONTEXT, 'en', 'Spray copper fungicide weekly.')
+    cache.add('Organic treatment for late blight', CONTEXT, 'en', 'Neem oil and remove infected leaves.')
+
+    assert cache.lookup('sir, late blight treatment??', CONTEXT, 'en') == 'Spray copper fungicide weekly.'
+    assert cache.lookup('treating blight', dict(CONTEXT, confidence=0.2), 'en') == 'Spray copper fungicide weekly.'
+    assert cache.lookup('late blight organic treatment please', CONTEXT, 'en') == 'Neem oil and remove infected leaves.'
+    assert cache.lookup('How to prevent late blight?', CONTEXT, 'en') is None
+    assert cache.lookup('How to treat late blight?', dict(CONTEXT, disease='Early Blight'), 'en') is None
+    assert cache.lookup('How to treat late blight?', CONTEXT, 'hi') is None
+    assert cache.stats()['hits'] >= 3
+
+
+def test_questions_differing_only_in_question_word_do_not_match():
+    cache = SemanticCache(threshold=0.8)
+    cache.add('How to spray fungicide?', CONTEXT, 'en', 'Cover both sides of the leaves.')
+
+    assert cache.lookup('When to spray fungicide?', CONTEXT, 'en') is None
+    assert cache.lookup('why spray fungicide', CONTEXT, 'en') is None
+    assert cache.lookup('Which fungicide to spray', CONTEXT, 'en') is None
+    assert cache.lookup('how should I spray fungicide', CONTEXT, 'en') == 'Cover both sides of the leaves.'
+    assert cache.lookup('fungicide spray?', CONTEXT, 'en') == 'Cover both sides of the leaves.'
+
+    cache.add('When to spray fungicide?', CONTEXT, 'en', 'Before rain, every 7-10 days.')
+    assert cache.lookup('when should i spray fungicide', CONTEXT, 'en') == 'Before rain, every 7-10 days.'
+    assert cache.lookup('how to spray fungicide', CONTEXT, 'en') == 'Cover both sides of the leaves.'
+
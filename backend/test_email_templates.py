@@ -0,0 +1,40 @@
+"""
+Check compiled email templates: CSS inlining, escaping and batch rendering
+No database or mail server is needed.
+"""
+from email_templates import EmailTemplate, get_template, inline_css
+
+SOURCE = '''<html><head><style>
+    p { color: #333; }
+    .note { padding: 12px; }
+    p.note { color: red; }
+    a:hover { color: blue; }
+</style></head>
+<body>
+    <p class="note" style="margin: 0">Hi {{ name }}, {{ count }} new alerts</p>
+    {{ rows|raw }}
+</body></html>
+'''
+
+
+def test_css_is_inlined_and_values_are_escaped():
+    html = inline_css(SOURCE)
+    assert '<p class="note" style="color: #333; padding: 12px; color: red; margin: 0">' in html
+    assert '<style>a:hover { color: blue }</style></head>' in html
+
+    template = EmailTemplate.compile('test', SOURCE)
+    assert template.variables == {'name', 'count', 'rows'}
+    html = template.render(name='<Ravi & Co>', count=3, rows='<li>Blight</li>')
+    assert 'Hi &lt;Ravi &amp; Co&gt;, 3 new alerts' in html
+    assert '<li>Blight</li>' in html
+
+
+def test_bound_batch_render_matches_single_render():
+    template = get_template('verification')
+    contexts = [{'user_name': f'Farmer {i}', 'verification_url': f'https://example.com/verify/{i}'}
+                for i in range(1000)]
+    batch = template.render_many(contexts, app_name='AgriDetect AI')
+    assert len(batch) == 1000
+    assert batch[7] == template.render(app_name='AgriDetect AI', **contexts[7])
+    assert template.bind(app_name='AgriDetect AI').variables == {'user_name', 'verification_url'}
+
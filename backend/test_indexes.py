@@ -0,0 +1,105 @@
+"""
+Check that history, stats and alert queries use the schema indexes
+"""
+import database
+
+
+def query_plan(sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+    with database.get_db_connection() as conn:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return ' | '.join(row['detail'] for row in rows)
+
+
+def test_migrations_run_once(db):
+    with database.get_db_connection() as conn:
+        version = database.get_schema_version(conn)
+        assert database.run_migrations(conn) == []
+        assert database.get_schema_version(conn) == version
+
+
+def test_user_history_uses_index(db):
+    plan = query_plan('''
+        SELECT id, disease_name, confidence, scan_date FROM scan_history
+        WHERE user_email = ? ORDER BY scan_date DESC, id DESC LIMIT ?
+    ''', ('farmer@example.com', 50))
+    assert 'idx_scan_history_user_date_id' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_history_keyset_page_uses_index(db):
+    plan = query_plan('''
+        SELECT id, disease_name, confidence, scan_date FROM scan_history
+        WHERE user_email = ? AND (scan_date, id) < (?, ?)
+        ORDER BY scan_date DESC, id DESC LIMIT ?
+    ''', ('farmer@example.com', '2026-01-01 00:00:00', 100, 50))
+    assert 'idx_scan_history_user_date_id (user_email=? AND scan_date<?)' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_history_pagination_covers_all_scans(db):
+    for i in range(7):
+        database.save_scan('farmer@example.com', f'Corn_Disease_{i}', 90.0, 'Corn')
+    seen = []
+    page = database.get_user_scans('farmer@example.com', 3)
+    while page:
+        seen.extend(scan['id'] for scan in page)
+        last = page[-1]
+        page = database.get_user_scans('farmer@example.com', 3, before_date=last['scanDate'], before_id=last['id'])
+    assert seen == sorted(seen, reverse=True) and len(seen) == 7, seen
+
+
+def test_user_stats_use_index(db):
+    plan = query_plan('SELECT COUNT(*) FROM scan_history WHERE user_email = ?', ('farmer@example.com',))
+    assert 'idx_scan_history_user_date_id' in plan, plan
+
+
+def test_recent_alerts_use_index(db):
+    plan = query_plan('SELECT id, location FROM alerts ORDER BY created_at DESC LIMIT ?', (10,))
+    assert 'idx_alerts_created_at' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_location_feed_uses_district_index(db):
+    plan = query_plan(database._LOCATION_FEED_QUERY, {
+        'email': 'farmer@example.com', 'limit': 20, 'min_matches': database.LOCATION_FEED_MIN_MATCHES
+    })
+    assert 'idx_alerts_district_created (district_key=?)' in plan, plan
+    assert 'idx_alerts_user_created (user_email=?)' in plan, plan
+    assert 'SCAN alerts' not in plan.replace('SCAN alerts USING INDEX', ''), plan
+
+
+def test_location_feed_matches_district(db):
+    database.create_user('farmer@example.com', 'Farmer', '0000000000', 'password')
+    database.update_user_profile('farmer@example.com', address='Bangalore Urban, Karnataka')
+    for i in range(5):
+        database.create_alert('Neighbour', 'Bengaluru, Karnataka', 'Corn_Common_Rust', user_email='n@example.com')
+    database.create_alert('Other', 'Mysore, Karnataka', 'Corn_Common_Rust', user_email='o@example.com')
+    database.create_alert('Farmer', 'Tumkur, Karnataka', 'Corn_Blight', user_email='farmer@example.com')
+
+    alerts = database.get_alerts_by_location('farmer@example.com', 20)
+    locations = [alert['location'] for alert in alerts]
+    assert 'Mysore, Karnataka' not in locations, locations
+    assert 'Tumkur, Karnataka' in locations and locations.count('Bengaluru, Karnataka') == 5, locations
+
+
+def test_new_alert_count_uses_index(db):
+    plan = query_plan('SELECT COUNT(*) FROM alerts WHERE district_key = ? AND id > ?', ('bengaluru', 10))
+    assert 'COVERING INDEX idx_alerts_district_id (district_key=? AND id>?)' in plan, plan
+
+
+def test_new_alert_count_cache(db, monkeypatch):
+    monkeypatch.setattr(database, 'alert_count_cache', database.AlertCountCache())
+    database.create_user('farmer@example.com', 'Farmer', '0000000000', 'password')
+    database.update_user_profile('farmer@example.com', address='Mysore, Karnataka')
+    _, first = database.create_alert('Neighbour', 'Mysuru', 'Corn_Common_Rust', user_email='n@example.com')
+    database.create_alert('Other', 'Tumkur', 'Corn_Common_Rust', user_email='o@example.com')
+
+    assert database.get_new_alerts_count('farmer@example.com', 0) == 1
+    hits = database.metrics_registry.counter('alerts.new_count.cache_hit').value
+    assert database.get_new_alerts_count('farmer@example.com', first['id']) == 0
+    assert database.metrics_registry.counter('alerts.new_count.cache_hit').value == hits + 1
+
+    database.create_alert('Neighbour', 'Mysore, Karnataka', 'Corn_Blight', user_email='n@example.com')
+    assert database.get_new_alerts_count('farmer@example.com', first['id']) == 1
+
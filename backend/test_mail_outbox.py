@@ -0,0 +1,105 @@
+"""
+Check the email outbox against a local stand-in SMTP server: connection reuse, retry and permanent failure
+No real mail server is contacted.
+"""
+import threading
+import socketserver
+import pytest
+import database
+import mail_outbox
+from mail_outbox import OutboxSender, SMTPConnection, enqueue_email
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that records messages (no TLS/AUTH); can refuse recipients or drop connections"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.refuse = set()  # recipients answered with 550
+        self.fail_data = 0  # next N DATA commands answered with 451
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 stand-in ready')
+        recipient = None
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'RCPT':
+                recipient = line.split(':', 1)[1].strip(' <>')
+                self.reply('550 no such user' if recipient in server.refuse else '250 ok')
+            elif command == 'DATA':
+                if server.fail_data:
+                    server.fail_data -= 1
+                    self.reply('451 try again later')
+                    continue
+                self.reply('354 end with .')
+                body = []
+                while (data := self.rfile.readline().decode()) not in ('.\r\n', ''):
+                    body.append(data)
+                server.messages.append((recipient, ''.join(body)))
+                self.reply('250 queued')
+            else:  # MAIL, RSET, NOOP
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp(db):
+    """Stand-in server and a sender connected to it"""
+    server = StandInSMTPServer()
+    connection = SMTPConnection('127.0.0.1', server.server_address[1], '', '', use_tls=False)
+    return server, OutboxSender(connection=connection, sender_address='AgriDetect AI <noreply@example.com>',
+                                rate_limit=0)
+
+
+def outbox_rows():
+    with database.get_db_connection() as conn:
+        return {row['to_email']: dict(row) for row in conn.execute('SELECT * FROM email_outbox')}
+
+
+def test_messages_share_one_connection(smtp):
+    server, sender = smtp
+    for i in range(20):
+        assert enqueue_email(f'farmer{i}@example.com', 'Alert digest', f'<p>Hello {i}</p>')[0]
+    assert sender.send_pending() == 20
+    assert len(server.messages) == 20 and server.connections == 1
+    assert all(row['status'] == 'sent' and row['claimed_by'] is None for row in outbox_rows().values())
+    assert sender.send_pending() == 0
+    sender.connection.close()
+
+
+def test_transient_failures_retry_and_permanent_failures_stop(smtp):
+    server, sender = smtp
+    mail_outbox.MAIL_RETRY_BASE, retry_base = 0, mail_outbox.MAIL_RETRY_BASE
+    try:
+        server.refuse.add('gone@example.com')
+        server.fail_data = 1
+        enqueue_email('gone@example.com', 'Welcome', '<p>Hi</p>')
+        enqueue_email('busy@example.com', 'Welcome', '<p>Hi</p>')
+
+        # First pass: refused recipient fails for good, 451 is retried (immediately, with a zero backoff)
+        assert sender.send_pending() == 1
+        rows = outbox_rows()
+        assert rows['gone@example.com']['status'] == 'failed' and rows['gone@example.com']['attempts'] == 1
+        assert rows['busy@example.com']['status'] == 'sent' and rows['busy@example.com']['attempts'] == 2
+        assert '451' in rows['busy@example.com']['last_error']
+        assert [recipient for recipient, _ in server.messages] == ['busy@example.com']
+    finally:
+        mail_outbox.MAIL_RETRY_BASE = retry_base
+
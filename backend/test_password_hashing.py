@@ -0,0 +1,104 @@
+"""
+Check pooled bcrypt hashing, rehash-on-login and the failed login limiter
+"""
+import time
+import threading
+import database
+import password_hashing
+from login_limiter import LoginLimiter
+
+EMAIL = 'farmer@example.com'
+
+
+def use_hasher(**kwargs):
+    """Install a fresh hasher with a low cost factor (fast tests)"""
+    kwargs.setdefault('rounds', 4)
+    password_hashing._hasher = password_hashing.PasswordHasher(**kwargs)
+    return password_hashing._hasher
+
+
+def test_cost_change_rehashes_on_login(db):
+    database.user_cache.clear()
+
+    pooled = use_hasher(workers=1)
+    assert database.create_user(EMAIL, 'Ravi', '9999999999', 'secret123')[0]
+    old_hash = database.get_user(EMAIL)['password_hash']
+    assert password_hashing.hash_rounds(old_hash) == 4
+    assert database.verify_password(old_hash, 'secret123')
+    assert not database.verify_password(old_hash, 'wrong')
+    assert not database.rehash_password_if_needed(EMAIL, old_hash, 'secret123')
+
+    pooled.shutdown()
+    hasher = use_hasher(workers=0, rounds=5)
+    assert database.rehash_password_if_needed(EMAIL, old_hash, 'secret123')
+    new_hash = database.get_user(EMAIL)['password_hash']
+    assert password_hashing.hash_rounds(new_hash) == 5 and not hasher.needs_rehash(new_hash)
+    assert database.verify_password(new_hash, 'secret123')
+    # A second login with the old hash (e.g. a stale read) must not overwrite the upgraded one
+    assert not database.rehash_password_if_needed(EMAIL, old_hash, 'secret123')
+    password_hashing._hasher = None
+
+
+def test_full_queue_rejects_instead_of_waiting():
+    password_hashing.PASSWORD_HASH_QUEUE_WAIT, wait = 0.05, password_hashing.PASSWORD_HASH_QUEUE_WAIT
+    try:
+        hasher = use_hasher(workers=0, max_pending=1)
+        release = threading.Event()
+        blocker = threading.Thread(target=hasher._run, args=('test', release.wait, 5))
+        blocker.start()
+        try:
+            hasher.hash('secret123')
+            assert False, "expected PasswordHasherBusy"
+        except password_hashing.PasswordHasherBusy:
+            pass
+        finally:
+            release.set()
+            blocker.join()
+        assert hasher.verify(hasher.hash('secret123'), 'secret123')
+    finally:
+        password_hashing.PASSWORD_HASH_QUEUE_WAIT = wait
+        password_hashing._hasher = None
+
+
+def test_pool_starts_up_front_and_slow_hashes_are_busy(monkeypatch):
+    hasher = password_hashing.start_password_hasher(workers=2)
+    try:
+        # Every child is forked at startup, none later from a multithreaded worker
+        assert len(hasher._pool._processes) == 2
+        monkeypatch.setattr(password_hashing, 'PASSWORD_HASH_TIMEOUT', 0.1)
+        try:
+            hasher._run('test', time.sleep, 2)
+            assert False, "expected PasswordHasherBusy"
+        except password_hashing.PasswordHasherBusy:
+            pass
+    finally:
+        hasher.shutdown()
+        password_hashing._hasher = None
+    # Without start_password_hasher() nothing is forked lazily
+    assert password_hashing.get_password_hasher()._pool is None
+    password_hashing._hasher = None
+
+
+def test_limiter_blocks_account_and_ip():
+    limiter = LoginLimiter(window=60, max_per_account=3, max_per_ip=5)
+    for _ in range(3):
+        assert limiter.check(EMAIL, '10.0.0.1') == (True, 0)
+        limiter.record_failure(EMAIL, '10.0.0.1')
+    allowed, retry_after = limiter.check(EMAIL, '10.0.0.1')
+    assert not allowed and 0 < retry_after <= 61
+    # Someone else's failures do not lock the user out from their own address
+    assert limiter.check(EMAIL, '10.0.0.2') == (True, 0)
+
+    # Stuffing many accounts from one IP trips the IP limit
+    assert limiter.check('other@example.com', '10.0.0.1')[0]
+    limiter.record_failure('other@example.com', '10.0.0.1')
+    limiter.record_failure('third@example.com', '10.0.0.1')
+    assert not limiter.check('fourth@example.com', '10.0.0.1')[0]
+    assert limiter.check('fourth@example.com', '10.0.0.3')[0]
+
+    for _ in range(3):
+        limiter.record_failure(EMAIL, '10.0.0.2')
+    assert not limiter.check(EMAIL, '10.0.0.2')[0]
+    limiter.record_success(EMAIL, '10.0.0.2')
+    assert limiter.check(EMAIL, '10.0.0.2')[0]
+
@@ -0,0 +1,95 @@
+"""
+Check that the user_scan_stats aggregates stay equal to a full recomputation
+from scan_history as scans are saved and deleted
+"""
+import random
+import database
+import migrations
+
+EMAIL = 'farmer@example.com'
+DISEASES = ['Corn_Healthy', 'Corn_Common_Rust', 'Potato_Late_Blight', 'Potato_Healthy', 'Rice_Leaf_Blast']
+
+
+def recomputed_stats(user_email):
+    """Aggregates computed directly from scan_history (the pre-materialization queries)"""
+    with database.get_db_connection() as conn:
+        total, named_healthy, healthy, high_risk, avg_confidence = conn.execute('''
+            SELECT COUNT(*), SUM(disease_name LIKE '%Healthy%'),
+                   SUM(health_status = 'Healthy' OR disease_name LIKE '%Healthy%'),
+                   SUM(risk_level = 'High'), AVG(confidence)
+            FROM scan_history WHERE user_email = ?
+        ''', (user_email,)).fetchone()
+        crops = conn.execute('''
+            SELECT crop_name, AVG(CASE WHEN health_status = 'Healthy' THEN 100 ELSE 60 END)
+            FROM scan_history WHERE user_email = ? AND crop_name IS NOT NULL
+            GROUP BY crop_name ORDER BY crop_name
+        ''', (user_email,)).fetchall()
+        months = conn.execute('''
+            SELECT strftime('%Y-%m', scan_date) AS month,
+                   SUM(health_status = 'Healthy'), SUM(health_status = 'Diseased')
+            FROM scan_history WHERE user_email = ?
+            GROUP BY month ORDER BY month DESC LIMIT 6
+        ''', (user_email,)).fetchall()
+    return {
+        'stats': {'total': total, 'healthy': named_healthy or 0, 'diseased': total - (named_healthy or 0)},
+        'accuracy': round(avg_confidence or 0.0, 6),
+        'healthy': healthy or 0,
+        'high_risk': high_risk or 0,
+        'crops': [{'crop': crop, 'yield': round(score, 1)} for crop, score in crops],
+        'months': [{'month': month, 'healthy': h, 'diseased': d} for month, h, d in months][::-1]
+    }
+
+
+def assert_stats_match(user_email):
+    expected = recomputed_stats(user_email)
+    assert database.get_user_stats(user_email) == expected['stats']
+    assert round(database.get_user_accuracy(user_email), 6) == expected['accuracy']
+
+    summary = database.get_analytics_summary(user_email)
+    assert summary['totalScans'] == expected['stats']['total']
+    assert summary['diseaseAlerts'] == expected['high_risk']
+    if expected['stats']['total']:
+        assert summary['averageHealth'] == round(expected['healthy'] / expected['stats']['total'] * 100, 1)
+
+    charts = database.get_analytics_charts(user_email)
+    if expected['crops']:
+        assert charts['yieldForecast'] == expected['crops'], (charts['yieldForecast'], expected['crops'])
+    if expected['months']:
+        assert charts['diseaseTrends'] == expected['months'], (charts['diseaseTrends'], expected['months'])
+
+
+def test_stats_follow_saves_and_deletes(db):
+    rng = random.Random(3)
+    scan_ids = []
+    for _ in range(60):
+        disease = rng.choice(DISEASES)
+        success, scan_id = database.save_scan(EMAIL, disease, rng.uniform(50, 99.9),
+                                              crop_name=rng.choice([disease.split('_')[0], None]))
+        assert success
+        scan_ids.append(scan_id)
+    assert_stats_match(EMAIL)
+
+    for scan_id in rng.sample(scan_ids, 40):
+        assert database.delete_scan(scan_id, EMAIL)[0]
+    assert_stats_match(EMAIL)
+
+    for scan in database.get_user_scans(EMAIL, 1000):
+        assert database.delete_scan(scan['id'], EMAIL)[0]
+    assert database.get_user_stats(EMAIL) == {'total': 0, 'healthy': 0, 'diseased': 0}
+    assert database.get_analytics_summary(EMAIL)['totalScans'] == 0
+    with database.get_db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM user_scan_crop_stats').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM user_scan_month_stats').fetchone()[0] == 0
+
+
+def test_migration_backfills_existing_history(db):
+    with database.get_db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO scan_history (user_email, disease_name, confidence, crop_name, risk_level, health_status, scan_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(EMAIL, DISEASES[i % 5], 70 + i, DISEASES[i % 5].split('_')[0], 'High' if i % 3 else 'Safe',
+               'Healthy' if 'Healthy' in DISEASES[i % 5] else 'Diseased', f'2026-0{1 + i % 8}-15 10:00:00')
+              for i in range(30)])
+        migrations.migration_006_user_scan_stats(conn.cursor())
+    assert_stats_match(EMAIL)
+
@@ -0,0 +1,85 @@
+"""
+Check the scan history write-behind queue: batched flush, crash replay, rejected rows and backpressure
+"""
+import os
+import json
+import database
+import scan_writer
+
+EMAIL = 'farmer@example.com'
+
+
+def make_writer(db_dir, **kwargs):
+    """An unstarted writer with its own journal directory"""
+    return scan_writer.ScanWriter(queue_dir=str(db_dir / 'scan_queue'), **kwargs)
+
+
+def history_count():
+    with database.get_db_connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM scan_history WHERE user_email = ?', (EMAIL,)).fetchone()[0]
+
+
+def test_enqueued_scans_are_flushed_in_batches(db):
+    writer = make_writer(db, batch_size=10)
+    writer._open_journal()
+    ids = [writer.enqueue(EMAIL, 'Corn_Common_Rust', 91.0, 'Corn')[1] for _ in range(25)]
+    assert history_count() == 0 and writer.pending_count() == 25
+
+    assert writer.flush() == 25
+    assert history_count() == 25 and writer.pending_count() == 0
+    assert os.path.getsize(writer._journal_path) == 0
+    assert database.get_scan_id_by_queue_seq(ids[0], EMAIL) is not None
+    assert database.get_user_stats(EMAIL) == {'total': 25, 'healthy': 0, 'diseased': 25}
+    assert database.get_user_scans(EMAIL, 1)[0]['riskLevel'] == 'High'
+
+
+def test_crashed_journal_is_replayed_once(db):
+    crashed = make_writer(db)
+    crashed._open_journal()
+    for _ in range(3):
+        crashed.enqueue(EMAIL, 'Potato_Healthy', 88.0, 'Potato')
+    # Simulate a crash after the first scan was committed but before the journal was truncated
+    first = dict(json.loads(open(crashed._journal_path).readline()))
+    first.pop('enqueued_at')
+    assert database.save_scans_batch([first])[0]
+    crashed._journal.close()  # Process died: its journal lock is released
+
+    writer = scan_writer.ScanWriter(queue_dir=crashed.queue_dir)
+    writer.start()
+    writer.stop()
+    assert history_count() == 3
+    assert database.get_user_stats(EMAIL)['total'] == 3
+    assert not os.path.exists(crashed._journal_path)
+    assert os.listdir(crashed.queue_dir) == []
+
+
+def test_rejected_scan_is_dead_lettered_without_blocking_the_batch(db):
+    writer = make_writer(db, batch_size=10)
+    writer._open_journal()
+    for _ in range(4):
+        writer.enqueue(EMAIL, 'Corn_Common_Rust', 91.0, 'Corn')
+    writer.enqueue(EMAIL, 'Corn_Common_Rust', float('nan'), 'Corn')  # SQLite stores NaN as NULL
+    writer.enqueue(EMAIL, 'Corn_Common_Rust', 91.0, 'Corn')
+
+    assert writer.flush() == 5
+    assert history_count() == 5 and writer.pending_count() == 0
+    assert os.path.getsize(writer._journal_path) == 0
+    with open(writer._dead_letter_path) as f:
+        dead = [json.loads(line) for line in f]
+    assert len(dead) == 1 and dead[0]['confidence'] != dead[0]['confidence'] and 'NOT NULL' in dead[0]['error']
+
+
+def test_full_queue_rejects_saves(db):
+    scan_writer.SCAN_QUEUE_PUT_TIMEOUT, timeout = 0.05, scan_writer.SCAN_QUEUE_PUT_TIMEOUT
+    try:
+        writer = make_writer(db, max_pending=2)
+        writer._open_journal()
+        assert writer.enqueue(EMAIL, 'Corn_Common_Rust', 70.0)[0]
+        assert writer.enqueue(EMAIL, 'Corn_Common_Rust', 70.0)[0]
+        success, message = writer.enqueue(EMAIL, 'Corn_Common_Rust', 70.0)
+        assert not success and 'full' in message
+        writer.flush()
+        assert writer.enqueue(EMAIL, 'Corn_Common_Rust', 70.0)[0]
+    finally:
+        scan_writer.SCAN_QUEUE_PUT_TIMEOUT = timeout
+
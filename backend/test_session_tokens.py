@@ -0,0 +1,59 @@
+"""
+Check session token issue/verify and request authentication rules
+"""
+import time
+import pytest
+from itsdangerous import URLSafeTimedSerializer
+import session_tokens
+from session_tokens import SessionManager, SessionKeyMissing, principal_email
+from verification_tokens import token_manager
+
+EMAIL = 'farmer@example.com'
+
+
+def test_token_identifies_the_user_without_email_parameter():
+    sessions = SessionManager(secret_key='test-secret')
+    token = sessions.issue(EMAIL, 'Ravi')
+
+    principal, error, status = sessions.authenticate(f'Bearer {token}', None, [None])
+    assert (principal['email'], error, status) == (EMAIL, None, 200)
+    assert principal_email(principal, {'email': 'other@example.com'}) == EMAIL
+    assert sessions.authenticate(None, token, [EMAIL])[0]['fullName'] == 'Ravi'
+
+    assert sessions.authenticate(f'Bearer {token}', None, ['other@example.com'])[2] == 403
+    assert sessions.authenticate(f'Bearer {token}x', None, [])[2] == 401
+    assert SessionManager(secret_key='other-secret').authenticate(f'Bearer {token}', None, [])[2] == 401
+    # Email verification links are signed with another salt and are not sessions
+    assert not sessions.verify(token_manager.generate_token(EMAIL))[0]
+
+    expired = SessionManager(secret_key='test-secret', max_age=0)
+    time.sleep(1.1)
+    assert expired.verify(token) == (False, "Session expired, please log in again")
+
+
+def test_legacy_email_parameter_only_without_session_required():
+    sessions = SessionManager(secret_key='test-secret')
+    required = session_tokens.SESSION_REQUIRED
+    assert required  # Default: an email parameter alone does not identify anyone
+    try:
+        assert sessions.authenticate(None, None, [EMAIL])[2] == 401
+        assert sessions.authenticate(None, None, [None]) == (None, None, 200)
+
+        session_tokens.SESSION_REQUIRED = False
+        assert sessions.authenticate(None, None, [EMAIL]) == (None, None, 200)
+        assert principal_email(None, {'email': EMAIL}) == EMAIL
+    finally:
+        session_tokens.SESSION_REQUIRED = required
+
+
+def test_missing_or_placeholder_secret_key_refuses_sessions(monkeypatch):
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    # What anyone could have minted with the old built-in fallback key
+    forged = URLSafeTimedSerializer('your-secret-key-change-in-production', salt='session').dumps({'email': EMAIL})
+    for sessions in (SessionManager(), SessionManager(secret_key='your-secret-key-change-in-production')):
+        with pytest.raises(SessionKeyMissing):
+            sessions.require_key()
+        with pytest.raises(SessionKeyMissing):
+            sessions.issue(EMAIL)
+        assert not sessions.verify(forged)[0]
+        assert sessions.authenticate(f'Bearer {forged}', None, [EMAIL])[2] == 503
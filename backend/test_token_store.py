@@ -0,0 +1,54 @@
+"""
+Check the persistent used-token store, its Bloom filter and sweeper, and pending verifications
+"""
+import time
+import database
+from token_store import UsedTokenStore, BloomFilter
+from verification_tokens import TokenManager
+
+EMAIL = 'farmer@example.com'
+
+
+def test_used_token_is_rejected_by_every_store(db):
+    manager = TokenManager()
+    manager.used_tokens = UsedTokenStore()
+    token = manager.generate_token(EMAIL)
+    assert manager.verify_token(token) == (True, EMAIL)
+    assert not manager.verify_token(token)[0]
+
+    # Another worker (or a restart) has an empty filter but shares the table
+    other = UsedTokenStore()
+    assert other.probably_used(token)
+    assert not other.consume(token)
+    assert not other.probably_used(manager.generate_token('new@example.com'))
+
+
+def test_sweep_expires_tokens_and_pending_verifications(db):
+    store = UsedTokenStore(ttl=0.05)
+    assert store.consume('short-lived') and not store.consume('short-lived')
+    assert store.consume('long-lived', ttl=3600)
+    assert database.save_pending_verification(EMAIL, 'Ravi', '9999999999', ttl=0.05)[0]
+    assert database.save_pending_verification('other@example.com', 'Asha', ttl=3600)[0]
+    time.sleep(0.1)
+
+    assert not store.probably_used('short-lived')
+    assert database.get_pending_verification(EMAIL) is None
+    assert store.sweep() == 2
+    assert store.consume('short-lived')
+    assert store.probably_used('long-lived')
+
+    assert database.pop_pending_verification('other@example.com') == {
+        'email': 'other@example.com', 'fullName': 'Asha', 'phone': None
+    }
+    assert database.pop_pending_verification('other@example.com') is None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f'token-{i}'.encode() for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(f'other-{i}'.encode() in bloom for i in range(10000))
+    assert false_positives < 300, false_positives
+
@@ -0,0 +1,67 @@
+"""
+Check the read-through user profile and settings caches and their invalidation
+"""
+import pytest
+import database
+from alert_broker import AlertBroker
+
+EMAIL = 'farmer@example.com'
+
+
+@pytest.fixture
+def user(db):
+    """One user, with empty profile caches"""
+    database.user_cache.clear()
+    database._user_cache_version.update(version=None, checked_at=0.0)
+    assert database.create_user(EMAIL, 'Ravi', '9999999999', 'secret123')[0]
+
+
+def test_updates_invalidate_cached_profile(user):
+    assert database.get_user(EMAIL)['address'] is None
+    hits = database.user_cache.stats()['hits']
+    database.get_user(EMAIL)['fullName'] = 'Changed by caller'
+    assert database.get_user(EMAIL)['fullName'] == 'Ravi'
+    assert database.user_cache.stats()['hits'] == hits + 2
+
+    assert database.update_user_profile(EMAIL, address='Mysore, Karnataka')[0]
+    assert database.get_user(EMAIL)['address'] == 'Mysore, Karnataka'
+    assert database.update_profile_picture(EMAIL, '/uploads/ravi.png')[0]
+    assert database.get_user(EMAIL)['profilePictureUrl'] == '/uploads/ravi.png'
+    assert database.get_user('nobody@example.com') is None
+
+
+def test_change_from_another_process_clears_cache(user):
+    database.USER_CACHE_SYNC_INTERVAL, interval = 60, database.USER_CACHE_SYNC_INTERVAL
+    try:
+        assert database.get_user(EMAIL)['phone'] == '9999999999'
+        # Another worker updates the row and bumps the shared version; this process's entry is stale
+        with database.get_db_connection() as conn:
+            conn.execute("UPDATE users SET phone = '1111111111' WHERE email = ?", (EMAIL,))
+            conn.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'users'")
+        assert database.get_user(EMAIL)['phone'] == '9999999999'
+        database._user_cache_version['checked_at'] = 0.0
+        assert database.get_user(EMAIL)['phone'] == '1111111111'
+    finally:
+        database.USER_CACHE_SYNC_INTERVAL = interval
+
+
+def test_notification_preferences_are_read_from_covering_index(user):
+    assert database.create_user('muted@example.com', 'Asha', '8888888888', 'secret123')[0]
+    assert database.get_user_notification_preference(EMAIL) == (True, True)
+    assert database.update_user_notification_preference('muted@example.com', False)[0]
+    assert database.get_notification_preferences([EMAIL, 'muted@example.com', 'nobody@example.com']) == {
+        EMAIL: True, 'muted@example.com': False
+    }
+    assert database.get_user_notification_preference('nobody@example.com') == (False, False)
+
+    with database.get_db_connection() as conn:
+        plan = ' '.join(row[3] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT email, notifications_enabled FROM users INDEXED BY idx_users_settings '
+            'WHERE email IN (?, ?)', ('a', 'b')))
+    assert 'COVERING INDEX idx_users_settings' in plan, plan
+
+    broker = AlertBroker()
+    on, off = broker.subscribe('mysore', EMAIL), broker.subscribe('mysore', 'muted@example.com')
+    assert broker.publish('mysore', {'id': 1}, recipient_filter=database._notification_recipients) == 1
+    assert on.get(0) == {'id': 1} and off.get(0) is None
+
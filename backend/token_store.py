@@ -0,0 +1,158 @@
+"""
+Persistent, expiring store of used one-time tokens (email verification links)
+Used tokens are kept in SQLite until they would have expired anyway, so every
+worker process sees them and they survive restarts. A Bloom filter in front of
+the table answers the common "never used" case without a query; a background
+sweeper deletes expired rows and rebuilds the filter, so memory stays flat.
+"""
+import os
+import math
+import time
+import hashlib
+import threading
+from database import get_db_connection
+from metrics import metrics_registry
+
+USED_TOKEN_TTL = float(os.getenv('USED_TOKEN_TTL', 86400))  # seconds, at least the token lifetime
+TOKEN_SWEEP_INTERVAL = float(os.getenv('TOKEN_SWEEP_INTERVAL', 3600))  # seconds (0 = no sweeper)
+TOKEN_BLOOM_CAPACITY = int(os.getenv('TOKEN_BLOOM_CAPACITY', 100000))
+TOKEN_BLOOM_ERROR_RATE = float(os.getenv('TOKEN_BLOOM_ERROR_RATE', 0.01))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over byte strings (no false negatives)"""
+
+    def __init__(self, capacity=TOKEN_BLOOM_CAPACITY, error_rate=TOKEN_BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: two 64-bit halves of one digest give all hash_count positions
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _token_hash(token):
+    """Tokens are stored hashed, so the table never holds a usable link"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class UsedTokenStore:
+    """
+    SQLite-backed set of used tokens with per-entry expiry
+    consume() is the authoritative, atomic check-and-mark; probably_used() is a
+    cheap pre-check that only knows tokens seen by this process (or loaded at the
+    last rebuild), which is enough to reject replays before verifying signatures.
+    """
+
+    def __init__(self, ttl=USED_TOKEN_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._bloom = None
+
+    def _load(self):
+        """Build a Bloom filter from the unexpired used tokens (call with the lock held)"""
+        bloom = BloomFilter()
+        with get_db_connection() as conn:
+            for row in conn.execute('SELECT token_hash FROM used_tokens WHERE expires_at > ?', (time.time(),)):
+                bloom.add(row[0].encode('ascii'))
+        self._bloom = bloom
+
+    def probably_used(self, token):
+        """
+        Check whether a token was used, without a query in the common unused case
+        Returns: True if the token is known to be used
+        """
+        token_hash = _token_hash(token)
+        with self._lock:
+            if self._bloom is None:
+                self._load()
+            maybe = token_hash.encode('ascii') in self._bloom
+        if not maybe:
+            metrics_registry.counter('tokens.bloom.negative').inc()
+            return False
+
+        with get_db_connection() as conn:
+            row = conn.execute(
+                'SELECT 1 FROM used_tokens WHERE token_hash = ? AND expires_at > ?', (token_hash, time.time())
+            ).fetchone()
+        if row is None:
+            metrics_registry.counter('tokens.bloom.false_positive').inc()
+        return row is not None
+
+    def consume(self, token, ttl=None):
+        """
+        Mark a token as used
+        Returns: True if this call used it, False if it was already used (in any process)
+        """
+        token_hash = _token_hash(token)
+        now = time.time()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # An expired row for the same token may linger until the next sweep; reuse it
+            cursor.execute('''
+                INSERT INTO used_tokens (token_hash, expires_at) VALUES (?, ?)
+                ON CONFLICT(token_hash) DO UPDATE SET expires_at = excluded.expires_at
+                WHERE used_tokens.expires_at <= ?
+            ''', (token_hash, now + (ttl or self.ttl), now))
+            first_use = cursor.rowcount == 1
+
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(token_hash.encode('ascii'))
+        return first_use
+
+    def sweep(self):
+        """
+        Delete expired used tokens and pending verifications, then rebuild the filter
+        Returns: number of rows deleted
+        """
+        now = time.time()
+        with get_db_connection() as conn:
+            deleted = conn.execute('DELETE FROM used_tokens WHERE expires_at <= ?', (now,)).rowcount
+            deleted += conn.execute('DELETE FROM pending_verifications WHERE expires_at <= ?', (now,)).rowcount
+        with self._lock:
+            self._load()
+        metrics_registry.counter('tokens.swept').inc(deleted)
+        return deleted
+
+
+# Global store instance
+used_token_store = UsedTokenStore()
+
+_sweeper_thread = None
+_sweeper_stop = threading.Event()
+
+
+def _sweep_loop(interval):
+    while not _sweeper_stop.wait(interval):
+        try:
+            used_token_store.sweep()
+        except Exception as e:
+            print(f"[WARNING] Token sweep failed: {str(e)}")
+
+
+def start_token_sweeper(interval=TOKEN_SWEEP_INTERVAL):
+    """Start the background sweeper thread for this process (idempotent)"""
+    global _sweeper_thread
+    if interval <= 0:
+        return
+    if _sweeper_thread is not None and _sweeper_thread.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper_thread = threading.Thread(target=_sweep_loop, args=(interval,), name='token-sweeper', daemon=True)
+    _sweeper_thread.start()
+
+
+def stop_token_sweeper():
+    """Stop the background sweeper thread"""
+    _sweeper_stop.set()
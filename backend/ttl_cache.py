@@ -0,0 +1,91 @@
+"""
+Bounded in-process LRU cache with per-entry TTL
+Hits and misses are counted in the metrics registry as cache.<name>.hit / cache.<name>.miss
+"""
+import time
+import threading
+from collections import OrderedDict
+from metrics import metrics_registry
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds
+    Readers that fill the cache after a database read should take a token with
+    begin_fill() before the read and pass it to fill(), so a value read before
+    a concurrent invalidation is never stored.
+    """
+
+    def __init__(self, name, max_size=1000, ttl=60):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._generation = 0  # bumped by every invalidation
+        self._hits = metrics_registry.counter(f"cache.{name}.hit")
+        self._misses = metrics_registry.counter(f"cache.{name}.miss")
+
+    def get(self, key, default=None):
+        """Get a cached value (counts a hit or miss)"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+        if entry is _MISSING:
+            self._misses.inc()
+            return default
+        self._hits.inc()
+        return entry[0]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def begin_fill(self):
+        """Token to pass to fill() after reading the value from its source"""
+        with self._lock:
+            return self._generation
+
+    def fill(self, key, value, token):
+        """Store a value read from the source unless an invalidation happened since begin_fill()"""
+        with self._lock:
+            if token == self._generation:
+                self._set(key, value)
+
+    def invalidate(self, key):
+        """Drop one entry"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Size and hit rate for /api/metrics"""
+        hits, misses = self._hits.value, self._misses.value
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0
+        }
@@ -0,0 +1,106 @@
+"""
+Streaming upload handling for AgriDetect AI
+Enforces per-endpoint file size limits while multipart bytes arrive, validates
+image magic bytes from the first chunk, and spools large files to disk
+"""
+import os
+import tempfile
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB (profile pictures, alert photos)
+MAX_SCAN_FILE_SIZE = 10 * 1024 * 1024  # 10MB (scan images, matches the frontend limit)
+# Whole request body limit, rejected up front from Content-Length
+MAX_CONTENT_LENGTH = MAX_SCAN_FILE_SIZE + 1024 * 1024
+# Uploaded files larger than this are spooled to a temporary file instead of memory
+SPOOL_MEMORY_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 512 * 1024))
+
+# Per-endpoint file size limits (endpoint name -> bytes)
+UPLOAD_LIMITS = {
+    'predict': MAX_SCAN_FILE_SIZE,
+    'save_history': MAX_SCAN_FILE_SIZE,
+}
+
+# Accepted image formats: file extensions and a check of the leading bytes.
+# The single allow-list for both the filename check (app.allowed_file) and the content check.
+IMAGE_FORMATS = {
+    'jpeg': (('jpg', 'jpeg'), lambda head: head.startswith(b'\xff\xd8\xff')),
+    'png': (('png',), lambda head: head.startswith(b'\x89PNG\r\n\x1a\n')),
+    'gif': (('gif',), lambda head: head.startswith((b'GIF87a', b'GIF89a'))),
+    'webp': (('webp',), lambda head: head.startswith(b'RIFF') and head[8:12] == b'WEBP'),
+}
+ALLOWED_EXTENSIONS = frozenset(ext for extensions, _ in IMAGE_FORMATS.values() for ext in extensions)
+ALLOWED_TYPES_TEXT = ', '.join(extensions[0] for extensions, _ in IMAGE_FORMATS.values())
+_MAGIC_HEAD_SIZE = 12
+
+
+def is_image_header(head):
+    """Check whether the first bytes of a file match a supported image format"""
+    return any(matches(head) for _, matches in IMAGE_FORMATS.values())
+
+def upload_limit_for(endpoint):
+    """Get the maximum file size for an endpoint"""
+    return UPLOAD_LIMITS.get(endpoint, MAX_FILE_SIZE)
+
+
+class LimitedSpooledFile:
+    """
+    Write target for a single uploaded file part
+    Raises 413 as soon as the part exceeds max_size and 415 if the first bytes
+    are not a supported image, so oversized or bogus uploads are never fully buffered.
+    """
+
+    def __init__(self, max_size, spool_threshold=SPOOL_MEMORY_THRESHOLD):
+        self.max_size = max_size
+        self.size = 0
+        self._head = b''
+        self._validated = False
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+
+    def _validate_head(self):
+        self._validated = True
+        if not is_image_header(self._head):
+            self._file.close()
+            raise UnsupportedMediaType(f"Invalid image file. Allowed: {ALLOWED_TYPES_TEXT}")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            self._file.close()
+            raise RequestEntityTooLarge(
+                f"File too large. Maximum size is {self.max_size // (1024 * 1024)}MB"
+            )
+
+        if not self._validated:
+            self._head += data[:_MAGIC_HEAD_SIZE - len(self._head)]
+            if len(self._head) >= _MAGIC_HEAD_SIZE:
+                self._validate_head()
+
+        return self._file.write(data)
+
+    def seek(self, *args):
+        # The parser seeks back to the start once the part is complete
+        # (empty parts are left alone, e.g. a file input submitted with no file)
+        if not self._validated and self.size > 0:
+            self._validate_head()
+        return self._file.seek(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+def make_stream_factory(max_size):
+    """Build a form-parser stream factory enforcing max_size per file"""
+    def stream_factory(total_content_length, content_type, filename=None, content_length=None):
+        return LimitedSpooledFile(max_size)
+    return stream_factory
+
+
+class UploadRequest(Request):
+    """Flask request class that streams file parts through LimitedSpooledFile"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return LimitedSpooledFile(upload_limit_for(self.endpoint))
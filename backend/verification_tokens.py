@@ -2,6 +2,7 @@ from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from token_store import used_token_store
 
 load_dotenv()
 
@@ -11,8 +12,8 @@ class TokenManager:
         self.serializer = URLSafeTimedSerializer(self.secret_key)
         self.token_expiration = 86400  # 24 hours in seconds
         
-        # In-memory store for used tokens (in production, use database)
-        self.used_tokens = set()
+        # Used tokens are shared by all workers and kept until they would have expired
+        self.used_tokens = used_token_store
         
     def generate_token(self, email):
         """Generate a verification token for an email"""
@@ -26,8 +27,8 @@ class TokenManager:
         if max_age is None:
             max_age = self.token_expiration
             
-        # Check if token already used
-        if token in self.used_tokens:
+        # Check if token already used (no query unless the Bloom filter has seen it)
+        if self.used_tokens.probably_used(token):
             return False, "This verification link has already been used"
         
         try:
@@ -37,8 +38,9 @@ class TokenManager:
                 max_age=max_age
             )
             
-            # Mark token as used
-            self.used_tokens.add(token)
+            # Mark token as used; another worker may have used it since the check above
+            if not self.used_tokens.consume(token, ttl=max_age):
+                return False, "This verification link has already been used"
             
             return True, email
             
@@ -51,7 +53,7 @@ class TokenManager:
     
     def invalidate_token(self, token):
         """Mark a token as used/invalid"""
-        self.used_tokens.add(token)
+        self.used_tokens.consume(token, ttl=self.token_expiration)
 
 # Create singleton instance
 token_manager = TokenManager()
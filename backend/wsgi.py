@@ -0,0 +1,16 @@
+"""
+WSGI entry point for production serving
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+from app import app, init_app, init_db
+
+# With PRELOAD_MODELS enabled (default) gunicorn imports this module once in the
+# master process, so models are loaded before workers are forked and shared copy-on-write.
+# Otherwise gunicorn.conf.py loads them in each worker after fork.
+if os.getenv('PRELOAD_MODELS', 'true').lower() == 'true':
+    init_app()
+else:
+    init_db()
+
+application = app
@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useState, useEffect, useCallback, useRef } from "react";
-import { getNewAlertsCount, getAlertsByLocation, getNotificationPreference, CommunityAlert } from "@/lib/api";
+import { getNewAlertsCount, getAlertsByLocation, getNotificationPreference, getAlertStreamUrl, ALERT_STREAM_BASE_URL, CommunityAlert } from "@/lib/api";
 import { useToast } from "@/hooks/use-toast";
 import { useTranslation } from "react-i18next";
 import { Bell } from "lucide-react";
@@ -19,6 +19,9 @@ export const NotificationProvider: React.FC<{ children: React.ReactNode }> = ({
     const [newAlertsCount, setNewAlertsCount] = useState(0);
     const [lastSeenId, setLastSeenId] = useState(0);
     const pollIntervalRef = useRef<NodeJS.Timeout | null>(null);
+    // Alerts are pushed over Server-Sent Events when an async stream server is configured; otherwise
+    // (or if the stream is unavailable) new alerts are polled
+    const [streamFailed, setStreamFailed] = useState(!ALERT_STREAM_BASE_URL || typeof EventSource === "undefined");
 
     // Get user data from localStorage
     const userString = localStorage.getItem("user");
@@ -47,46 +50,66 @@ export const NotificationProvider: React.FC<{ children: React.ReactNode }> = ({
         }
     }, [userEmail]);
 
+    const notifyNewAlerts = useCallback((count: number) => {
+        setNewAlertsCount(prev => prev + count);
+
+        // Show a toast notification
+        toast({
+            title: t("dashboard.communityAlerts.newAlertsTitle") || "New Disease Alert!",
+            description: t("dashboard.communityAlerts.newAlertsMessage", { count }) ||
+                `There are ${count} new reports in your area.`,
+            action: (
+                <div className="flex items-center gap-2">
+                    <Bell className="w-4 h-4 text-emerald-600" />
+                </div>
+            ),
+        });
+    }, [toast, t]);
+
     const pollForAlerts = useCallback(async () => {
         if (!userEmail || lastSeenId === 0) return;
 
         try {
             const response = await getNewAlertsCount(userEmail, lastSeenId);
             if (response.success && response.count > 0) {
-                setNewAlertsCount(prev => prev + response.count);
-
-                // Show a toast notification
-                toast({
-                    title: t("dashboard.communityAlerts.newAlertsTitle") || "New Disease Alert!",
-                    description: t("dashboard.communityAlerts.newAlertsMessage", { count: response.count }) ||
-                        `There are ${response.count} new reports in your area.`,
-                    action: (
-                        <div className="flex items-center gap-2">
-                            <Bell className="w-4 h-4 text-emerald-600" />
-                        </div>
-                    ),
-                });
+                notifyNewAlerts(response.count);
             }
         } catch (error) {
             console.error("Polling error:", error);
         }
-    }, [userEmail, lastSeenId, toast, t]);
+    }, [userEmail, lastSeenId, notifyNewAlerts]);
 
     useEffect(() => {
         fetchInitialState();
     }, [fetchInitialState]);
 
+    useEffect(() => {
+        if (!userEmail || lastSeenId === 0 || streamFailed) return;
+
+        // EventSource reconnects on its own and resumes from the last received alert id
+        const stream = new EventSource(getAlertStreamUrl(userEmail, lastSeenId));
+        stream.addEventListener("alert", () => notifyNewAlerts(1));
+        stream.onerror = () => {
+            if (stream.readyState === EventSource.CLOSED) {
+                console.warn("Alert stream unavailable, falling back to polling");
+                setStreamFailed(true);
+            }
+        };
+
+        return () => stream.close();
+    }, [userEmail, lastSeenId, streamFailed, notifyNewAlerts]);
+
     useEffect(() => {
         if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
 
-        if (userEmail && lastSeenId > 0) {
+        if (userEmail && lastSeenId > 0 && streamFailed) {
             pollIntervalRef.current = setInterval(pollForAlerts, 30000); // 30 seconds
         }
 
         return () => {
             if (pollIntervalRef.current) clearInterval(pollIntervalRef.current);
         };
-    }, [userEmail, lastSeenId, pollForAlerts]);
+    }, [userEmail, lastSeenId, streamFailed, pollForAlerts]);
 
     const resetNewAlertsCount = () => {
         setNewAlertsCount(0);
@@ -3,6 +3,35 @@
  */
 
 export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000';
+// Async backend (uvicorn async_app:asgi_app) serving the long-lived alert stream; unset = poll instead,
+// since on the gunicorn API every open stream would hold a request thread
+export const ALERT_STREAM_BASE_URL: string = import.meta.env.VITE_ALERT_STREAM_URL || '';
+
+const SESSION_TOKEN_KEY = 'sessionToken';
+
+/**
+ * Session token issued at login (sent as a Bearer token so the backend can skip user lookups)
+ */
+export const getSessionToken = (): string | null => localStorage.getItem(SESSION_TOKEN_KEY);
+
+export const setSessionToken = (token: string | null) => {
+  if (token) {
+    localStorage.setItem(SESSION_TOKEN_KEY, token);
+  } else {
+    localStorage.removeItem(SESSION_TOKEN_KEY);
+  }
+};
+
+/**
+ * fetch() with the session token attached
+ */
+const apiFetch = (url: string, init: RequestInit = {}): Promise<Response> => {
+  const token = getSessionToken();
+  if (!token) return fetch(url, init);
+  const headers = new Headers(init.headers);
+  headers.set('Authorization', `Bearer ${token}`);
+  return fetch(url, { ...init, headers });
+};
 
 export interface PredictionResponse {
   success: boolean;
@@ -27,7 +56,7 @@ export interface HealthResponse {
  * Check if the backend API is healthy and model is loaded
  */
 export const checkHealth = async (): Promise<HealthResponse> => {
-  const response = await fetch(`${API_BASE_URL}/health`);
+  const response = await apiFetch(`${API_BASE_URL}/health`);
   if (!response.ok) {
     throw new Error('Health check failed');
   }
@@ -41,7 +70,7 @@ export const predictDisease = async (imageFile: File): Promise<PredictionRespons
   const formData = new FormData();
   formData.append('image', imageFile);
 
-  const response = await fetch(`${API_BASE_URL}/predict`, {
+  const response = await apiFetch(`${API_BASE_URL}/predict`, {
     method: 'POST',
     body: formData,
   });
@@ -76,7 +105,7 @@ export interface ApiResponse<T = any> {
  */
 export const getProfile = async (email: string): Promise<ApiResponse<ProfileData>> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/profile/get?email=${encodeURIComponent(email)}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/get?email=${encodeURIComponent(email)}`);
     const data = await response.json();
     return data;
   } catch (error) {
@@ -92,7 +121,7 @@ export const getProfile = async (email: string): Promise<ApiResponse<ProfileData
  */
 export const updateProfile = async (email: string, profileData: Partial<ProfileData>): Promise<ApiResponse<ProfileData>> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/profile/update`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/update`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -119,7 +148,7 @@ export const uploadProfilePicture = async (email: string, file: File): Promise<A
     formData.append('email', email);
     formData.append('file', file);
 
-    const response = await fetch(`${API_BASE_URL}/api/profile/upload-picture`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/upload-picture`, {
       method: 'POST',
       body: formData,
     });
@@ -148,7 +177,7 @@ export const getProfilePictureUrl = (profilePictureUrl?: string | null): string
  */
 export const getUserStats = async (email: string): Promise<{ success: boolean; stats: { total: number; healthy: number; diseased: number }; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/profile/stats?email=${encodeURIComponent(email)}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/stats?email=${encodeURIComponent(email)}`);
     const data = await response.json();
     return data;
   } catch (error) {
@@ -196,7 +225,7 @@ export const saveScanToHistory = async (
     formData.append('severity', prediction.severity);
     formData.append('image', imageFile);
 
-    const response = await fetch(`${API_BASE_URL}/api/history/save`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/history/save`, {
       method: 'POST',
       body: formData,
     });
@@ -215,7 +244,7 @@ export const saveScanToHistory = async (
  */
 export const getHistory = async (email: string, limit: number = 50): Promise<HistoryResponse> => {
   try {
-    const response = await fetch(
+    const response = await apiFetch(
       `${API_BASE_URL}/api/history/get?email=${encodeURIComponent(email)}&limit=${limit}`
     );
     return response.json();
@@ -234,7 +263,7 @@ export const getHistory = async (email: string, limit: number = 50): Promise<His
  */
 export const deleteHistoryItem = async (scanId: number, email: string): Promise<ApiResponse> => {
   try {
-    const response = await fetch(
+    const response = await apiFetch(
       `${API_BASE_URL}/api/history/delete/${scanId}?email=${encodeURIComponent(email)}`,
       { method: 'DELETE' }
     );
@@ -275,7 +304,7 @@ export interface CommunityAlert {
  */
 export const getRecentAlerts = async (limit: number = 10): Promise<{ success: boolean; alerts: CommunityAlert[]; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/recent?limit=${limit}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/recent?limit=${limit}`);
     return response.json();
   } catch (error) {
     return { success: false, alerts: [], error: 'Failed to fetch alerts' };
@@ -287,7 +316,7 @@ export const getRecentAlerts = async (limit: number = 10): Promise<{ success: bo
  */
 export const getAlertsByLocation = async (email: string, limit: number = 20): Promise<{ success: boolean; alerts: CommunityAlert[]; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/by-location?email=${encodeURIComponent(email)}&limit=${limit}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/by-location?email=${encodeURIComponent(email)}&limit=${limit}`);
     return response.json();
   } catch (error) {
     return { success: false, alerts: [], error: 'Failed to fetch alerts by location' };
@@ -299,7 +328,7 @@ export const getAlertsByLocation = async (email: string, limit: number = 20): Pr
  */
 export const submitCommunityAlert = async (formData: FormData): Promise<ApiResponse> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/submit`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/submit`, {
       method: 'POST',
       body: formData,
     });
@@ -314,7 +343,7 @@ export const submitCommunityAlert = async (formData: FormData): Promise<ApiRespo
  */
 export const updateCommunityAlert = async (alertId: number, formData: FormData): Promise<ApiResponse> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/update/${alertId}`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/update/${alertId}`, {
       method: 'POST',
       body: formData,
     });
@@ -329,7 +358,7 @@ export const updateCommunityAlert = async (alertId: number, formData: FormData):
  */
 export const deleteCommunityAlert = async (alertId: number, email: string): Promise<ApiResponse> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/delete/${alertId}?email=${encodeURIComponent(email)}`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/delete/${alertId}?email=${encodeURIComponent(email)}`, {
       method: 'DELETE',
     });
     return response.json();
@@ -343,19 +372,29 @@ export const deleteCommunityAlert = async (alertId: number, email: string): Prom
  */
 export const getNewAlertsCount = async (email: string, lastSeenId: number): Promise<{ success: boolean; count: number; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/alerts/new-count?email=${encodeURIComponent(email)}&lastSeenId=${lastSeenId}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/alerts/new-count?email=${encodeURIComponent(email)}&lastSeenId=${lastSeenId}`);
     return response.json();
   } catch (error) {
     return { success: false, count: 0, error: 'Failed to fetch new alerts count' };
   }
 };
 
+/**
+ * URL of the Server-Sent Events stream of new alerts in the user's district
+ */
+export const getAlertStreamUrl = (email: string, lastSeenId: number): string => {
+  // EventSource cannot send headers, so the session token goes in the query string
+  const token = getSessionToken();
+  const auth = token ? `&access_token=${encodeURIComponent(token)}` : '';
+  return `${ALERT_STREAM_BASE_URL}/api/alerts/stream?email=${encodeURIComponent(email)}&lastEventId=${lastSeenId}${auth}`;
+};
+
 /**
  * Get notification preference
  */
 export const getNotificationPreference = async (email: string): Promise<{ success: boolean; enabled: boolean; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/profile/notification-preference?email=${encodeURIComponent(email)}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/notification-preference?email=${encodeURIComponent(email)}`);
     return response.json();
   } catch (error) {
     return { success: false, enabled: true, error: 'Failed to fetch notification preference' };
@@ -367,7 +406,7 @@ export const getNotificationPreference = async (email: string): Promise<{ succes
  */
 export const updateNotificationPreference = async (email: string, enabled: boolean): Promise<ApiResponse> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/profile/update-notification-preference`, {
+    const response = await apiFetch(`${API_BASE_URL}/api/profile/update-notification-preference`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ email, enabled }),
@@ -404,7 +443,7 @@ export interface AnalyticsReport {
  */
 export const getAnalyticsSummary = async (email: string): Promise<{ success: boolean; summary: AnalyticsSummary; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/analytics/summary?email=${encodeURIComponent(email)}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/analytics/summary?email=${encodeURIComponent(email)}`);
     return response.json();
   } catch (error) {
     return { success: false, summary: { totalScans: 0, averageHealth: 0, diseaseAlerts: 0, estimatedYield: 0 }, error: 'Failed to fetch analytics summary' };
@@ -416,19 +455,42 @@ export const getAnalyticsSummary = async (email: string): Promise<{ success: boo
  */
 export const getAnalyticsCharts = async (email: string): Promise<{ success: boolean; charts: AnalyticsCharts; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/analytics/charts?email=${encodeURIComponent(email)}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/analytics/charts?email=${encodeURIComponent(email)}`);
     return response.json();
   } catch (error) {
     return { success: false, charts: { yieldForecast: [], diseaseTrends: [] }, error: 'Failed to fetch analytics charts' };
   }
 };
 
+export type DashboardField = 'summary' | 'charts' | 'reports' | 'stats' | 'accuracy';
+
+export interface DashboardData {
+  summary?: AnalyticsSummary;
+  charts?: AnalyticsCharts;
+  reports?: AnalyticsReport[];
+  stats?: { total: number; healthy: number; diseased: number };
+  accuracy?: number;
+}
+
+/**
+ * Get several dashboard/analytics parts in one request
+ * (the browser revalidates with the ETag, so unchanged dashboards come back as 304)
+ */
+export const getDashboard = async (email: string, fields: DashboardField[], limit: number = 10): Promise<{ success: boolean; error?: string } & DashboardData> => {
+  try {
+    const response = await apiFetch(`${API_BASE_URL}/api/dashboard?email=${encodeURIComponent(email)}&fields=${fields.join(',')}&limit=${limit}`);
+    return response.json();
+  } catch (error) {
+    return { success: false, error: 'Failed to fetch dashboard' };
+  }
+};
+
 /**
  * Get analytics reports
  */
 export const getAnalyticsReports = async (email: string, limit: number = 10): Promise<{ success: boolean; reports: AnalyticsReport[]; error?: string }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/analytics/reports?email=${encodeURIComponent(email)}&limit=${limit}`);
+    const response = await apiFetch(`${API_BASE_URL}/api/analytics/reports?email=${encodeURIComponent(email)}&limit=${limit}`);
     return response.json();
   } catch (error) {
     return { success: false, reports: [], error: 'Failed to fetch analytics reports' };
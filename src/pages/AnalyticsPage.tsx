@@ -15,9 +15,7 @@ import {
 } from "@/components/ui/table";
 import { Badge } from "@/components/ui/badge";
 import {
-    getAnalyticsSummary,
-    getAnalyticsCharts,
-    getAnalyticsReports,
+    getDashboard,
     AnalyticsSummary,
     AnalyticsCharts,
     AnalyticsReport
@@ -41,15 +39,13 @@ export const AnalyticsPage = () => {
     const fetchData = async (email: string) => {
         setLoading(true);
         try {
-            const [summaryRes, chartsRes, reportsRes] = await Promise.all([
-                getAnalyticsSummary(email),
-                getAnalyticsCharts(email),
-                getAnalyticsReports(email)
-            ]);
+            const dashboard = await getDashboard(email, ['summary', 'charts', 'reports']);
 
-            if (summaryRes.success) setSummary(summaryRes.summary);
-            if (chartsRes.success) setCharts(chartsRes.charts);
-            if (reportsRes.success) setReports(reportsRes.reports);
+            if (dashboard.success) {
+                if (dashboard.summary) setSummary(dashboard.summary);
+                if (dashboard.charts) setCharts(dashboard.charts);
+                if (dashboard.reports) setReports(dashboard.reports);
+            }
         } catch (error) {
             console.error("Error fetching analytics data:", error);
         } finally {
@@ -5,7 +5,7 @@ import { RecentScans } from "@/components/dashboard/RecentScans";
 import { Leaf, TrendingUp, Shield, Users, Sparkles } from "lucide-react";
 import { Card, CardContent } from "@/components/ui/card";
 import { useTranslation } from "react-i18next";
-import { API_BASE_URL } from "@/lib/api";
+import { API_BASE_URL, getDashboard } from "@/lib/api";
 
 export const DashboardPage = () => {
   const { t } = useTranslation();
@@ -29,23 +29,18 @@ export const DashboardPage = () => {
 
   const fetchRealTimeData = async (email: string) => {
     try {
-      // Fetch scan stats
-      const statsRes = await fetch(`${API_BASE_URL}/api/profile/stats?email=${email}`);
-      const statsJson = await statsRes.json();
-
-      // Fetch accuracy
-      const accuracyRes = await fetch(`${API_BASE_URL}/api/profile/accuracy?email=${email}`);
-      const accuracyJson = await accuracyRes.json();
+      // Fetch scan stats and accuracy in one request
+      const dashboard = await getDashboard(email, ['stats', 'accuracy']);
 
       // Fetch total users (community farmers)
       const usersRes = await fetch(`${API_BASE_URL}/api/stats/total-users`);
       const usersJson = await usersRes.json();
 
-      if (statsJson.success && accuracyJson.success && usersJson.success) {
+      if (dashboard.success && dashboard.stats && usersJson.success) {
         setStatsData({
-          totalScans: statsJson.stats.total,
-          diseasesDetected: statsJson.stats.diseased,
-          accuracyRate: accuracyJson.accuracy,
+          totalScans: dashboard.stats.total,
+          diseasesDetected: dashboard.stats.diseased,
+          accuracyRate: dashboard.accuracy ?? 0,
           communityFarmers: usersJson.total_users
         });
       }
@@ -30,7 +30,7 @@ import {
 } from "@/components/ui/select";
 import { useToast } from "@/hooks/use-toast";
 import { useNavigate } from "react-router-dom";
-import { getProfile, updateProfile, uploadProfilePicture, getProfilePictureUrl, getNotificationPreference, updateNotificationPreference, getUserStats } from "@/lib/api";
+import { getProfile, updateProfile, uploadProfilePicture, getProfilePictureUrl, getNotificationPreference, updateNotificationPreference, getUserStats, setSessionToken } from "@/lib/api";
 import { useTheme } from "@/contexts/ThemeContext";
 import { useTranslation } from "react-i18next";
 import { LocationSelector } from "@/components/profile/LocationSelector";
@@ -269,6 +269,7 @@ export const ProfilePage = () => {
 
   const handleLogout = () => {
     localStorage.removeItem('user');
+    setSessionToken(null);
     toast({
       title: "Logged out",
       description: "See you again soon!",
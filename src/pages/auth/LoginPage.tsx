@@ -7,7 +7,7 @@ import { Label } from "@/components/ui/label";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card";
 import { useToast } from "@/hooks/use-toast";
 import AuthNavbar from "@/components/landing/AuthNavbar";
-import { API_BASE_URL } from "@/lib/api";
+import { API_BASE_URL, setSessionToken } from "@/lib/api";
 
 export const LoginPage = () => {
   const [email, setEmail] = useState("");
@@ -36,8 +36,9 @@ export const LoginPage = () => {
           description: `Successfully logged in as ${data.user.fullName}`,
         });
 
-        // Store user data in localStorage
+        // Store user data and session token in localStorage
         localStorage.setItem('user', JSON.stringify(data.user));
+        setSessionToken(data.token);
 
         navigate("/dashboard");
       } else {